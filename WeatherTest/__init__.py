@@ -1,63 +1,67 @@
 import azure.functions as func
 import logging
-import json
+import time
 from datetime import datetime
+from serialization import dumps
+from profiling import profiled, mark_stage
 
+def _wants_pretty(req):
+    """Pretty-print responses only when asked, e.g. ?pretty=1"""
+    return req.params.get('pretty', '').lower() in ('1', 'true', 'yes')
+
+@profiled('WeatherTest')
 def main(req: func.HttpRequest) -> func.HttpResponse:
     """
     HTTP endpoint to manually trigger weather check (for testing)
     """
     logging.info('Weather test endpoint called')
-    
+
     try:
         # Import here to avoid startup issues
-        from weather_api import WeatherAPI
-        from alert_system import AlertSystem
-        from notification_system import NotificationSystem
-        from azure_storage import AzureWeatherStorage
-        
-        # Run the same logic as the timer trigger
-        weather_api = WeatherAPI()
-        alert_system = AlertSystem()
-        notification_system = NotificationSystem()
-        storage = AzureWeatherStorage()
-        
-        weather_data = weather_api.get_all_cities_weather()
-        
-        if not weather_data:
+        from weather_api import split_stale
+        from azure_runtime import get_app
+
+        # Run the same pipeline as the timer trigger
+        app = get_app()
+
+        started = time.perf_counter()
+        fetched = app.weather_api.get_all_cities_weather()
+        mark_stage('fetch')
+        fresh, stale = split_stale(fetched)
+
+        if not fresh:
             return func.HttpResponse(
-                json.dumps({"status": "error", "message": "No weather data retrieved"}),
+                dumps({"status": "error", "message": "No weather data retrieved"}),
                 status_code=500,
                 mimetype="application/json"
             )
-        
-        storage.store_weather_data(weather_data)
-        alerts = alert_system.check_alerts(weather_data)
-        
-        if alerts:
-            notification_system.send_alerts(alerts)
-            for alert in alerts:
-                storage.store_alert(alert)
-        
+
+        weather_data, alerts, stored = app.process_weather(fetched, started)
+
         response_data = {
             "status": "success",
             "timestamp": datetime.utcnow().isoformat(),
-            "weather_data_count": len(weather_data),
+            "weather_data_count": len(fresh),
+            "new_observations": len(weather_data),
+            "observations_stored": len(stored),
             "alerts_triggered": len(alerts),
             "cities_checked": [data['city'] for data in weather_data],
+            "cities_stale": [data['city'] for data in stale],
+            "upstream": app.weather_api.metrics(),
+            "notifications": app.notification_system.scheduler.metrics(),
             "alerts": [{"city": alert['city'], "type": alert['type'], "severity": alert['severity']} for alert in alerts]
         }
-        
+
         return func.HttpResponse(
-            json.dumps(response_data, indent=2),
+            dumps(response_data, pretty=_wants_pretty(req)),
             status_code=200,
             mimetype="application/json"
         )
-        
+
     except Exception as e:
-        logging.error(f"Error in weather test endpoint: {e}")
+        logging.error("Error in weather test endpoint: %s", e)
         return func.HttpResponse(
-            json.dumps({"status": "error", "message": str(e)}),
+            dumps({"status": "error", "message": str(e)}),
             status_code=500,
             mimetype="application/json"
         )
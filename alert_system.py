@@ -1,98 +1,260 @@
 import logging
-from datetime import datetime
-from config import ALERT_TRIGGERS
+from config import ALERT_TRIGGERS, REGIONAL_ALERT_RADIUS_MILES
+from station_index import get_station_index
+from trend_store import TrendStore
+from alert_templates import MessageTemplates
+from station_time import StationClock
+from derived_metrics import ensure_derived_metrics
 
 class AlertSystem:
-    def __init__(self):
+    def __init__(self, station_index=None):
         self.triggers = ALERT_TRIGGERS
+        self.regional_radius = REGIONAL_ALERT_RADIUS_MILES
+        self._station_index = station_index
+        self.conditions = {alert_type: trigger['conditions'] for alert_type, trigger in self.triggers.items()}
+        self._station_conditions = {}  # station name -> (its overrides, merged conditions)
+        self.trend_store = TrendStore(self._trend_specs())
+        self.messages = MessageTemplates(self.triggers)
+        self.clock = StationClock()
+
+    @property
+    def station_index(self):
+        """The injected index, else the shared one (which follows registry reloads)"""
+        return self._station_index if self._station_index is not None else get_station_index()
+
+    def conditions_for(self, station):
+        """Trigger conditions by alert type, with the station's threshold overrides applied"""
+        overrides = station.get('thresholds') if station is not None else None
+        if not overrides:
+            return self.conditions
+        cached = self._station_conditions.get(station['name'])
+        if cached is not None and cached[0] is overrides:
+            return cached[1]
+        merged = dict(self.conditions)
+        for alert_type, values in overrides.items():
+            merged[alert_type] = {**merged[alert_type], **values}
+        self._station_conditions[station['name']] = (overrides, merged)
+        return merged
+    
+    def _trend_specs(self):
+        """(field, window seconds) pairs the rate-of-change triggers need"""
+        specs = []
+        heat_rise = self.triggers.get('rapid_heat_rise')
+        if heat_rise:
+            specs.append(('temperature', heat_rise['conditions']['window_minutes'] * 60))
+        collapse = self.triggers.get('visibility_collapse')
+        if collapse:
+            specs.append(('visibility', collapse['conditions']['window_minutes'] * 60))
+        return specs
+    
+    def preload_trends(self, storage):
+        """Warm the trend windows from stored history"""
+        return self.trend_store.preload(storage)
+        
+    def check_alerts(self, weather_data, now=None):
+        """Check weather data against all alert triggers
         
-    def check_alerts(self, weather_data):
-        """Check weather data against all alert triggers"""
+        Time-of-day windows are checked in each station's local time at the
+        observation's time. `now` overrides that time, e.g. when replaying
+        history; a naive `now` is read as station-local wall-clock time.
+        """
         alerts = []
-        current_hour = datetime.now().hour
+        ensure_derived_metrics(weather_data)
+        self.trend_store.update(weather_data)
         
         for data in weather_data:
-            city_alerts = self._check_city_alerts(data, current_hour)
+            station = self.station_index.get(data['city'])
+            observed = self.clock.observed_at(station, data, now)
+            day = self.clock.windows(station, observed, data['city'])
+            city_alerts = self._check_city_alerts(data, observed, day, self.conditions_for(station))
             alerts.extend(city_alerts)
+        
+        alerts.extend(self._propagate_regional_alerts(alerts))
             
         return alerts
     
-    def _check_city_alerts(self, weather_data, current_hour):
+    def _propagate_regional_alerts(self, alerts):
+        """Notify monitored stations near a station where a regional alert fired"""
+        fired = {(alert['city'], alert['type']) for alert in alerts}
+        nearest_source = {}
+        
+        for alert in alerts:
+            radius = self.regional_radius.get(alert['type'])
+            source = self.station_index.get(alert['city'])
+            if not radius or not source:
+                continue
+            
+            for distance, station in self.station_index.within_radius(source['lat'], source['lon'], radius):
+                key = (station['name'], alert['type'])
+                if key in fired:
+                    continue
+                if key not in nearest_source or distance < nearest_source[key][0]:
+                    nearest_source[key] = (distance, alert)
+        
+        regional_alerts = []
+        for (city, alert_type), (distance, alert) in nearest_source.items():
+            regional_alerts.append({
+                'type': f"{alert_type}_nearby",
+                'city': city,
+                'message': self.messages.render_regional(alert_type, city, alert['city'], distance),
+                'severity': 'MEDIUM',
+                'source_city': alert['city'],
+                'distance_miles': distance,
+                'weather_data': alert['weather_data']
+            })
+        
+        return regional_alerts
+    
+    def _check_city_alerts(self, weather_data, observed, day, conditions):
         """Check alert conditions for a specific city"""
         alerts = []
         
         # Check extreme heat evening alert
-        if self._check_extreme_heat_evening(weather_data, current_hour):
+        if self._check_extreme_heat_evening(weather_data, observed, day, conditions):
             alerts.append({
                 'type': 'extreme_heat_evening',
                 'city': weather_data['city'],
-                'message': f"EXTREME HEAT ALERT: {weather_data['city']} - {weather_data['temperature']:.1f}°F with {weather_data['wind_speed']:.1f} mph winds after 5 PM",
+                'message': self.messages.render('extreme_heat_evening', weather_data,
+                                                conditions['extreme_heat_evening']),
                 'severity': 'HIGH',
                 'weather_data': weather_data
             })
         
         # Check dust storm warning
-        if self._check_dust_storm(weather_data):
+        if self._check_dust_storm(weather_data, conditions):
             alerts.append({
                 'type': 'dust_storm_warning',
                 'city': weather_data['city'],
-                'message': f"DUST STORM WARNING: {weather_data['city']} - High winds ({weather_data['wind_speed']:.1f} mph) with reduced visibility ({weather_data['visibility']:.1f} miles)",
+                'message': self.messages.render('dust_storm_warning', weather_data,
+                                                conditions['dust_storm_warning']),
                 'severity': 'HIGH',
                 'weather_data': weather_data
             })
         
         # Check extreme daytime heat
-        if self._check_extreme_heat_day(weather_data, current_hour):
+        if self._check_extreme_heat_day(weather_data, observed, day, conditions):
             alerts.append({
                 'type': 'extreme_heat_day',
                 'city': weather_data['city'],
-                'message': f"EXTREME HEAT WARNING: {weather_data['city']} - Dangerous temperature of {weather_data['temperature']:.1f}°F",
+                'message': self.messages.render('extreme_heat_day', weather_data, conditions['extreme_heat_day']),
                 'severity': 'CRITICAL',
                 'weather_data': weather_data
             })
         
         # Check monsoon alert
-        if self._check_monsoon(weather_data):
+        if self._check_monsoon(weather_data, conditions):
             alerts.append({
                 'type': 'monsoon_alert',
                 'city': weather_data['city'],
-                'message': f"MONSOON ALERT: {weather_data['city']} - Heavy rain ({weather_data['rain_1h']:.2f} in/hr) with strong winds ({weather_data['wind_speed']:.1f} mph)",
+                'message': self.messages.render('monsoon_alert', weather_data, conditions['monsoon_alert']),
                 'severity': 'MEDIUM',
                 'weather_data': weather_data
             })
+        
+        # Check rapid temperature rise
+        rise = self._check_rapid_heat_rise(weather_data, conditions)
+        if rise is not None:
+            alerts.append({
+                'type': 'rapid_heat_rise',
+                'city': weather_data['city'],
+                'message': self.messages.render('rapid_heat_rise', weather_data,
+                                                conditions['rapid_heat_rise'], rise=rise),
+                'severity': 'HIGH',
+                'weather_data': weather_data
+            })
+        
+        # Check visibility collapse
+        drop = self._check_visibility_collapse(weather_data, conditions)
+        if drop is not None:
+            alerts.append({
+                'type': 'visibility_collapse',
+                'city': weather_data['city'],
+                'message': self.messages.render('visibility_collapse', weather_data,
+                                                conditions['visibility_collapse'], drop=drop),
+                'severity': 'HIGH',
+                'weather_data': weather_data
+            })
+        
+        # Check heat stress (derived heat index and WBGT)
+        if self._check_heat_stress(weather_data, conditions):
+            alerts.append({
+                'type': 'heat_stress',
+                'city': weather_data['city'],
+                'message': self.messages.render('heat_stress', weather_data, conditions['heat_stress']),
+                'severity': 'HIGH',
+                'weather_data': weather_data
+            })
             
         return alerts
     
-    def _check_extreme_heat_evening(self, data, current_hour):
-        """Check for extreme heat after 5 PM with wind"""
-        trigger = self.triggers['extreme_heat_evening']['conditions']
+    def _check_extreme_heat_evening(self, data, observed, day, conditions):
+        """Check for extreme heat after 5 PM (station-local) with wind"""
+        trigger = conditions['extreme_heat_evening']
         return (
             data['temperature'] > trigger['temp_threshold'] and
-            current_hour >= trigger['time_after'] and
+            day.after(observed, trigger['time_after']) and
             data['wind_speed'] >= trigger['wind_speed_min']
         )
     
-    def _check_dust_storm(self, data):
+    def _check_dust_storm(self, data, conditions):
         """Check for dust storm conditions"""
-        trigger = self.triggers['dust_storm_warning']['conditions']
+        trigger = conditions['dust_storm_warning']
         return (
             data['wind_speed'] >= trigger['wind_speed_min'] and
             data['visibility'] <= trigger['visibility_max']
         )
     
-    def _check_extreme_heat_day(self, data, current_hour):
-        """Check for extreme daytime heat"""
-        trigger = self.triggers['extreme_heat_day']['conditions']
+    def _check_extreme_heat_day(self, data, observed, day, conditions):
+        """Check for extreme daytime heat (station-local hours)"""
+        trigger = conditions['extreme_heat_day']
         time_range = trigger['time_between']
         return (
             data['temperature'] > trigger['temp_threshold'] and
-            time_range[0] <= current_hour <= time_range[1]
+            day.between(observed, time_range[0], time_range[1])
         )
     
-    def _check_monsoon(self, data):
+    def _check_monsoon(self, data, conditions):
         """Check for monsoon conditions"""
-        trigger = self.triggers['monsoon_alert']['conditions']
+        trigger = conditions['monsoon_alert']
         return (
             data['rain_1h'] >= trigger['rain_threshold'] and
             data['wind_speed'] >= trigger['wind_speed_min']
         )
+    
+    def _check_rapid_heat_rise(self, data, conditions):
+        """Return the temperature rise if it exceeds the trigger, else None"""
+        if 'rapid_heat_rise' not in conditions:
+            return None
+        trigger = conditions['rapid_heat_rise']
+        window = self.trend_store.window(data['city'], 'temperature', trigger['window_minutes'] * 60)
+        if not window or len(window) < 2:
+            return None
+        rise = window.rise
+        if rise >= trigger['temp_rise_min'] and (window.slope or 0) > 0:
+            return rise
+        return None
+    
+    def _check_visibility_collapse(self, data, conditions):
+        """Return the visibility drop if it exceeds the trigger, else None"""
+        if 'visibility_collapse' not in conditions:
+            return None
+        trigger = conditions['visibility_collapse']
+        window = self.trend_store.window(data['city'], 'visibility', trigger['window_minutes'] * 60)
+        if not window or len(window) < 2:
+            return None
+        drop = window.drop
+        if (drop >= trigger['visibility_drop_min'] and
+                data['visibility'] <= trigger['visibility_max'] and
+                (window.slope or 0) < 0):
+            return drop
+        return None
+    
+    def _check_heat_stress(self, data, conditions):
+        """Check the derived heat index and WBGT against their danger thresholds"""
+        if 'heat_stress' not in conditions:
+            return False
+        trigger = conditions['heat_stress']
+        return (
+            data['heat_index'] >= trigger['heat_index_min'] or
+            data['wbgt'] >= trigger['wbgt_min']
+        )
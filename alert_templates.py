@@ -0,0 +1,294 @@
+"""
+Precompiled alert message and email templates
+
+Templates are written in str.format syntax and compiled once into f-string
+functions, with configuration constants (trigger windows, severity colors)
+baked in, so rendering only formats the per-alert values. EmailRenderer
+caches renderings within a tick, so alerts sharing an observation or an
+identical alert render once.
+"""
+
+from functools import lru_cache
+from html import escape
+from string import Formatter
+
+MESSAGE_TEMPLATES = {
+    'extreme_heat_evening': "EXTREME HEAT ALERT: {city} - {temperature:.1f}°F with {wind_speed:.1f} mph winds after 5 PM",
+    'dust_storm_warning': "DUST STORM WARNING: {city} - High winds ({wind_speed:.1f} mph) with reduced visibility ({visibility:.1f} miles)",
+    'extreme_heat_day': "EXTREME HEAT WARNING: {city} - Dangerous temperature of {temperature:.1f}°F",
+    'monsoon_alert': "MONSOON ALERT: {city} - Heavy rain ({rain_1h:.2f} in/hr) with strong winds ({wind_speed:.1f} mph)",
+    'rapid_heat_rise': "RAPID HEAT RISE: {city} - Temperature up {rise:.1f}°F to {temperature:.1f}°F in the last {window_minutes} minutes",
+    'visibility_collapse': "VISIBILITY COLLAPSE: {city} - Visibility down {drop:.1f} miles to {visibility:.1f} miles in the last {window_minutes} minutes",
+    'heat_stress': "HEAT STRESS: {city} - Heat index {heat_index:.0f}°F, WBGT {wbgt:.0f}°F (dew point {dew_point:.0f}°F)",
+}
+REGIONAL_MESSAGE_TEMPLATE = "{description} NEARBY: {city} - reported at {source_city}, {distance:.1f} miles away"
+
+SEVERITY_COLORS = {
+    'CRITICAL': '#FF0000',
+    'HIGH': '#FF6600',
+    'MEDIUM': '#FFAA00',
+    'LOW': '#00AA00'
+}
+DEFAULT_COLOR = '#666666'
+
+SUBJECT_TEMPLATE = "Arizona Weather Alert - {severity} - {city}"
+
+CELL = 'style="padding: 5px; border-bottom: 1px solid #ddd;"'
+
+# Variable part of the email: one table per observation
+CONDITIONS_HTML_TEMPLATE = f"""
+                <h4>Current Weather Conditions - {{city}}</h4>
+                <table style="width: 100%; border-collapse: collapse;">
+                    <tr>
+                        <td {CELL}><strong>Temperature:</strong></td>
+                        <td {CELL}>{{temperature:.1f}}°F (feels like {{feels_like:.1f}}°F)</td>
+                    </tr>
+                    <tr>
+                        <td {CELL}><strong>Wind:</strong></td>
+                        <td {CELL}>{{wind_speed:.1f}} mph</td>
+                    </tr>
+                    <tr>
+                        <td {CELL}><strong>Humidity:</strong></td>
+                        <td {CELL}>{{humidity}}%</td>
+                    </tr>
+                    <tr>
+                        <td {CELL}><strong>Visibility:</strong></td>
+                        <td {CELL}>{{visibility:.1f}} miles</td>
+                    </tr>
+                    <tr>
+                        <td {CELL}><strong>Conditions:</strong></td>
+                        <td {CELL}>{{conditions}}</td>
+                    </tr>
+                    <tr>
+                        <td {CELL}><strong>Rain (1hr):</strong></td>
+                        <td {CELL}>{{rain_1h:.2f}} inches</td>
+                    </tr>
+                    <tr>
+                        <td style="padding: 5px;"><strong>Time:</strong></td>
+                        <td style="padding: 5px;">{{time}}</td>
+                    </tr>
+                </table>"""
+
+EMAIL_HTML_TEMPLATE = """
+        <html>
+        <body style="font-family: Arial, sans-serif; margin: 20px;">
+            <div style="border-left: 5px solid {color}; padding-left: 20px; margin-bottom: 20px;">
+                <h2 style="color: {color}; margin-top: 0;">Arizona Weather Alert - {severity}</h2>
+                <h3>{message}</h3>
+            </div>
+
+            <div style="background-color: #f5f5f5; padding: 15px; border-radius: 5px;">{conditions_html}
+            </div>
+
+            <div style="margin-top: 20px; padding: 10px; background-color: #e8f4f8; border-radius: 5px;">
+                <p><strong>Safety Recommendations:</strong></p>
+                <ul>
+                    <li>Stay hydrated and avoid prolonged outdoor exposure</li>
+                    <li>Check on elderly neighbors and pets</li>
+                    <li>Avoid outdoor activities during extreme conditions</li>
+                    <li>Keep windows and doors closed during dust storms</li>
+                </ul>
+            </div>
+        </body>
+        </html>
+        """
+
+CONDITIONS_TEXT_TEMPLATE = """Current Weather Conditions - {city}
+  Temperature: {temperature:.1f}°F (feels like {feels_like:.1f}°F)
+  Wind:        {wind_speed:.1f} mph
+  Humidity:    {humidity}%
+  Visibility:  {visibility:.1f} miles
+  Conditions:  {conditions}
+  Rain (1hr):  {rain_1h:.2f} inches
+  Time:        {time}"""
+
+EMAIL_TEXT_TEMPLATE = """Arizona Weather Alert - {severity}
+{message}
+
+{conditions_text}
+
+Safety Recommendations:
+  - Stay hydrated and avoid prolonged outdoor exposure
+  - Check on elderly neighbors and pets
+  - Avoid outdoor activities during extreme conditions
+  - Keep windows and doors closed during dust storms
+"""
+
+RENDER_CACHE_MAX = 4096  # renderings kept per tick before the cache resets
+
+
+# City names and weather descriptions come from small vocabularies
+_escape_name = lru_cache(maxsize=65536)(escape)
+
+
+@lru_cache(maxsize=1024)
+def _describe(weather_description):
+    return weather_description.title()
+
+
+def _escape_literal(text):
+    return text.replace('{', '{{').replace('}', '}}')
+
+
+class CompiledTemplate:
+    """A str.format template compiled once into an f-string function
+
+    Fields found in `constants` are rendered at compile time; the rest are
+    read from a mapping on each render(). Unlike str.format, which re-parses
+    the whole template per call, the compiled function only formats fields.
+    """
+
+    def __init__(self, template, constants=None):
+        constants = constants or {}
+        pieces = []
+        fields = []
+        for literal, name, spec, conversion in Formatter().parse(template):
+            if literal:
+                pieces.append('f' + repr(_escape_literal(literal)))
+            if name is None:
+                continue
+            if name in constants:
+                constant = format(constants[name], spec or '')
+                pieces.append('f' + repr(_escape_literal(constant)))
+            else:
+                fields.append(name)
+                pieces.append('f"{values[%r]%s%s}"' % (name, '!' + conversion if conversion else '',
+                                                        ':' + spec if spec else ''))
+        self.fields = tuple(fields)
+        namespace = {}
+        exec(f"def render(values):\n    return {' '.join(pieces) or repr('')}\n", namespace)
+        self._render = namespace['render']
+
+    def render(self, values, **extra):
+        """Fill the remaining fields from `values`, with keyword overrides"""
+        return self._render({**values, **extra} if extra else values)
+
+
+class MessageTemplates:
+    """Alert message templates per alert type, with trigger settings baked in
+
+    Stations whose threshold overrides change a baked-in setting get their
+    own compiled template, once per distinct setting.
+    """
+
+    def __init__(self, triggers):
+        self.templates = {}
+        self.conditions = {}
+        self.settings = {}  # alert type -> condition names its template quotes
+        for alert_type, template in MESSAGE_TEMPLATES.items():
+            conditions = triggers.get(alert_type, {}).get('conditions', {})
+            self.templates[alert_type] = CompiledTemplate(template, conditions)
+            self.conditions[alert_type] = conditions
+            self.settings[alert_type] = tuple(name for _, name, _, _ in Formatter().parse(template)
+                                              if name in conditions)
+        self._overridden = {}  # (alert type, setting values) -> CompiledTemplate
+        self.regional = CompiledTemplate(REGIONAL_MESSAGE_TEMPLATE)
+
+    def render(self, alert_type, weather_data, conditions=None, **extra):
+        """Message for an alert; `conditions` are the alert type's conditions as evaluated for the station"""
+        template = self.templates[alert_type]
+        if conditions is not None and conditions is not self.conditions[alert_type]:
+            template = self._template_for(alert_type, conditions)
+        return template.render(weather_data, **extra)
+
+    def _template_for(self, alert_type, conditions):
+        defaults = self.conditions[alert_type]
+        values = tuple(repr(conditions.get(name, defaults[name])) for name in self.settings[alert_type])
+        if values == tuple(repr(defaults[name]) for name in self.settings[alert_type]):
+            return self.templates[alert_type]
+        template = self._overridden.get((alert_type, values))
+        if template is None:
+            template = CompiledTemplate(MESSAGE_TEMPLATES[alert_type], {**defaults, **conditions})
+            self._overridden[(alert_type, values)] = template
+        return template
+
+    def render_regional(self, alert_type, city, source_city, distance):
+        return self.regional.render({
+            'description': alert_type.replace('_', ' ').upper(),
+            'city': city,
+            'source_city': source_city,
+            'distance': distance
+        })
+
+
+def _observation_key(weather):
+    return (weather.get('observation_id'), weather['city'], weather.get('timestamp'), weather['temperature'],
+            weather['feels_like'], weather['wind_speed'], weather['humidity'], weather['visibility'],
+            weather['weather_description'], weather['rain_1h'])
+
+
+class EmailRenderer:
+    """Renders alert emails (subject, HTML, plain text) from precompiled templates
+
+    Each severity gets its own HTML template with its color baked in. The
+    conditions block is rendered once per observation and whole emails once
+    per identical alert; call new_tick() to drop the cached renderings.
+    """
+
+    def __init__(self, cache_max=RENDER_CACHE_MAX):
+        self.cache_max = cache_max
+        self.subject = CompiledTemplate(SUBJECT_TEMPLATE)
+        self.html = {severity: CompiledTemplate(EMAIL_HTML_TEMPLATE, {'color': color, 'severity': severity})
+                     for severity, color in SEVERITY_COLORS.items()}
+        self.default_html = CompiledTemplate(EMAIL_HTML_TEMPLATE, {'color': DEFAULT_COLOR})
+        self.text = CompiledTemplate(EMAIL_TEXT_TEMPLATE)
+        self.conditions_html = CompiledTemplate(CONDITIONS_HTML_TEMPLATE)
+        self.conditions_text = CompiledTemplate(CONDITIONS_TEXT_TEMPLATE)
+        self._conditions = {}
+        self._emails = {}
+        self.hits = 0
+        self.misses = 0
+
+    def new_tick(self):
+        self._conditions.clear()
+        self._emails.clear()
+
+    def _render_conditions(self, weather, key):
+        cached = self._conditions.get(key)
+        if cached is not None:
+            return cached
+
+        values = {
+            'city': weather['city'],
+            'temperature': weather['temperature'],
+            'feels_like': weather['feels_like'],
+            'wind_speed': weather['wind_speed'],
+            'humidity': weather['humidity'],
+            'visibility': weather['visibility'],
+            'rain_1h': weather['rain_1h'],
+            'conditions': _describe(weather['weather_description']),
+            'time': str(weather['timestamp'])[:19].replace('T', ' ')
+        }
+        text = self.conditions_text.render(values)
+        values['city'] = _escape_name(values['city'])
+        values['conditions'] = _escape_name(values['conditions'])
+        rendered = (self.conditions_html.render(values), text)
+        if len(self._conditions) >= self.cache_max:
+            self._conditions.clear()
+        self._conditions[key] = rendered
+        return rendered
+
+    def render(self, alert):
+        """Return (subject, html, text) for an alert"""
+        weather = alert['weather_data']
+        observation_key = _observation_key(weather)
+        key = (alert['severity'], alert['city'], alert['message'], observation_key)
+        cached = self._emails.get(key)
+        if cached is not None:
+            self.hits += 1
+            return cached
+        self.misses += 1
+
+        conditions_html, conditions_text = self._render_conditions(weather, observation_key)
+        values = {'severity': alert['severity'], 'city': alert['city'], 'message': alert['message']}
+        html_values = {'severity': _escape_name(alert['severity']), 'message': escape(alert['message']),
+                       'conditions_html': conditions_html}
+        rendered = (
+            self.subject.render(values),
+            self.html.get(alert['severity'], self.default_html).render(html_values),
+            self.text.render(values, conditions_text=conditions_text)
+        )
+        if len(self._emails) >= self.cache_max:
+            self._emails.clear()
+        self._emails[key] = rendered
+        return rendered
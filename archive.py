@@ -0,0 +1,336 @@
+"""
+Archive old weather history to compressed, partitioned files
+
+Rows observed before a cutoff are streamed out of SQLite or Azure Tables into
+<dir>/weather_history/city=<city>/month=<YYYY-MM>/part-*.parquet (zstd Parquet
+when pyarrow is installed, gzip CSV otherwise) and then deleted from the hot
+store. ArchiveReader memory-maps those files for historical queries and
+backtests.
+
+Usage: python main.py archive --before YYYY-MM-DD [--source sqlite|azure] [--dir DIR] [--format parquet|csv] [--keep]
+"""
+
+import argparse
+import csv
+import gzip
+import heapq
+import io
+import logging
+import mmap
+import os
+import time
+from datetime import datetime
+from urllib.parse import quote, unquote
+from config import ARCHIVE_DIR, ARCHIVE_FORMAT, ARCHIVE_BUFFER_ROWS
+from database import replay_defaults
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+TABLE_NAME = 'weather_history'
+ARCHIVE_COLUMNS = ('id', 'city', 'temperature', 'feels_like', 'humidity', 'pressure', 'wind_speed',
+                   'wind_direction', 'visibility', 'weather_main', 'weather_description', 'rain_1h',
+                   'dew_point', 'heat_index', 'wbgt', 'timestamp', 'observed_at', 'created_at')
+FLOAT_COLUMNS = frozenset(('temperature', 'feels_like', 'pressure', 'wind_speed', 'wind_direction',
+                           'visibility', 'rain_1h', 'dew_point', 'heat_index', 'wbgt'))
+EXTENSIONS = {'parquet': '.parquet', 'csv': '.csv.gz'}
+
+
+def default_format():
+    return ARCHIVE_FORMAT or ('parquet' if pyarrow is not None else 'csv')
+
+
+def partition_path(root, city, month):
+    return os.path.join(root, TABLE_NAME, f"city={quote(city, safe='')}", f"month={month}")
+
+
+def _month(row):
+    return str(row['timestamp'] or row['created_at'])[:7]
+
+
+def _row_order(row):
+    return (str(row['created_at'] or ''), str(row['id']))
+
+
+def _write_parquet(f, rows):
+    table = pyarrow.table({column: [row.get(column) for row in rows] for column in ARCHIVE_COLUMNS})
+    pyarrow.parquet.write_table(table, f, compression='zstd')
+
+
+def _write_csv(f, rows):
+    with gzip.GzipFile(fileobj=f, mode='wb', mtime=0) as gz:
+        text = io.TextIOWrapper(gz, encoding='utf-8', newline='')
+        writer = csv.writer(text)
+        writer.writerow(ARCHIVE_COLUMNS)
+        writer.writerows([('' if row.get(column) is None else row.get(column)) for column in ARCHIVE_COLUMNS]
+                         for row in rows)
+        text.flush()
+        text.detach()
+
+
+def _read_parquet(path, chunk_size):
+    table = pyarrow.parquet.read_table(path, memory_map=True)
+    for batch in table.to_batches(max_chunksize=chunk_size):
+        yield from batch.to_pylist()
+
+
+def _typed(row):
+    """CSV values are strings: restore numbers and missing values"""
+    for column, value in row.items():
+        if value == '':
+            row[column] = None
+        elif column in FLOAT_COLUMNS:
+            row[column] = float(value)
+        elif column == 'humidity':
+            row[column] = int(float(value))
+        elif column in ('id', 'observed_at') and value.isdigit():
+            row[column] = int(value)
+    return row
+
+
+def _read_csv(path):
+    with open(path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    with mapped, gzip.GzipFile(fileobj=mapped) as gz:
+        reader = csv.reader(io.TextIOWrapper(gz, encoding='utf-8', newline=''))
+        header = next(reader)
+        for values in reader:
+            yield _typed(dict(zip(header, values)))
+
+
+def _canonical(row):
+    """A row as it reads back from either archive format"""
+    return tuple(_typed({column: '' if row.get(column) is None else str(row.get(column))
+                         for column in ARCHIVE_COLUMNS}).values())
+
+
+class RowDigest:
+    """Order-independent digest of rows, to check archive files read back what was written"""
+
+    def __init__(self):
+        self.rows = 0
+        self.value = 0
+
+    def add(self, row):
+        self.rows += 1
+        self.value = (self.value + hash(_canonical(row))) & 0xFFFFFFFFFFFFFFFF
+
+    def __eq__(self, other):
+        return (self.rows, self.value) == (other.rows, other.value)
+
+
+def read_archive_file(path, chunk_size=5000):
+    """Stream the rows of one part file"""
+    if path.endswith(EXTENSIONS['parquet']):
+        if pyarrow is None:
+            raise RuntimeError(f"Reading {path} needs pyarrow")
+        return _read_parquet(path, chunk_size)
+    return _read_csv(path)
+
+
+class ArchiveWriter:
+    """Buffers rows per (city, month) partition and flushes them as part files
+
+    Rows arrive roughly in time order, so a partition is flushed once the
+    stream moves past its month; everything is flushed when the buffer fills.
+    """
+
+    def __init__(self, root=ARCHIVE_DIR, fmt=None, buffer_rows=ARCHIVE_BUFFER_ROWS):
+        self.root = root
+        self.fmt = fmt or default_format()
+        if self.fmt not in EXTENSIONS:
+            raise ValueError(f"Unknown archive format: {self.fmt}")
+        if self.fmt == 'parquet' and pyarrow is None:
+            raise ValueError("Parquet archives need pyarrow; use the csv format")
+        self.buffer_rows = buffer_rows
+        self.files = []
+        self.rows = 0
+        self._buffers = {}
+        self._buffered = 0
+        self._month = None
+        self._run = datetime.utcnow().strftime('%Y%m%dT%H%M%S')
+
+    def add(self, row):
+        month = _month(row)
+        if self._month is None or month > self._month:
+            if self._month is not None:
+                self.flush(lambda key: key[1] < month)
+            self._month = month
+        self._buffers.setdefault((row['city'], month), []).append(row)
+        self._buffered += 1
+        if self._buffered >= self.buffer_rows:
+            self.flush()
+
+    def flush(self, select=None):
+        for key in [key for key in self._buffers if select is None or select(key)]:
+            rows = self._buffers.pop(key)
+            self._buffered -= len(rows)
+            self._write(key[0], key[1], rows)
+
+    def _write(self, city, month, rows):
+        directory = partition_path(self.root, city, month)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"part-{self._run}-{len(self.files):05d}{EXTENSIONS[self.fmt]}")
+        rows.sort(key=_row_order)  # readers merge files on this order
+
+        # Write, fsync, then rename, so a file exists only once it is durable
+        with open(path + '.tmp', 'wb') as f:
+            if self.fmt == 'parquet':
+                _write_parquet(f, rows)
+            else:
+                _write_csv(f, rows)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+
+        self.files.append(path)
+        self.rows += len(rows)
+
+
+class Archiver:
+    """Moves weather history older than a cutoff from the hot store into archive files
+
+    `source` is a WeatherDatabase or an AzureWeatherStorage. Rows are deleted
+    only after every file is written, and only the rows that were archived.
+    """
+
+    def __init__(self, source, root=ARCHIVE_DIR, fmt=None, buffer_rows=ARCHIVE_BUFFER_ROWS, chunk_size=5000):
+        self.source = source
+        self.root = root
+        self.fmt = fmt
+        self.buffer_rows = buffer_rows
+        self.chunk_size = chunk_size
+
+    def run(self, before, delete=True):
+        """Archive rows observed before `before` (ISO date/time) and return a report dict"""
+        started = time.perf_counter()
+        writer = ArchiveWriter(self.root, self.fmt, self.buffer_rows)
+        azure = hasattr(self.source, 'delete_weather_entities')
+        cities = set()
+        keys = []
+        max_id = None
+        written = RowDigest()
+
+        # Raw rows: missing readings stay missing in the archive
+        for row in self.source.iter_weather_history(end=before, chunk_size=self.chunk_size, coalesce=False):
+            written.add(row)
+            writer.add(row)
+            cities.add(row['city'])
+            if azure:
+                keys.append((row['city'], row['id']))
+            else:
+                max_id = row['id'] if max_id is None else max(max_id, row['id'])
+        writer.flush()
+
+        # Nothing is deleted unless the files read back exactly the rows archived
+        archived = RowDigest()
+        for path in writer.files:
+            for row in read_archive_file(path, self.chunk_size):
+                archived.add(row)
+        if archived != written:
+            raise RuntimeError(f"Archive files do not read back the rows archived ({written.rows} written, "
+                               f"{archived.rows} read); nothing was deleted")
+
+        deleted = 0
+        if delete and writer.rows:
+            if azure:
+                deleted = self.source.delete_weather_entities(keys)
+            else:
+                deleted = self.source.delete_weather_history(before, max_id, cities)
+
+        elapsed = time.perf_counter() - started
+        logging.info("Archived %s rows into %s files, deleted %s", writer.rows, len(writer.files), deleted)
+        return {
+            'rows': writer.rows,
+            'files': len(writer.files),
+            'cities': len(cities),
+            'deleted': deleted,
+            'format': writer.fmt,
+            'elapsed_seconds': elapsed,
+            'rows_per_second': writer.rows / elapsed if elapsed > 0 else 0
+        }
+
+
+class ArchiveReader:
+    """Reads archived weather history through memory-mapped files
+
+    iter_weather_history yields the same rows as WeatherDatabase's (missing
+    readings filled unless coalesce=False), so a Backtester can replay
+    archives; alerts come from `alerts_from` if given.
+    """
+
+    def __init__(self, root=ARCHIVE_DIR, alerts_from=None):
+        self.root = root
+        self.alerts_from = alerts_from
+
+    def partitions(self, city=None, start=None, end=None):
+        """(city, month, paths) for partitions overlapping [start, end), pruned by directory name"""
+        base = os.path.join(self.root, TABLE_NAME)
+        if not os.path.isdir(base):
+            return []
+
+        first = str(start)[:7] if start else None
+        last = str(end)[:7] if end else None
+        result = []
+        for city_dir in sorted(os.listdir(base)):
+            name = unquote(city_dir[len('city='):])
+            if not city_dir.startswith('city=') or (city and name != city):
+                continue
+            for month_dir in sorted(os.listdir(os.path.join(base, city_dir))):
+                month = month_dir[len('month='):]
+                if (first and month < first) or (last and month > last):
+                    continue
+                directory = os.path.join(base, city_dir, month_dir)
+                paths = sorted(os.path.join(directory, filename) for filename in os.listdir(directory)
+                               if filename.endswith(tuple(EXTENSIONS.values())))
+                if paths:
+                    result.append((name, month, paths))
+        return result
+
+    def iter_weather_history(self, start=None, end=None, chunk_size=5000, city=None, coalesce=True):
+        """Stream archived rows observed in [start, end), month by month in created_at order"""
+        by_month = {}
+        for _, month, paths in self.partitions(city, start, end):
+            by_month.setdefault(month, []).extend(paths)
+
+        start = str(start) if start else None
+        end = str(end) if end else None
+        for month in sorted(by_month):
+            streams = [read_archive_file(path, chunk_size) for path in by_month[month]]
+            for row in heapq.merge(*streams, key=_row_order):
+                observed = str(row['timestamp'] or '')
+                if (start is None or observed >= start) and (end is None or observed < end):
+                    yield replay_defaults(row) if coalesce else row
+
+    def iter_alert_history(self, start=None, end=None, chunk_size=5000):
+        if self.alerts_from is None:
+            return iter(())
+        return self.alerts_from.iter_alert_history(start, end, chunk_size)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='main.py archive', description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--before', required=True, help='archive rows observed before this date/time (ISO)')
+    parser.add_argument('--source', choices=('sqlite', 'azure'), default='sqlite')
+    parser.add_argument('--dir', default=ARCHIVE_DIR, help='archive root directory')
+    parser.add_argument('--format', choices=tuple(EXTENSIONS), default=None,
+                        help='parquet (needs pyarrow) or csv; default picks parquet when available')
+    parser.add_argument('--keep', action='store_true', help='write archives without deleting the rows')
+    args = parser.parse_args(argv)
+
+    before = datetime.fromisoformat(args.before).isoformat()
+    if args.source == 'azure':
+        from azure_storage import AzureWeatherStorage
+        source = AzureWeatherStorage()
+    else:
+        from database import WeatherDatabase
+        source = WeatherDatabase()
+
+    report = Archiver(source, root=args.dir, fmt=args.format).run(before, delete=not args.keep)
+    print(f"Archived {report['rows']} rows for {report['cities']} cities into {report['files']} "
+          f"{report['format']} files under {args.dir} ({report['rows_per_second']:.0f} rows/sec)")
+    print(f"Deleted {report['deleted']} rows from {args.source}")
+    return report
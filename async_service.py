@@ -0,0 +1,213 @@
+import asyncio
+import logging
+import signal
+import time
+from datetime import datetime
+from serialization import dumps_bytes
+from config import (
+    WEATHER_FETCH_BATCH_SIZE, SERVICE_INTERVAL_SECONDS, SERVICE_FETCH_CONCURRENCY,
+    SERVICE_HEALTH_HOST, SERVICE_HEALTH_PORT
+)
+
+class AsyncWeatherService:
+    """Long-running asyncio runtime for the weather alert pipeline"""
+
+    def __init__(self, app, interval=SERVICE_INTERVAL_SECONDS,
+                 fetch_concurrency=SERVICE_FETCH_CONCURRENCY,
+                 health_host=SERVICE_HEALTH_HOST, health_port=SERVICE_HEALTH_PORT):
+        self.app = app
+        self.interval = interval
+        self.fetch_concurrency = fetch_concurrency
+        self.health_host = health_host
+        self.health_port = health_port
+
+        self._stop_event = None
+        self._tick_lock = None
+        self._current_tick = None
+        self._health_server = None
+
+        self.metrics = {
+            'started_at': None,
+            'ticks_completed': 0,
+            'ticks_failed': 0,
+            'ticks_skipped_overlap': 0,
+            'ticks_missed_deadline': 0,
+            'last_tick_started': None,
+            'last_tick_duration': None,
+            'last_tick_cities': 0,
+            'last_tick_alerts': 0,
+            'last_tick_stale': 0,
+            'total_alerts': 0
+        }
+
+    def run(self):
+        """Run the service until SIGTERM/SIGINT"""
+        asyncio.run(self.serve())
+
+    async def serve(self):
+        """Main service coroutine: scheduler loop plus health endpoint"""
+        loop = asyncio.get_running_loop()
+        self._stop_event = asyncio.Event()
+        self._tick_lock = asyncio.Lock()
+        self.metrics['started_at'] = datetime.utcnow().isoformat()
+
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+            except (NotImplementedError, RuntimeError):
+                # Signal handlers are unavailable on Windows event loops
+                pass
+
+        if self.health_port:
+            try:
+                self._health_server = await asyncio.start_server(
+                    self._handle_health_request, self.health_host, self.health_port
+                )
+                logging.info("Health endpoint listening on http://%s:%s", self.health_host, self.health_port)
+            except OSError as e:
+                logging.error("Failed to start health endpoint: %s", e)
+
+        logging.info("Async service started, checking weather every %s seconds", self.interval)
+
+        try:
+            await self._scheduler_loop()
+        finally:
+            await self._shutdown()
+
+    def stop(self):
+        """Request a graceful shutdown"""
+        if self._stop_event and not self._stop_event.is_set():
+            logging.info("Shutdown requested, waiting for in-flight check to finish")
+            self._stop_event.set()
+
+    async def _scheduler_loop(self):
+        """Fire ticks on fixed deadlines so checks don't drift"""
+        loop = asyncio.get_running_loop()
+        next_deadline = loop.time()
+
+        while not self._stop_event.is_set():
+            if self._tick_lock.locked():
+                self.metrics['ticks_skipped_overlap'] += 1
+                logging.warning("Previous weather check still running, skipping this tick")
+            else:
+                self._current_tick = asyncio.create_task(self._run_tick())
+
+            # Advance to the next deadline, skipping any that have already passed
+            next_deadline += self.interval
+            now = loop.time()
+            if next_deadline <= now:
+                missed = int((now - next_deadline) // self.interval) + 1
+                self.metrics['ticks_missed_deadline'] += missed
+                next_deadline += missed * self.interval
+
+            try:
+                await asyncio.wait_for(self._stop_event.wait(), timeout=next_deadline - loop.time())
+            except asyncio.TimeoutError:
+                pass
+
+    async def _run_tick(self):
+        """Run one fetch/store/evaluate/notify cycle"""
+        async with self._tick_lock:
+            started = time.perf_counter()
+            self.metrics['last_tick_started'] = datetime.utcnow().isoformat()
+            try:
+                weather_data, alerts, _ = await self.check_weather_and_alerts()
+                self.metrics['ticks_completed'] += 1
+                self.metrics['last_tick_cities'] = len(weather_data)
+                self.metrics['last_tick_alerts'] = len(alerts)
+                self.metrics['total_alerts'] += len(alerts)
+                logging.info("Weather check completed in %.0f ms", (time.perf_counter() - started) * 1000,
+                             extra={'stage': 'tick', 'cities': len(weather_data), 'alerts': len(alerts)})
+            except Exception as e:
+                self.metrics['ticks_failed'] += 1
+                logging.error("Error in weather check: %s", e)
+            finally:
+                self.metrics['last_tick_duration'] = time.perf_counter() - started
+
+    async def check_weather_and_alerts(self):
+        """Fetch concurrently, then store, evaluate and notify via WeatherAlertApp.process_weather"""
+        logging.info("Starting weather check...", extra={'stage': 'start'})
+
+        started = time.perf_counter()
+        weather_data = await self._fetch_all()
+        self.metrics['last_tick_stale'] = sum(1 for data in weather_data if data.get('stale'))
+        # Storage, alert evaluation and SMTP all block: one worker thread, off the event loop
+        return await asyncio.to_thread(self.app.process_weather, weather_data, started)
+
+    async def _fetch_all(self):
+        """Fetch spatial station batches concurrently, bounded by fetch_concurrency"""
+        semaphore = asyncio.Semaphore(self.fetch_concurrency)
+        batches = list(self.app.weather_api.station_index.batches(WEATHER_FETCH_BATCH_SIZE))
+
+        async def fetch(batch):
+            async with semaphore:
+                return await asyncio.to_thread(self.app.weather_api.get_batch_weather, batch)
+
+        results = await asyncio.gather(*(fetch(batch) for batch in batches), return_exceptions=True)
+
+        weather_data = []
+        for batch, result in zip(batches, results):
+            if isinstance(result, Exception):
+                logging.error("Error fetching weather data for batch of %s stations: %s", len(batch), result)
+            else:
+                weather_data.extend(result)
+        return weather_data
+
+    async def _shutdown(self):
+        """Wait for the in-flight tick and close the health endpoint"""
+        if self._current_tick and not self._current_tick.done():
+            try:
+                await self._current_tick
+            except Exception as e:
+                logging.error("Error finishing in-flight weather check: %s", e)
+
+        if self._health_server:
+            self._health_server.close()
+            await self._health_server.wait_closed()
+
+        logging.info("Async service stopped")
+
+    def health(self):
+        """Return the health payload"""
+        healthy = self.metrics['ticks_completed'] > 0 or self.metrics['ticks_failed'] == 0
+        upstream = self.app.weather_api.metrics()
+        if any(breaker['state'] != 'closed' for breaker in upstream['breakers'].values()):
+            healthy = False
+        return {
+            'status': 'ok' if healthy else 'degraded',
+            'upstream': {name: breaker['state'] for name, breaker in upstream['breakers'].items()},
+            'running': self._tick_lock.locked() if self._tick_lock else False,
+            'timestamp': datetime.utcnow().isoformat()
+        }
+
+    async def _handle_health_request(self, reader, writer):
+        """Minimal HTTP/1.0 handler for /health and /metrics"""
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            # Drain headers
+            while True:
+                line = await asyncio.wait_for(reader.readline(), timeout=5)
+                if not line or line in (b'\r\n', b'\n'):
+                    break
+
+            parts = request_line.decode('latin-1').split()
+            path = parts[1] if len(parts) > 1 else '/'
+
+            if path == '/health':
+                status, payload = '200 OK', self.health()
+            elif path == '/metrics':
+                status, payload = '200 OK', {**self.metrics, 'upstream': self.app.weather_api.metrics(),
+                                             'notifications': self.app.notification_system.scheduler.metrics()}
+            else:
+                status, payload = '404 Not Found', {'status': 'error', 'message': 'not found'}
+
+            body = dumps_bytes(payload)
+            writer.write(
+                f"HTTP/1.0 {status}\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode('latin-1') + body
+            )
+            await writer.drain()
+        except Exception as e:
+            logging.error("Error handling health request: %s", e)
+        finally:
+            writer.close()
@@ -0,0 +1,44 @@
+"""
+Components reused across warm Azure Functions invocations
+
+The timer and test entry points (the WeatherAlertTimer and WeatherTest
+functions and function_app_v2) all run checks through one WeatherAlertApp
+backed by Azure Table Storage, so they share its process_weather pipeline,
+circuit breakers, trend windows, forecasts and deferred notifications.
+"""
+
+import threading
+
+_lock = threading.Lock()
+_storage = None
+_app = None
+
+
+def get_storage():
+    """The process-wide AzureWeatherStorage client"""
+    global _storage
+    with _lock:
+        if _storage is None:
+            from azure_storage import AzureWeatherStorage
+            _storage = AzureWeatherStorage()
+        return _storage
+
+
+def get_app():
+    """The process-wide WeatherAlertApp, storing to Azure Table Storage"""
+    global _app
+    storage = get_storage()
+    with _lock:
+        if _app is None:
+            from main import WeatherAlertApp
+            from weather_api import WeatherAPI
+            from alert_system import AlertSystem
+            from notification_system import NotificationSystem
+            from forecast import get_forecast_monitor
+            weather_api = WeatherAPI()
+            alert_system = AlertSystem()
+            _app = WeatherAlertApp(weather_api=weather_api, alert_system=alert_system,
+                                   notification_system=NotificationSystem(subscriptions=storage),
+                                   database=storage,
+                                   forecast_monitor=get_forecast_monitor(weather_api.providers, alert_system))
+        return _app
@@ -1,17 +1,96 @@
 import os
-import json
 import logging
-from datetime import datetime, timedelta
-from azure.data.tables import TableServiceClient, TableEntity
+from datetime import datetime, timedelta, timezone
+from azure.data.tables import TableServiceClient, TableEntity, UpdateMode
 from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
-from config import CITIES
+from serialization import dumps, loads
+from query_cache import QueryCache, get_query_cache, write_tags
+from latest_conditions import apply_to_view, conditions_entry
+from subscriptions import normalize_subscription
+from database import replay_defaults
+
+ROW_KEY_FORMAT = '%Y%m%d_%H%M%S_%f'
+
+WEATHER_SELECT = ['PartitionKey', 'RowKey', 'Temperature', 'WindSpeed', 'Visibility',
+                  'WeatherDescription', 'Timestamp']
+ALERT_SELECT = ['PartitionKey', 'RowKey', 'AlertType', 'Message', 'Severity', 'Timestamp']
+
+# Derived heat-stress metrics (see derived_metrics.py), absent on older entities
+DERIVED_PROPERTIES = {'dew_point': 'DewPoint', 'heat_index': 'HeatIndex', 'wbgt': 'Wbgt'}
+
+# The latest-conditions view lives in one partition, keyed by city, so it reads in one scan
+LATEST_PARTITION = 'latest'
+LATEST_SELECT = ['RowKey', 'Readings', 'UpdatedAt']
+
+# Subscriptions share one small partition, keyed by email
+SUBSCRIPTION_PARTITION = 'subscription'
+SUBSCRIPTION_SELECT = ['RowKey', 'Cities', 'AlertTypes', 'MinSeverity']
+TRANSACTION_MAX_OPERATIONS = 100
+
+
+def _odata_quote(value):
+    """Quote a string literal for an OData filter"""
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def to_utc_naive(value):
+    """A datetime as naive UTC, the form of RowKeys and stored_at; naive values are taken as UTC"""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def observation_row_key(data):
+    """Weather RowKey: the provider observation time (UTC), else now"""
+    observed = data.get('dt')
+    when = datetime.fromtimestamp(observed, timezone.utc) if observed is not None else datetime.now(timezone.utc)
+    return when.strftime(ROW_KEY_FORMAT)
+
+
+def _stored_at(entity):
+    value = entity.get('Timestamp', '')
+    return value.isoformat() if hasattr(value, 'isoformat') else str(value)
+
+
+def _weather_from_entity(entity):
+    return {
+        'city': entity['PartitionKey'],
+        'temperature': entity.get('Temperature', 0),
+        'wind_speed': entity.get('WindSpeed', 0),
+        'visibility': entity.get('Visibility', 0),
+        'weather_description': entity.get('WeatherDescription', ''),
+        'timestamp': entity.get('Timestamp', ''),
+        'stored_at': _stored_at(entity)
+    }
+
+
+def _alert_from_entity(entity):
+    return {
+        'city': entity['PartitionKey'],
+        'type': entity.get('AlertType', ''),
+        'message': entity.get('Message', ''),
+        'severity': entity.get('Severity', ''),
+        'stored_at': _stored_at(entity)
+    }
+
 
 class AzureWeatherStorage:
-    def __init__(self):
+    def __init__(self, table_service=None):
         # Get connection string from environment variable
         self.connection_string = os.getenv('AZURE_STORAGE_CONNECTION_STRING')
+        self.local_latest = {}  # city -> (readings, updated_at), for the local fallback
+        self.local_subscriptions = {}  # email -> subscription, for the local fallback
         
-        if not self.connection_string:
+        if table_service is not None:
+            # Injected client (e.g. an in-memory fake for benchmarks)
+            self.use_azure = True
+            self.table_service = table_service
+            self.weather_table_name = "WeatherHistory"
+            self.alerts_table_name = "AlertsHistory"
+            self.latest_table_name = "LatestConditions"
+            self.subscriptions_table_name = "Subscriptions"
+            self._ensure_tables_exist()
+        elif not self.connection_string:
             logging.warning("Azure Storage connection string not found. Using local fallback.")
             self.use_azure = False
             self.local_data = {"weather": [], "alerts": []}
@@ -21,12 +100,22 @@ class AzureWeatherStorage:
                 self.table_service = TableServiceClient.from_connection_string(self.connection_string)
                 self.weather_table_name = "WeatherHistory"
                 self.alerts_table_name = "AlertsHistory"
+                self.latest_table_name = "LatestConditions"
+                self.subscriptions_table_name = "Subscriptions"
                 self._ensure_tables_exist()
             except Exception as e:
-                logging.error(f"Failed to initialize Azure Storage: {e}")
+                logging.error("Failed to initialize Azure Storage: %s", e)
                 logging.warning("Falling back to local storage")
                 self.use_azure = False
                 self.local_data = {"weather": [], "alerts": []}
+        
+        # Shared per backend so any instance's writes invalidate every reader
+        if table_service is not None:
+            self.query_cache = get_query_cache(('azure', id(table_service)))
+        elif self.use_azure:
+            self.query_cache = get_query_cache(('azure', self.connection_string))
+        else:
+            self.query_cache = QueryCache()  # local_data is per instance, and so is its cache
     
     def _ensure_tables_exist(self):
         """Create tables if they don't exist"""
@@ -38,33 +127,56 @@ class AzureWeatherStorage:
         except ResourceExistsError:
             pass
         except Exception as e:
-            logging.error(f"Error creating weather table: {e}")
+            logging.error("Error creating weather table: %s", e)
             
         try:
             self.table_service.create_table(self.alerts_table_name)
         except ResourceExistsError:
             pass
         except Exception as e:
-            logging.error(f"Error creating alerts table: {e}")
+            logging.error("Error creating alerts table: %s", e)
+            
+        try:
+            self.table_service.create_table(self.latest_table_name)
+        except ResourceExistsError:
+            pass
+        except Exception as e:
+            logging.error("Error creating latest conditions table: %s", e)
+            
+        try:
+            self.table_service.create_table(self.subscriptions_table_name)
+        except ResourceExistsError:
+            pass
+        except Exception as e:
+            logging.error("Error creating subscriptions table: %s", e)
     
     def store_weather_data(self, weather_data_list):
-        """Store weather data in Azure Table Storage or local fallback"""
+        """Store weather data in Azure Table Storage or local fallback
+
+        Returns the records that were not stored before (keyed on city and
+        provider observation time).
+        """
+        try:
+            return self._store_weather_data(weather_data_list)
+        finally:
+            self.query_cache.invalidate(write_tags('weather', {data['city'] for data in weather_data_list}))
+    
+    def _store_weather_data(self, weather_data_list):
         if not self.use_azure:
             # Local fallback
-            for data in weather_data_list:
-                data['stored_at'] = datetime.utcnow().isoformat()
-                self.local_data["weather"].append(data)
-            logging.info(f"Stored weather data locally for {len(weather_data_list)} cities")
-            return
+            inserted = self._store_local_weather(weather_data_list)
+            logging.info("Stored weather data locally for %s cities", len(weather_data_list))
+            return inserted
         
         try:
             weather_table = self.table_service.get_table_client(self.weather_table_name)
             
+            inserted = []
             for data in weather_data_list:
                 # Create entity for Azure Table Storage
                 entity = TableEntity()
                 entity['PartitionKey'] = data['city']
-                entity['RowKey'] = datetime.utcnow().strftime('%Y%m%d_%H%M%S_%f')
+                entity['RowKey'] = observation_row_key(data)
                 
                 # Add weather data
                 entity['Temperature'] = data['temperature']
@@ -77,36 +189,145 @@ class AzureWeatherStorage:
                 entity['WeatherMain'] = data['weather_main']
                 entity['WeatherDescription'] = data['weather_description']
                 entity['Rain1h'] = data['rain_1h']
+                for field, name in DERIVED_PROPERTIES.items():
+                    if data.get(field) is not None:
+                        entity[name] = data[field]
                 entity['Timestamp'] = data['timestamp']
+                if data.get('dt') is not None:
+                    entity['ObservedAt'] = int(data['dt'])
                 entity['Sunrise'] = data['sunrise']
                 entity['Sunset'] = data['sunset']
                 
-                weather_table.create_entity(entity)
+                # Keyed on the provider observation time, so a repeat overwrites its entity
+                try:
+                    weather_table.create_entity(entity)
+                    inserted.append(data)
+                except ResourceExistsError:
+                    weather_table.upsert_entity(entity)
+                data['observation_id'] = entity['RowKey']
             
-            logging.info(f"Stored weather data in Azure for {len(weather_data_list)} cities")
+            logging.info("Stored weather data in Azure for %s cities (%s already stored)", len(weather_data_list),
+                         len(weather_data_list) - len(inserted))
+            self._update_latest_conditions(weather_data_list)
+            return inserted
             
         except Exception as e:
-            logging.error(f"Error storing weather data in Azure: {e}")
+            logging.error("Error storing weather data in Azure: %s", e)
             # Fallback to local storage
-            if not hasattr(self, 'local_data'):
-                self.local_data = {"weather": [], "alerts": []}
-            for data in weather_data_list:
-                data['stored_at'] = datetime.utcnow().isoformat()
-                self.local_data["weather"].append(data)
-            logging.info(f"Stored weather data locally as fallback for {len(weather_data_list)} cities")
+            inserted = self._store_local_weather(weather_data_list)
+            logging.info("Stored weather data locally as fallback for %s cities", len(weather_data_list))
+            return inserted
+    
+    def _store_local_weather(self, weather_data_list):
+        """Keep records in memory, idempotent per (city, 'dt'); returns those not held before"""
+        if not hasattr(self, 'local_data'):
+            self.local_data = {"weather": [], "alerts": []}
+        stored = self.local_data["weather"]
+        positions = self.local_data.setdefault("observations", {})  # (city, dt) -> index in stored
+        inserted = []
+        for data in weather_data_list:
+            data['stored_at'] = datetime.utcnow().isoformat()
+            key = (data['city'], data.get('dt'))
+            if key[1] is not None and key in positions:
+                stored[positions[key]] = data
+                continue
+            positions[key] = len(stored)
+            stored.append(data)
+            inserted.append(data)
+        self._update_local_latest(weather_data_list)
+        return inserted
+    
+    def _update_latest_conditions(self, weather_data_list):
+        """Upsert each touched city's latest-conditions entity after a history write
+        
+        Failures are logged rather than falling back, since the history rows are
+        already stored; the next write for the city repairs its entry.
+        """
+        try:
+            latest_table = self.table_service.get_table_client(self.latest_table_name)
+            cities = {data['city'] for data in weather_data_list}
+            view = {}
+            for entity in latest_table.query_entities(f"PartitionKey eq '{LATEST_PARTITION}'",
+                                                      select=['RowKey', 'Readings']):
+                if entity['RowKey'] in cities:
+                    view[entity['RowKey']] = loads(entity['Readings'])
+            
+            updated_at = datetime.utcnow().isoformat()
+            operations = []
+            for city, readings in apply_to_view(view, weather_data_list).items():
+                entity = TableEntity()
+                entity['PartitionKey'] = LATEST_PARTITION
+                entity['RowKey'] = city
+                entity['ObservationRowKey'] = readings[0]['observation_id']
+                entity['Readings'] = dumps(readings)
+                entity['UpdatedAt'] = updated_at
+                operations.append(('upsert', entity))
+            
+            # Every entity shares the partition, so they batch into transactions
+            for start in range(0, len(operations), TRANSACTION_MAX_OPERATIONS):
+                latest_table.submit_transaction(operations[start:start + TRANSACTION_MAX_OPERATIONS])
+            
+        except Exception as e:
+            logging.error("Error updating latest conditions in Azure: %s", e)
+    
+    def _update_local_latest(self, weather_data_list):
+        updated_at = datetime.utcnow().isoformat()
+        view = {data['city']: self.local_latest.get(data['city'], (None,))[0] for data in weather_data_list}
+        for city, readings in apply_to_view(view, weather_data_list).items():
+            self.local_latest[city] = (readings, updated_at)
     
-    def store_alert(self, alert):
+    def get_latest_conditions(self, city=None):
+        """Latest reading per city with its recent readings inline, read in O(cities)"""
+        try:
+            return self.query_cache.get_or_load(
+                ('latest', city), [('weather', city)],
+                lambda: self._load_latest_conditions(city)
+            )
+        except Exception:
+            return []
+    
+    def _load_latest_conditions(self, city):
+        if not self.use_azure:
+            cities = [city] if city else sorted(self.local_latest)
+            return [conditions_entry(name, *self.local_latest[name]) for name in cities if name in self.local_latest]
+        
+        try:
+            latest_table = self.table_service.get_table_client(self.latest_table_name)
+            if city:
+                try:
+                    entities = [latest_table.get_entity(LATEST_PARTITION, city)]
+                except ResourceNotFoundError:
+                    entities = []
+            else:
+                entities = latest_table.query_entities(f"PartitionKey eq '{LATEST_PARTITION}'", select=LATEST_SELECT)
+            
+            return [conditions_entry(entity['RowKey'], loads(entity['Readings']), entity.get('UpdatedAt'))
+                    for entity in entities]
+            
+        except Exception as e:
+            logging.error("Error retrieving latest conditions from Azure: %s", e)
+            raise
+    
+    def store_alert(self, alert, email_sent=False, sms_sent=False):
         """Store alert in Azure Table Storage or local fallback"""
+        try:
+            self._store_alert(alert, email_sent, sms_sent)
+        finally:
+            self.query_cache.invalidate(write_tags('alerts', {alert['city']}))
+    
+    def _store_alert(self, alert, email_sent, sms_sent):
+        # The RowKey, kept on the alert so a later delivery can be recorded
+        alert['alert_id'] = datetime.utcnow().strftime(ROW_KEY_FORMAT)
         if not self.use_azure:
             # Local fallback
             alert_data = {
                 **alert,
                 'stored_at': datetime.utcnow().isoformat(),
-                'email_sent': True,
-                'sms_sent': False
+                'email_sent': email_sent,
+                'sms_sent': sms_sent
             }
             self.local_data["alerts"].append(alert_data)
-            logging.info(f"Stored alert locally: {alert['type']} for {alert['city']}")
+            logging.info("Stored alert locally: %s for %s", alert['type'], alert['city'])
             return
         
         try:
@@ -115,39 +336,144 @@ class AzureWeatherStorage:
             # Create entity for Azure Table Storage
             entity = TableEntity()
             entity['PartitionKey'] = alert['city']
-            entity['RowKey'] = datetime.utcnow().strftime('%Y%m%d_%H%M%S_%f')
+            entity['RowKey'] = alert['alert_id']
             
             # Add alert data
             entity['AlertType'] = alert['type']
             entity['Message'] = alert['message']
             entity['Severity'] = alert['severity']
-            entity['WeatherData'] = json.dumps(alert['weather_data'])
-            entity['EmailSent'] = True
-            entity['SmsSent'] = False
+            # Reference the stored observation instead of embedding a copy
+            weather = alert['weather_data']
+            if weather.get('observation_id') is not None:
+                entity['ObservationCity'] = weather['city']
+                entity['ObservationRowKey'] = weather['observation_id']
+            else:
+                entity['WeatherData'] = dumps(weather)
+            entity['EmailSent'] = email_sent
+            entity['SmsSent'] = sms_sent
             
             alerts_table.create_entity(entity)
             
-            logging.info(f"Stored alert in Azure: {alert['type']} for {alert['city']}")
+            logging.info("Stored alert in Azure: %s for %s", alert['type'], alert['city'])
             
         except Exception as e:
-            logging.error(f"Error storing alert in Azure: {e}")
+            logging.error("Error storing alert in Azure: %s", e)
             # Fallback to local storage
             if not hasattr(self, 'local_data'):
                 self.local_data = {"weather": [], "alerts": []}
             alert_data = {
                 **alert,
                 'stored_at': datetime.utcnow().isoformat(),
-                'email_sent': True,
-                'sms_sent': False
+                'email_sent': email_sent,
+                'sms_sent': sms_sent
             }
             self.local_data["alerts"].append(alert_data)
-            logging.info(f"Stored alert locally as fallback: {alert['type']} for {alert['city']}")
+            logging.info("Stored alert locally as fallback: %s for %s", alert['type'], alert['city'])
+    
+    def mark_alerts_sent(self, alerts):
+        """Record the email delivery of stored alerts, e.g. ones deferred by rate limits"""
+        stored = [alert for alert in alerts if alert.get('alert_id') is not None]
+        if not stored:
+            return
+        try:
+            self._mark_alerts_sent(stored)
+        finally:
+            self.query_cache.invalidate(write_tags('alerts', {alert['city'] for alert in stored}))
+    
+    def _mark_alerts_sent(self, alerts):
+        keys = {(alert['city'], alert['alert_id']) for alert in alerts}
+        # Alerts stored locally, either as the fallback or after an Azure error
+        for alert_data in getattr(self, 'local_data', {}).get("alerts", []):
+            if (alert_data['city'], alert_data.get('alert_id')) in keys:
+                alert_data['email_sent'] = True
+        if not self.use_azure:
+            return
+        
+        alerts_table = self.table_service.get_table_client(self.alerts_table_name)
+        for city, row_key in keys:
+            try:
+                alerts_table.upsert_entity({'PartitionKey': city, 'RowKey': row_key, 'EmailSent': True},
+                                           mode=UpdateMode.MERGE)
+            except Exception as e:
+                logging.error("Error marking alert sent in Azure: %s", e)
+    
+    def add_subscription(self, email, cities='*', alert_types='*', min_severity='LOW'):
+        """Add or replace an email's subscription; raises ValueError if invalid"""
+        subscription = normalize_subscription(email, cities, alert_types, min_severity)
+        try:
+            if not self.use_azure:
+                self.local_subscriptions[subscription['email']] = subscription
+                return subscription
+            
+            entity = TableEntity()
+            entity['PartitionKey'] = SUBSCRIPTION_PARTITION
+            entity['RowKey'] = subscription['email']
+            entity['Cities'] = subscription['cities']
+            entity['AlertTypes'] = subscription['alert_types']
+            entity['MinSeverity'] = subscription['min_severity']
+            self.table_service.get_table_client(self.subscriptions_table_name).upsert_entity(entity)
+            return subscription
+        finally:
+            self.query_cache.invalidate([('subscriptions', None)])
+    
+    def remove_subscription(self, email):
+        email = email.strip().lower()
+        try:
+            if not self.use_azure:
+                return self.local_subscriptions.pop(email, None) is not None
+            
+            table = self.table_service.get_table_client(self.subscriptions_table_name)
+            try:
+                table.get_entity(SUBSCRIPTION_PARTITION, email)
+            except ResourceNotFoundError:
+                return False
+            table.delete_entity(SUBSCRIPTION_PARTITION, email)
+            return True
+        finally:
+            self.query_cache.invalidate([('subscriptions', None)])
+    
+    def get_subscriptions(self):
+        """All subscriptions as dicts, cached until the next subscription write"""
+        try:
+            return self.query_cache.get_or_load(
+                ('subscriptions',), [('subscriptions', None)],
+                self._load_subscriptions
+            )
+        except Exception:
+            return []
+    
+    def _load_subscriptions(self):
+        if not self.use_azure:
+            return [self.local_subscriptions[email] for email in sorted(self.local_subscriptions)]
+        
+        try:
+            table = self.table_service.get_table_client(self.subscriptions_table_name)
+            entities = table.query_entities(f"PartitionKey eq '{SUBSCRIPTION_PARTITION}'", select=SUBSCRIPTION_SELECT)
+            return [{
+                'email': entity['RowKey'],
+                'cities': entity.get('Cities', '*'),
+                'alert_types': entity.get('AlertTypes', '*'),
+                'min_severity': entity.get('MinSeverity', 'LOW')
+            } for entity in entities]
+            
+        except Exception as e:
+            logging.error("Error retrieving subscriptions from Azure: %s", e)
+            raise
     
     def get_recent_weather(self, city=None, hours=24):
-        """Get recent weather data"""
+        """Get recent weather data, cached until the next write for that city"""
+        try:
+            return self.query_cache.get_or_load(
+                ('weather', city, hours), [('weather', city)],
+                lambda: self._load_recent_weather(city, hours)
+            )
+        except Exception:
+            return []
+    
+    def _load_recent_weather(self, city, hours):
         if not self.use_azure:
             # Local fallback
-            cutoff_time = datetime() - timedelta(hours=hours)
+            cutoff_time = datetime.utcnow() - timedelta(hours=hours)
             recent_data = []
             
             for data in self.local_data["weather"]:
@@ -173,25 +499,23 @@ class AzureWeatherStorage:
             
             entities = weather_table.query_entities(filter_query)
             
-            results = []
-            for entity in entities:
-                results.append({
-                    'city': entity['PartitionKey'],
-                    'temperature': entity.get('Temperature', 0),
-                    'wind_speed': entity.get('WindSpeed', 0),
-                    'weather_description': entity.get('WeatherDescription', ''),
-                    'timestamp': entity.get('Timestamp', ''),
-                    'stored_at': entity['Timestamp'].isoformat() if hasattr(entity['Timestamp'], 'isoformat') else str(entity['Timestamp'])
-                })
-            
-            return results
+            return [_weather_from_entity(entity) for entity in entities]
             
         except Exception as e:
-            logging.error(f"Error retrieving weather data from Azure: {e}")
-            return []
+            logging.error("Error retrieving weather data from Azure: %s", e)
+            raise
     
     def get_recent_alerts(self, hours=24):
-        """Get recent alerts"""
+        """Get recent alerts, cached until the next alert is stored"""
+        try:
+            return self.query_cache.get_or_load(
+                ('alerts', None, hours), [('alerts', None)],
+                lambda: self._load_recent_alerts(hours)
+            )
+        except Exception:
+            return []
+    
+    def _load_recent_alerts(self, hours):
         if not self.use_azure:
             # Local fallback
             cutoff_time = datetime.utcnow() - timedelta(hours=hours)
@@ -219,18 +543,144 @@ class AzureWeatherStorage:
             
             entities = alerts_table.query_entities(filter_query)
             
-            results = []
-            for entity in entities:
-                results.append({
-                    'city': entity['PartitionKey'],
-                    'type': entity.get('AlertType', ''),
-                    'message': entity.get('Message', ''),
-                    'severity': entity.get('Severity', ''),
-                    'stored_at': entity['Timestamp'].isoformat() if hasattr(entity['Timestamp'], 'isoformat') else str(entity['Timestamp'])
-                })
+            return [_alert_from_entity(entity) for entity in entities]
+            
+        except Exception as e:
+            logging.error("Error retrieving alerts from Azure: %s", e)
+            raise
+    
+    def query_weather(self, city=None, since=None, limit=100, continuation_token=None):
+        """One page of weather observations, filtered and paged by the service
+        
+        Returns (items, continuation_token); the token is None on the last page.
+        `since` is a datetime matched against the time-ordered RowKey; naive
+        values are UTC and aware ones are converted to UTC.
+        """
+        return self._query_page(self.weather_table_name, "weather", _weather_from_entity, WEATHER_SELECT,
+                                city, since, limit, continuation_token)
+    
+    def query_alerts(self, city=None, since=None, limit=100, continuation_token=None):
+        """One page of alerts, filtered and paged by the service"""
+        return self._query_page(self.alerts_table_name, "alerts", _alert_from_entity, ALERT_SELECT,
+                                city, since, limit, continuation_token)
+    
+    def _query_page(self, table_name, local_key, from_entity, select, city, since, limit, continuation_token):
+        since = to_utc_naive(since)
+        key = (local_key + '_page', city, since, limit, dumps(continuation_token))
+        try:
+            return self.query_cache.get_or_load(
+                key, [(local_key, city)],
+                lambda: self._load_page(table_name, local_key, from_entity, select, city, since,
+                                        limit, continuation_token)
+            )
+        except Exception:
+            return [], None
+    
+    def _load_page(self, table_name, local_key, from_entity, select, city, since, limit, continuation_token):
+        if not self.use_azure:
+            return self._query_local_page(local_key, city, since, limit, continuation_token)
+        
+        filters = []
+        if city:
+            filters.append(f"PartitionKey eq {_odata_quote(city)}")
+        if since:
+            filters.append(f"RowKey ge {_odata_quote(since.strftime(ROW_KEY_FORMAT))}")
+        
+        try:
+            table = self.table_service.get_table_client(table_name)
+            if filters:
+                entities = table.query_entities(' and '.join(filters), results_per_page=limit, select=select)
+            else:
+                entities = table.list_entities(results_per_page=limit, select=select)
             
-            return results
+            pages = entities.by_page(continuation_token=continuation_token)
+            page = next(pages, [])
+            items = [from_entity(entity) for entity in page]
+            return items, pages.continuation_token
             
         except Exception as e:
-            logging.error(f"Error retrieving alerts from Azure: {e}")
-            return []
+            logging.error("Error querying %s in Azure: %s", table_name, e)
+            raise
+    
+    def _query_local_page(self, local_key, city, since, limit, continuation_token):
+        """Local fallback: the token is the offset into the in-memory list"""
+        records = self.local_data[local_key]
+        offset = int(continuation_token or 0)
+        cutoff = since.isoformat() if since else None
+        
+        items = []
+        while offset < len(records) and len(items) < limit:
+            data = records[offset]
+            offset += 1
+            if city and data['city'] != city:
+                continue
+            if cutoff and data.get('stored_at', '') < cutoff:
+                continue
+            items.append({key: value for key, value in data.items() if key != 'weather_data'})
+        
+        return items, (offset if offset < len(records) else None)
+    
+    def get_trend_history(self, minutes):
+        """Get recent observations in time order, for warming trend windows"""
+        results = self.get_recent_weather(hours=minutes / 60.0)
+        return sorted(results, key=lambda data: str(data.get('timestamp') or ''))
+    
+    def iter_weather_history(self, end=None, chunk_size=1000, coalesce=False):
+        """Stream full weather entities stored before `end` (datetime or ISO string) as archive rows
+
+        Missing properties stay None unless coalesce fills them with REPLAY_DEFAULTS.
+        """
+        if not self.use_azure:
+            logging.warning("Local fallback storage has no weather history to stream")
+            return
+        
+        weather_table = self.table_service.get_table_client(self.weather_table_name)
+        if isinstance(end, str):
+            end = datetime.fromisoformat(end)
+        if end is not None:
+            entities = weather_table.query_entities(f"RowKey lt {_odata_quote(end.strftime(ROW_KEY_FORMAT))}",
+                                                    results_per_page=chunk_size)
+        else:
+            entities = weather_table.list_entities(results_per_page=chunk_size)
+        
+        for entity in entities:
+            row = {
+                'id': entity['RowKey'],
+                'city': entity['PartitionKey'],
+                'temperature': entity.get('Temperature'),
+                'feels_like': entity.get('FeelsLike'),
+                'humidity': entity.get('Humidity'),
+                'pressure': entity.get('Pressure'),
+                'wind_speed': entity.get('WindSpeed'),
+                'wind_direction': entity.get('WindDirection'),
+                'visibility': entity.get('Visibility'),
+                'weather_main': entity.get('WeatherMain'),
+                'weather_description': entity.get('WeatherDescription'),
+                'rain_1h': entity.get('Rain1h'),
+                **{field: entity.get(name) for field, name in DERIVED_PROPERTIES.items()},
+                'timestamp': str(entity.get('Timestamp') or ''),
+                'observed_at': entity.get('ObservedAt'),
+                'created_at': datetime.strptime(entity['RowKey'], ROW_KEY_FORMAT).strftime('%Y-%m-%d %H:%M:%S')
+            }
+            yield replay_defaults(row) if coalesce else row
+    
+    def delete_weather_entities(self, keys):
+        """Delete (city, RowKey) pairs in per-partition transactions"""
+        if not self.use_azure:
+            return 0
+        
+        weather_table = self.table_service.get_table_client(self.weather_table_name)
+        by_city = {}
+        for city, row_key in keys:
+            by_city.setdefault(city, []).append(('delete', {'PartitionKey': city, 'RowKey': row_key}))
+        
+        deleted = 0
+        for operations in by_city.values():
+            for start in range(0, len(operations), TRANSACTION_MAX_OPERATIONS):
+                batch = operations[start:start + TRANSACTION_MAX_OPERATIONS]
+                weather_table.submit_transaction(batch)
+                deleted += len(batch)
+        
+        self.query_cache.invalidate(write_tags('weather', by_city))
+        logging.info("Deleted %s archived weather entities from Azure", deleted)
+        return deleted
@@ -0,0 +1,176 @@
+"""
+Replay stored weather_history through AlertSystem to tune ALERT_TRIGGERS
+
+Usage: python main.py backtest [--from YYYY-MM-DD] [--to YYYY-MM-DD] [--chunk N] [--archive DIR]
+"""
+
+import argparse
+import logging
+import time
+from collections import Counter, defaultdict, deque
+from datetime import datetime, timedelta
+from alert_system import AlertSystem
+from database import WeatherDatabase
+
+# Replayed and recorded alerts match if stored within this many seconds
+MATCH_TOLERANCE_SECONDS = 120
+
+
+def _parse_time(value):
+    try:
+        return datetime.fromisoformat(str(value))
+    except (TypeError, ValueError):
+        return None
+
+
+class Backtester:
+    """Streams stored observations tick by tick through a fresh AlertSystem"""
+
+    def __init__(self, database=None, alert_system=None, chunk_size=5000,
+                 match_tolerance=MATCH_TOLERANCE_SECONDS):
+        self.database = database or WeatherDatabase()
+        self.alert_system = alert_system or AlertSystem()
+        self.chunk_size = chunk_size
+        self.match_tolerance = timedelta(seconds=match_tolerance)
+
+    def _ticks(self, start, end):
+        """Group consecutive rows stored in the same write into ticks"""
+        tick, tick_key = [], None
+        for row in self.database.iter_weather_history(start, end, self.chunk_size):
+            if tick and row['created_at'] != tick_key:
+                yield tick
+                tick = []
+            tick_key = row['created_at']
+            # History rows carry the provider time as observed_at; expose it as
+            # 'dt' so each row is judged at its own observation time
+            if row.get('dt') is None and row.get('observed_at') is not None:
+                row['dt'] = row['observed_at']
+            tick.append(row)
+        if tick:
+            yield tick
+
+    def run(self, start=None, end=None):
+        """Replay the range and return a report dict"""
+        replayed = Counter()
+        matched = Counter()
+        recorded = Counter()
+        rows = 0
+        ticks = 0
+
+        recorded_iter = None
+        # Recorded alerts inside the match window, keyed by (city, type)
+        pending = defaultdict(deque)
+        pending_order = deque()
+        next_recorded = None
+
+        started = time.perf_counter()
+        for tick in self._ticks(start, end):
+            rows += len(tick)
+            ticks += 1
+
+            tick_time = _parse_time(tick[0]['created_at'])
+            alerts = self.alert_system.check_alerts(tick)
+
+            if tick_time is not None:
+                if recorded_iter is None:
+                    lower = (tick_time - self.match_tolerance).strftime('%Y-%m-%d %H:%M:%S')
+                    recorded_iter = self.database.iter_alert_history(start=lower, chunk_size=self.chunk_size)
+                    next_recorded = next(recorded_iter, None)
+
+                # Pull recorded alerts up to the end of this tick's match window
+                horizon = tick_time + self.match_tolerance
+                while next_recorded is not None:
+                    recorded_time = _parse_time(next_recorded['created_at'])
+                    if recorded_time is None or recorded_time > horizon:
+                        break
+                    key = (next_recorded['city'], next_recorded['alert_type'])
+                    pending[key].append(recorded_time)
+                    pending_order.append((recorded_time, key))
+                    recorded[next_recorded['alert_type']] += 1
+                    next_recorded = next(recorded_iter, None)
+
+                # Expire recorded alerts that fell out of the window (missed)
+                floor = tick_time - self.match_tolerance
+                while pending_order and pending_order[0][0] < floor:
+                    recorded_time, key = pending_order.popleft()
+                    if pending[key] and pending[key][0] == recorded_time:
+                        pending[key].popleft()
+                        if not pending[key]:
+                            del pending[key]
+
+            for alert in alerts:
+                replayed[alert['type']] += 1
+                queue = pending.get((alert['city'], alert['type']))
+                if queue:
+                    queue.popleft()
+                    matched[alert['type']] += 1
+
+        elapsed = time.perf_counter() - started
+        return self._report(rows, ticks, elapsed, replayed, matched, recorded)
+
+    @staticmethod
+    def _report(rows, ticks, elapsed, replayed, matched, recorded):
+        types = sorted(set(replayed) | set(recorded))
+        by_type = {}
+        for alert_type in types:
+            by_type[alert_type] = {
+                'replayed': replayed[alert_type],
+                'recorded': recorded[alert_type],
+                'matched': matched[alert_type],
+                'precision': matched[alert_type] / replayed[alert_type] if replayed[alert_type] else None,
+                'recall': matched[alert_type] / recorded[alert_type] if recorded[alert_type] else None
+            }
+
+        total_replayed = sum(replayed.values())
+        total_recorded = sum(recorded.values())
+        total_matched = sum(matched.values())
+        return {
+            'rows': rows,
+            'ticks': ticks,
+            'elapsed_seconds': elapsed,
+            'rows_per_second': rows / elapsed if elapsed > 0 else 0,
+            'alerts_replayed': total_replayed,
+            'alerts_recorded': total_recorded,
+            'alerts_matched': total_matched,
+            'precision': total_matched / total_replayed if total_replayed else None,
+            'recall': total_matched / total_recorded if total_recorded else None,
+            'by_type': by_type
+        }
+
+
+def _fmt_ratio(value):
+    return f"{value:.1%}" if value is not None else "n/a"
+
+
+def print_report(report):
+    print(f"\n=== Backtest: {report['rows']} rows in {report['ticks']} ticks ===")
+    print(f"Throughput: {report['rows_per_second']:.0f} rows/sec ({report['elapsed_seconds']:.2f}s)")
+    print(f"Alerts: {report['alerts_replayed']} replayed, {report['alerts_recorded']} recorded, "
+          f"{report['alerts_matched']} matched")
+    print(f"Precision: {_fmt_ratio(report['precision'])}  Recall: {_fmt_ratio(report['recall'])}")
+
+    if report['by_type']:
+        print(f"\n{'alert type':<28} {'replayed':>9} {'recorded':>9} {'matched':>8} {'precision':>10} {'recall':>8}")
+        for alert_type, stats in report['by_type'].items():
+            print(f"{alert_type:<28} {stats['replayed']:>9} {stats['recorded']:>9} {stats['matched']:>8} "
+                  f"{_fmt_ratio(stats['precision']):>10} {_fmt_ratio(stats['recall']):>8}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='main.py backtest', description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--from', dest='start', help='first observation date/time (ISO, inclusive)')
+    parser.add_argument('--to', dest='end', help='last observation date/time (ISO, exclusive)')
+    parser.add_argument('--chunk', type=int, default=5000, help='rows fetched per database round trip')
+    parser.add_argument('--archive', metavar='DIR', help='replay archived history from DIR instead of the database')
+    args = parser.parse_args(argv)
+
+    # Keep per-component INFO logging out of the report output
+    logging.getLogger().setLevel(logging.WARNING)
+
+    database = None
+    if args.archive:
+        from archive import ArchiveReader
+        database = ArchiveReader(args.archive, alerts_from=WeatherDatabase())
+    report = Backtester(database=database, chunk_size=args.chunk).run(args.start, args.end)
+    print_report(report)
+    return report
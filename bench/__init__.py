@@ -0,0 +1 @@
+"""Benchmarks for the weather alert pipeline"""
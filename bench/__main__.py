@@ -0,0 +1,343 @@
+"""
+End-to-end benchmark harness with regression tracking
+
+Usage:
+  python -m bench [run] [--scales 10,100,1000,10000] [--repeat 3] [--history bench_history.json]
+  python -m bench compare [BASE] [HEAD] [--threshold 0.10] [--min-delta-ms 5]
+
+`run` appends one entry per invocation to the history file, tagged with the
+current git commit. Each scenario runs --repeat times per scale, on fresh
+databases, and records the median time along with every sample. `compare`
+diffs two entries (default: the last two) and exits non-zero when throughput
+or latency regressed beyond the threshold and the median time also grew by
+at least --min-delta-ms, so millisecond-scale noise at small scales is not
+flagged.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+# Silence app logging; handlers installed here keep setup_logging() from adding its own
+logging.basicConfig(level=logging.CRITICAL, handlers=[logging.NullHandler()])
+
+from alert_system import AlertSystem
+from azure_storage import AzureWeatherStorage
+from database import WeatherDatabase
+from notification_system import NotificationSystem
+from notification_scheduler import NotificationScheduler
+from subscriptions import SEVERITIES, normalize_subscription
+from owm_stub_server import OWMStubServer
+from station_index import StationIndex
+from synthetic_weather import SyntheticWeatherGenerator, make_stations
+from weather_api import WeatherAPI
+from bench.fake_tables import FakeTableServiceClient
+from bench.smtp_sink import SMTPSink
+
+DEFAULT_SCALES = [10, 100, 1000, 10000]
+DEFAULT_HISTORY = 'bench_history.json'
+BENCH_TIME = datetime(2025, 7, 20, 18, 0)  # Monsoon-season evening: alerts fire
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def _timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def _result(items, seconds):
+    return {
+        'items': items,
+        'seconds': seconds,
+        'per_second': items / seconds if seconds else 0.0,
+        'latency_ms': seconds / items * 1000 if items else 0.0
+    }
+
+
+def _median_result(results):
+    """One result for repeated runs: the median time, with every run's time as samples"""
+    samples = [result['seconds'] for result in results]
+    median = dict(results[0])
+    median.update(_result(results[0]['items'], statistics.median(samples)))
+    median['samples'] = samples
+    return median
+
+
+class BenchContext:
+    """Shared fixtures for one scale: stations, observations, stub servers"""
+
+    def __init__(self, scale, seed, stub, sink, tmpdir, max_emails):
+        self.scale = scale
+        self.stations = make_stations(scale, seed=seed)
+        self.station_index = StationIndex(self.stations)
+        self.observations = [SyntheticWeatherGenerator(seed).observation(s, BENCH_TIME) for s in self.stations]
+        self.stub = stub
+        self.sink = sink
+        self.tmpdir = tmpdir
+        self.max_emails = max_emails
+        self.repeat = 0  # index of the current repeat; each gets fresh databases
+
+    def weather_api(self):
+        return WeatherAPI(api_key='bench', base_url=self.stub.url, station_index=self.station_index)
+
+    def alert_system(self):
+        return AlertSystem(station_index=self.station_index)
+
+    def database(self, name):
+        return WeatherDatabase(db_path=os.path.join(self.tmpdir, f"{name}_{self.scale}_{self.repeat}.db"))
+
+    def notification_system(self, recipient='sink@localhost', subscriptions=None):
+        host, port = self.sink.address
+        return NotificationSystem(smtp_server=host, smtp_port=port, use_starttls=False,
+                                  sender='bench@localhost', password='bench', recipient=recipient,
+                                  subscriptions=subscriptions,
+                                  scheduler=NotificationScheduler('bench', provider_limit=None, recipient_limit=None))
+
+    def sample_alerts(self):
+        alerts = self.alert_system().check_alerts(self.observations, now=BENCH_TIME)
+        return alerts[:self.max_emails]
+
+
+def bench_weather_api(ctx):
+    api = ctx.weather_api()
+    data, seconds = _timed(api.get_all_cities_weather)
+    return _result(len(data), seconds)
+
+
+def bench_alert_system(ctx):
+    alert_system = ctx.alert_system()
+    _, seconds = _timed(lambda: alert_system.check_alerts(ctx.observations, now=BENCH_TIME))
+    return _result(len(ctx.observations), seconds)
+
+
+def bench_database(ctx):
+    database = ctx.database('subsystem')
+    alerts = ctx.sample_alerts()
+
+    def store():
+        database.store_weather_data(ctx.observations)
+        for alert in alerts:
+            database.store_alert(alert, email_sent=True, sms_sent=False)
+
+    _, seconds = _timed(store)
+    return _result(len(ctx.observations) + len(alerts), seconds)
+
+
+def bench_azure_storage(ctx):
+    storage = AzureWeatherStorage(table_service=FakeTableServiceClient())
+    alerts = ctx.sample_alerts()
+
+    def store():
+        storage.store_weather_data(ctx.observations)
+        for alert in alerts:
+            storage.store_alert(alert, email_sent=True, sms_sent=False)
+
+    _, seconds = _timed(store)
+    return _result(len(ctx.observations) + len(alerts), seconds)
+
+
+def bench_notification_system(ctx):
+    notification_system = ctx.notification_system()
+    alerts = ctx.sample_alerts()
+    before = ctx.sink.messages
+    _, seconds = _timed(lambda: notification_system.send_alerts(alerts))
+    result = _result(len(alerts), seconds)
+    result['delivered'] = ctx.sink.messages - before
+    return result
+
+
+class _SubscriptionList:
+    """Minimal subscription store: a fixed list"""
+
+    def __init__(self, subscriptions):
+        self.subscriptions = subscriptions
+
+    def get_subscriptions(self):
+        return self.subscriptions
+
+
+def bench_subscribers(ctx):
+    """Route and send sample alerts to 10 subscribers per station, each watching a few nearby cities"""
+    rng = random.Random(f"subscribers:{ctx.scale}")
+    names = [station['name'] for station in ctx.stations]
+    types = sorted({alert['type'] for alert in ctx.sample_alerts()}) or ['dust_storm_warning']
+    subscriptions = [
+        normalize_subscription(f"user{i}@localhost", rng.sample(names, min(3, len(names))),
+                               '*' if rng.random() < 0.5 else rng.sample(types, 1), rng.choice(SEVERITIES))
+        for i in range(10 * ctx.scale)
+    ]
+    notification_system = ctx.notification_system(recipient=None, subscriptions=_SubscriptionList(subscriptions))
+    alerts = ctx.sample_alerts()
+    before_messages, before_recipients = ctx.sink.messages, ctx.sink.recipients
+    _, seconds = _timed(lambda: notification_system.send_alerts(alerts))
+    result = _result(len(alerts), seconds)
+    result['transactions'] = ctx.sink.messages - before_messages
+    result['recipients'] = ctx.sink.recipients - before_recipients
+    return result
+
+
+def bench_pipeline(ctx):
+    from main import WeatherAlertApp
+
+    app = WeatherAlertApp(
+        weather_api=ctx.weather_api(),
+        alert_system=ctx.alert_system(),
+        notification_system=ctx.notification_system(),
+        database=ctx.database('pipeline')
+    )
+    _, seconds = _timed(app.check_weather_and_alerts)
+    return _result(ctx.scale, seconds)
+
+
+SCENARIOS = [
+    ('weather_api', bench_weather_api),
+    ('alert_system', bench_alert_system),
+    ('database', bench_database),
+    ('azure_storage', bench_azure_storage),
+    ('notification_system', bench_notification_system),
+    ('subscribers', bench_subscribers),
+    ('pipeline', bench_pipeline),
+]
+
+
+def run(args):
+    scales = [int(scale) for scale in args.scales.split(',')]
+    selected = set(args.only.split(',')) if args.only else None
+    entry = {
+        'commit': _git_commit(),
+        'timestamp': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'seed': args.seed,
+        'repeat': args.repeat,
+        'results': {}
+    }
+
+    # Clock the stub at the benchmark time so fetched data matches BENCH_TIME
+    with OWMStubServer(seed=args.seed, latency_ms=args.latency_ms, clock=lambda: BENCH_TIME) as stub, \
+            SMTPSink() as sink, tempfile.TemporaryDirectory() as tmpdir:
+        for scale in scales:
+            ctx = BenchContext(scale, args.seed, stub, sink, tmpdir, args.max_emails)
+            for name, scenario in SCENARIOS:
+                if selected and name not in selected:
+                    continue
+                results = []
+                for repeat in range(args.repeat):
+                    ctx.repeat = repeat
+                    results.append(scenario(ctx))
+                result = _median_result(results)
+                key = f"{name}@{scale}"
+                entry['results'][key] = result
+                print(f"{key:<28} {result['items']:>7} items {result['seconds']:>9.3f}s "
+                      f"{result['per_second']:>11.0f}/s {result['latency_ms']:>9.3f} ms/item", flush=True)
+
+    history = load_history(args.history)
+    history.append(entry)
+    with open(args.history, 'w') as f:
+        json.dump(history, f, indent=2)
+    print(f"Recorded run for commit {entry['commit']} in {args.history}")
+    return 0
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return json.load(f)
+
+
+def _find_entry(history, ref, default_index):
+    if ref is None:
+        return history[default_index]
+    for entry in reversed(history):
+        if entry['commit'].startswith(ref):
+            return entry
+    raise SystemExit(f"No benchmark run recorded for commit {ref}")
+
+
+def compare(args):
+    history = load_history(args.history)
+    if len(history) < 2 and not (args.base and args.head):
+        print("Need at least two recorded runs to compare")
+        return 1
+
+    base = _find_entry(history, args.base, -2)
+    head = _find_entry(history, args.head, -1)
+    print(f"Comparing {base['commit']} ({base['timestamp']}) -> {head['commit']} ({head['timestamp']})")
+    print(f"{'scenario':<28} {'base /s':>11} {'head /s':>11} {'change':>8}  {'base ms':>9} {'head ms':>9} {'change':>8}")
+
+    regressions = []
+    min_delta = args.min_delta_ms / 1000
+    for key in sorted(set(base['results']) & set(head['results'])):
+        b, h = base['results'][key], head['results'][key]
+        throughput_change = (h['per_second'] - b['per_second']) / b['per_second'] if b['per_second'] else 0.0
+        latency_change = (h['latency_ms'] - b['latency_ms']) / b['latency_ms'] if b['latency_ms'] else 0.0
+
+        flag = ''
+        if throughput_change < -args.threshold or latency_change > args.threshold:
+            if h['seconds'] - b['seconds'] >= min_delta:
+                flag = '  REGRESSION'
+                regressions.append(key)
+            else:
+                flag = '  (within noise)'
+        print(f"{key:<28} {b['per_second']:>11.0f} {h['per_second']:>11.0f} {throughput_change:>+8.1%}  "
+              f"{b['latency_ms']:>9.3f} {h['latency_ms']:>9.3f} {latency_change:>+8.1%}{flag}")
+
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%} and {args.min_delta_ms:g} ms: "
+              f"{', '.join(regressions)}")
+        return 1
+    print(f"\nNo regressions beyond {args.threshold:.0%} and {args.min_delta_ms:g} ms")
+    return 0
+
+
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--history', default=DEFAULT_HISTORY, help='JSON file of recorded runs')
+
+    parser = argparse.ArgumentParser(prog='python -m bench', description='Weather alert pipeline benchmarks')
+    subparsers = parser.add_subparsers(dest='command')
+
+    run_parser = subparsers.add_parser('run', parents=[common], help='run benchmarks and record the results')
+    run_parser.add_argument('--scales', default=','.join(str(s) for s in DEFAULT_SCALES))
+    run_parser.add_argument('--only', help='comma-separated scenario names')
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--latency-ms', type=float, default=0, help='stub upstream latency')
+    run_parser.add_argument('--max-emails', type=int, default=500, help='cap on alerts sent per scale')
+    run_parser.add_argument('--repeat', type=int, default=3, help='runs per scenario and scale; the median is kept')
+
+    compare_parser = subparsers.add_parser('compare', parents=[common],
+                                           help='flag regressions between two recorded runs')
+    compare_parser.add_argument('base', nargs='?', help='base commit (default: second-to-last run)')
+    compare_parser.add_argument('head', nargs='?', help='head commit (default: last run)')
+    compare_parser.add_argument('--threshold', type=float, default=0.10, help='allowed relative change')
+    compare_parser.add_argument('--min-delta-ms', type=float, default=5.0,
+                                help='smallest growth in median time flagged as a regression')
+
+    # `run` is the default command
+    if not argv or argv[0] not in ('run', 'compare', '-h', '--help'):
+        argv.insert(0, 'run')
+    args = parser.parse_args(argv)
+
+    return compare(args) if args.command == 'compare' else run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,50 @@
+"""
+Derived-metrics benchmark: one vectorized pass vs. row by row
+
+Usage: python -m bench.derived [observation_count ...]
+"""
+
+import random
+import sys
+import time
+from derived_metrics import DERIVED_FIELDS, add_derived_metrics, numpy
+
+
+def make_observations(count, seed=7):
+    rng = random.Random(seed)
+    return [{'temperature': rng.uniform(60, 120), 'humidity': rng.randint(2, 95)} for _ in range(count)]
+
+
+def timed(observations, vectorized):
+    start = time.perf_counter()
+    add_derived_metrics(observations, vectorized=vectorized)
+    return time.perf_counter() - start
+
+
+def run(count):
+    rows = make_observations(count)
+    vectorized_rows = make_observations(count)
+    results = {'observations': count, 'rows_ms': timed(rows, False) * 1000, 'vectorized_ms': None}
+    if numpy is not None:
+        results['vectorized_ms'] = timed(vectorized_rows, True) * 1000
+        # Sanity check: both paths must agree
+        mismatches = sum(1 for a, b in zip(rows, vectorized_rows)
+                         if any(abs(a[field] - b[field]) > 0.1 for field in DERIVED_FIELDS))
+        assert not mismatches, f"{mismatches} observations differ between the two paths"
+    return results
+
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [100000]
+    print(f"{'observations':>12} {'rows ms':>9} {'numpy ms':>9} {'speedup':>8}")
+    for count in counts:
+        r = run(count)
+        if r['vectorized_ms'] is None:
+            print(f"{r['observations']:>12} {r['rows_ms']:>9.1f} {'-':>9} {'-':>8}  (numpy not installed)")
+        else:
+            print(f"{r['observations']:>12} {r['rows_ms']:>9.1f} {r['vectorized_ms']:>9.1f} "
+                  f"{r['rows_ms'] / r['vectorized_ms']:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
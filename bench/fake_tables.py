@@ -0,0 +1,139 @@
+"""In-memory stand-in for azure.data.tables used to benchmark AzureWeatherStorage"""
+
+import re
+from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
+
+_PARTITION_FILTER = re.compile(r"PartitionKey eq '((?:[^']|'')*)'")
+_ROW_KEY_FILTER = re.compile(r"RowKey ge '((?:[^']|'')*)'")
+_ROW_KEY_UPPER_FILTER = re.compile(r"RowKey lt '((?:[^']|'')*)'")
+
+
+class FakePageIterator:
+    """Mimics PageIterator: yields pages and exposes the next continuation token"""
+
+    def __init__(self, entities, per_page, continuation_token):
+        self._entities = entities
+        self._per_page = per_page
+        self._start = int(continuation_token or 0)
+        self.continuation_token = continuation_token
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._start >= len(self._entities):
+            raise StopIteration
+        end = self._start + self._per_page
+        page = self._entities[self._start:end]
+        self._start = end
+        self.continuation_token = end if end < len(self._entities) else None
+        return iter(page)
+
+
+class FakePagedEntities:
+    """Mimics ItemPaged: iterable, with by_page() for paged access"""
+
+    def __init__(self, entities, results_per_page=None):
+        self._entities = entities
+        self._per_page = results_per_page or 1000
+
+    def __iter__(self):
+        return iter(self._entities)
+
+    def by_page(self, continuation_token=None):
+        return FakePageIterator(self._entities, self._per_page, continuation_token)
+
+
+class FakeTableClient:
+    """Holds entities keyed by (PartitionKey, RowKey)"""
+
+    def __init__(self, name):
+        self.table_name = name
+        self.entities = {}
+        self.operations = 0
+
+    def _key(self, entity):
+        return (entity['PartitionKey'], entity['RowKey'])
+
+    def create_entity(self, entity):
+        self.operations += 1
+        key = self._key(entity)
+        if key in self.entities:
+            raise ResourceExistsError("The specified entity already exists.")
+        self.entities[key] = dict(entity)
+        return {}
+
+    def upsert_entity(self, entity, mode=None):
+        self.operations += 1
+        key = self._key(entity)
+        if mode is not None and str(mode).lower().endswith('merge') and key in self.entities:
+            self.entities[key].update(entity)
+        else:
+            self.entities[key] = dict(entity)
+        return {}
+
+    def get_entity(self, partition_key, row_key):
+        self.operations += 1
+        try:
+            return dict(self.entities[(partition_key, row_key)])
+        except KeyError:
+            raise ResourceNotFoundError("The specified resource does not exist.")
+
+    def delete_entity(self, partition_key, row_key):
+        self.operations += 1
+        self.entities.pop((partition_key, row_key), None)
+
+    def submit_transaction(self, operations):
+        for operation in operations:
+            action, entity = operation[0], operation[1]
+            if action == 'create':
+                self.create_entity(entity)
+            elif action == 'upsert':
+                self.upsert_entity(entity)
+            elif action == 'delete':
+                self.delete_entity(entity['PartitionKey'], entity['RowKey'])
+        return []
+
+    def query_entities(self, query_filter, results_per_page=None, select=None, **kwargs):
+        """Supports PartitionKey equality and RowKey ge/lt bounds; other clauses are ignored"""
+        self.operations += 1
+        partition = self._literal(_PARTITION_FILTER, query_filter)
+        row_key = self._literal(_ROW_KEY_FILTER, query_filter)
+        row_key_upper = self._literal(_ROW_KEY_UPPER_FILTER, query_filter)
+
+        results = []
+        for (pk, rk), entity in sorted(self.entities.items()):
+            if ((partition is None or pk == partition) and (row_key is None or rk >= row_key)
+                    and (row_key_upper is None or rk < row_key_upper)):
+                results.append(self._project(entity, select))
+        return FakePagedEntities(results, results_per_page)
+
+    def list_entities(self, results_per_page=None, select=None, **kwargs):
+        self.operations += 1
+        results = [self._project(entity, select) for _, entity in sorted(self.entities.items())]
+        return FakePagedEntities(results, results_per_page)
+
+    @staticmethod
+    def _literal(pattern, query_filter):
+        match = pattern.search(query_filter or '')
+        return match.group(1).replace("''", "'") if match else None
+
+    @staticmethod
+    def _project(entity, select):
+        if not select:
+            return dict(entity)
+        return {key: entity[key] for key in select if key in entity}
+
+
+class FakeTableServiceClient:
+    def __init__(self):
+        self.tables = {}
+
+    def create_table(self, table_name):
+        if table_name in self.tables:
+            raise ResourceExistsError("The table specified already exists.")
+        self.tables[table_name] = FakeTableClient(table_name)
+        return self.tables[table_name]
+
+    def get_table_client(self, table_name):
+        return self.tables.setdefault(table_name, FakeTableClient(table_name))
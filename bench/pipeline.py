@@ -0,0 +1,127 @@
+"""
+Pipeline benchmark over synthetic stations: fetch, evaluate, store and notify
+
+Usage: python -m bench.pipeline [--stations 1000] [--ticks 24] [--fetch-stations 200]
+                                [--latency-ms 0] [--error-rate 0] [--seed 0]
+"""
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from alert_system import AlertSystem
+from database import WeatherDatabase
+from notification_system import NotificationSystem
+from owm_stub_server import OWMStubServer
+from station_index import StationIndex
+from synthetic_weather import SyntheticWeatherGenerator, make_stations
+from weather_api import WeatherAPI
+
+
+class StageTimer:
+    """Accumulates item counts and wall time per stage"""
+
+    def __init__(self):
+        self.stages = {}
+
+    def record(self, stage, items, seconds):
+        total = self.stages.setdefault(stage, {'items': 0, 'seconds': 0.0})
+        total['items'] += items
+        total['seconds'] += seconds
+
+    def results(self):
+        return {
+            stage: {**total, 'per_second': total['items'] / total['seconds'] if total['seconds'] else 0}
+            for stage, total in self.stages.items()
+        }
+
+
+def bench_fetch(timer, stations, seed, latency_ms, error_rate):
+    """Fetch through WeatherAPI against the local stub server"""
+    with OWMStubServer(seed=seed, latency_ms=latency_ms, error_rate=error_rate) as stub:
+        api = WeatherAPI(api_key='bench', base_url=stub.url)
+        start = time.perf_counter()
+        results = api.get_batch_weather(stations)
+        timer.record('fetch', len(results), time.perf_counter() - start)
+        return stub.requests, stub.errors
+
+
+def bench_ticks(timer, stations, ticks, start_time, interval, seed):
+    """Generate, evaluate, store and render notifications tick by tick"""
+    generator = SyntheticWeatherGenerator(seed=seed)
+    alert_system = AlertSystem(station_index=StationIndex(stations))
+    notification_system = NotificationSystem()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        database = WeatherDatabase(db_path=os.path.join(tmpdir, 'bench.db'))
+        total_alerts = 0
+
+        ticks_iter = generator.generate(stations, ticks, start_time, interval)
+        while True:
+            start = time.perf_counter()
+            tick = next(ticks_iter, None)
+            if tick is None:
+                break
+            when, observations = tick
+            timer.record('generate', len(observations), time.perf_counter() - start)
+
+            start = time.perf_counter()
+            alerts = alert_system.check_alerts(observations, now=when)
+            timer.record('evaluate', len(observations), time.perf_counter() - start)
+
+            start = time.perf_counter()
+            database.store_weather_data(observations)
+            for alert in alerts:
+                database.store_alert(alert, email_sent=True, sms_sent=False)
+            timer.record('store', len(observations) + len(alerts), time.perf_counter() - start)
+
+            # Notification cost without a transport: build the full MIME message
+            start = time.perf_counter()
+            for alert in alerts:
+                msg = MIMEMultipart()
+                msg['Subject'] = f"Arizona Weather Alert - {alert['severity']} - {alert['city']}"
+                msg.attach(MIMEText(notification_system._create_email_body(alert), 'html'))
+                msg.as_string()
+            timer.record('notify', len(alerts), time.perf_counter() - start)
+            total_alerts += len(alerts)
+
+    return total_alerts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m bench.pipeline', description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--stations', type=int, default=1000)
+    parser.add_argument('--ticks', type=int, default=24)
+    parser.add_argument('--interval-minutes', type=int, default=60)
+    parser.add_argument('--start', default='2025-07-20T00:00', help='first tick (ISO); monsoon season by default')
+    parser.add_argument('--fetch-stations', type=int, default=200, help='stations fetched over HTTP from the stub')
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.CRITICAL)
+    logging.getLogger().setLevel(logging.CRITICAL)
+
+    stations = make_stations(args.stations, seed=args.seed)
+    timer = StageTimer()
+
+    requests_served, errors = bench_fetch(timer, stations[:args.fetch_stations], args.seed,
+                                          args.latency_ms, args.error_rate)
+    alerts = bench_ticks(timer, stations, args.ticks, datetime.fromisoformat(args.start),
+                         timedelta(minutes=args.interval_minutes), args.seed)
+
+    print(f"{args.stations} stations x {args.ticks} ticks, seed {args.seed}: {alerts} alerts, "
+          f"{requests_served} stub requests ({errors} injected errors)")
+    print(f"{'stage':<10} {'items':>9} {'seconds':>9} {'items/sec':>11}")
+    for stage, result in timer.results().items():
+        print(f"{stage:<10} {result['items']:>9} {result['seconds']:>9.3f} {result['per_second']:>11.0f}")
+    return timer.results()
+
+
+if __name__ == "__main__":
+    main()
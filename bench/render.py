@@ -0,0 +1,87 @@
+"""
+Alert rendering benchmark: message and email throughput at thousands of alerts
+
+Usage: python -m bench.render [station_count ...]
+
+"cold" renders every email from scratch; "tick" shares renderings within a
+tick the way NotificationSystem.send_alerts does; "mime" adds building the
+multipart/alternative message.
+"""
+
+import logging
+import sys
+import time
+from datetime import datetime
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+logging.basicConfig(level=logging.CRITICAL, handlers=[logging.NullHandler()])
+
+from alert_system import AlertSystem
+from alert_templates import EmailRenderer
+from station_index import StationIndex
+from synthetic_weather import SyntheticWeatherGenerator, make_stations
+
+BENCH_TIME = datetime(2025, 7, 20, 18, 0)
+
+
+def per_second(count, func):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    return count / elapsed if elapsed else 0.0
+
+
+def run(count, seed=0):
+    stations = make_stations(count, seed=seed)
+    alert_system = AlertSystem(station_index=StationIndex(stations))
+    observations = [SyntheticWeatherGenerator(seed).observation(s, BENCH_TIME) for s in stations]
+    alerts = alert_system.check_alerts(observations, now=BENCH_TIME)
+    renderer = EmailRenderer()
+
+    def messages():
+        render = alert_system.messages.render
+        for data in observations:
+            render('extreme_heat_evening', data)
+
+    def cold():
+        for alert in alerts:
+            renderer.new_tick()
+            renderer.render(alert)
+
+    def tick():
+        renderer.new_tick()
+        for alert in alerts:
+            renderer.render(alert)
+
+    def mime():
+        renderer.new_tick()
+        for alert in alerts:
+            subject, html_body, text_body = renderer.render(alert)
+            msg = MIMEMultipart('alternative')
+            msg['Subject'] = subject
+            msg.attach(MIMEText(text_body, 'plain', 'utf-8'))
+            msg.attach(MIMEText(html_body, 'html', 'utf-8'))
+            msg.as_string()
+
+    return {
+        'stations': count,
+        'alerts': len(alerts),
+        'messages_per_s': per_second(len(observations), messages),
+        'cold_per_s': per_second(len(alerts), cold),
+        'tick_per_s': per_second(len(alerts), tick),
+        'mime_per_s': per_second(len(alerts), mime),
+    }
+
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [1000, 10000]
+    print(f"{'stations':>9} {'alerts':>7} {'messages/s':>11} {'cold/s':>9} {'tick/s':>9} {'mime/s':>8}")
+    for count in counts:
+        r = run(count)
+        print(f"{r['stations']:>9} {r['alerts']:>7} {r['messages_per_s']:>11.0f} {r['cold_per_s']:>9.0f} "
+              f"{r['tick_per_s']:>9.0f} {r['mime_per_s']:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Local SMTP sink that accepts and counts messages without delivering them"""
+
+import socketserver
+import threading
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    disable_nagle_algorithm = True
+
+    def _reply(self, line):
+        self.wfile.write(line.encode('ascii') + b'\r\n')
+
+    def handle(self):
+        sink = self.server.sink
+        self._reply('220 localhost SMTP sink ready')
+        recipients = 0
+
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('utf-8', 'replace').strip()
+            verb = command.split(' ', 1)[0].upper()
+
+            if verb in ('EHLO', 'HELO'):
+                self.wfile.write(b'250-localhost\r\n250-AUTH PLAIN LOGIN\r\n250 8BITMIME\r\n')
+            elif verb == 'AUTH':
+                self._reply('235 2.7.0 Authentication successful')
+            elif verb == 'MAIL':
+                recipients = 0
+                self._reply('250 OK')
+            elif verb == 'RCPT':
+                recipients += 1
+                self._reply('250 OK')
+            elif verb == 'DATA':
+                self._reply('354 End data with <CR><LF>.<CR><LF>')
+                size = 0
+                while True:
+                    data_line = self.rfile.readline()
+                    if not data_line or data_line == b'.\r\n':
+                        break
+                    size += len(data_line)
+                sink.record(recipients, size)
+                self._reply('250 OK: queued')
+            elif verb in ('RSET', 'NOOP'):
+                self._reply('250 OK')
+            elif verb == 'QUIT':
+                self._reply('221 Bye')
+                return
+            else:
+                self._reply('502 Command not implemented')
+
+
+class _ThreadingSMTPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SMTPSink:
+    """Threaded SMTP server for benchmarking NotificationSystem without sending mail"""
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.server = _ThreadingSMTPServer((host, port), _SMTPHandler)
+        self.server.sink = self
+        self.messages = 0
+        self.recipients = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def address(self):
+        return self.server.server_address[:2]
+
+    def record(self, recipients, size):
+        with self._lock:
+            self.messages += 1
+            self.recipients += recipients
+            self.bytes += size
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
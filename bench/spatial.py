@@ -0,0 +1,66 @@
+"""
+Station index benchmark: grid index vs. linear scan at 10k+ stations
+
+Usage: python -m bench.spatial [station_count ...]
+"""
+
+import random
+import sys
+import time
+from station_index import StationIndex, haversine_miles
+from synthetic_weather import AZ_LAT, AZ_LON, make_stations
+
+
+def linear_nearest(stations, lat, lon):
+    return min(stations, key=lambda s: haversine_miles(lat, lon, s['lat'], s['lon']))
+
+
+def linear_within(stations, lat, lon, miles):
+    return [s for s in stations if haversine_miles(lat, lon, s['lat'], s['lon']) <= miles]
+
+
+def timed(func, queries):
+    start = time.perf_counter()
+    for lat, lon in queries:
+        func(lat, lon)
+    return (time.perf_counter() - start) / len(queries)
+
+
+def run(count, query_count=200, radius=30):
+    stations = make_stations(count)
+    rng = random.Random(7)
+    queries = [(rng.uniform(*AZ_LAT), rng.uniform(*AZ_LON)) for _ in range(query_count)]
+
+    start = time.perf_counter()
+    index = StationIndex(stations)
+    build = time.perf_counter() - start
+
+    results = {
+        'stations': count,
+        'build_ms': build * 1000,
+        'nearest_index_us': timed(lambda lat, lon: index.nearest(lat, lon), queries) * 1e6,
+        'nearest_linear_us': timed(lambda lat, lon: linear_nearest(stations, lat, lon), queries) * 1e6,
+        'radius_index_us': timed(lambda lat, lon: index.within_radius(lat, lon, radius), queries) * 1e6,
+        'radius_linear_us': timed(lambda lat, lon: linear_within(stations, lat, lon, radius), queries) * 1e6,
+    }
+
+    # Sanity check: the index must agree with the linear scan
+    for lat, lon in queries[:20]:
+        assert index.nearest(lat, lon)[0][1] is linear_nearest(stations, lat, lon)
+        assert len(index.within_radius(lat, lon, radius)) == len(linear_within(stations, lat, lon, radius))
+
+    return results
+
+
+def main():
+    counts = [int(arg) for arg in sys.argv[1:]] or [10000, 50000]
+    print(f"{'stations':>9} {'build ms':>9} {'nearest idx':>12} {'nearest scan':>13} "
+          f"{'radius idx':>11} {'radius scan':>12}  (us/query)")
+    for count in counts:
+        r = run(count)
+        print(f"{r['stations']:>9} {r['build_ms']:>9.1f} {r['nearest_index_us']:>12.1f} "
+              f"{r['nearest_linear_us']:>13.1f} {r['radius_index_us']:>11.1f} {r['radius_linear_us']:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
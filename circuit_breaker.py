@@ -0,0 +1,101 @@
+import threading
+import time
+from datetime import datetime
+from config import CIRCUIT_BREAKER_FAILURE_THRESHOLD, CIRCUIT_BREAKER_RESET_SECONDS
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """Stops calling an upstream after consecutive failures
+
+    After `failure_threshold` failures in a row the breaker opens and allow()
+    returns False until `reset_timeout` seconds pass. Then it is half-open:
+    one probe request goes through, and its outcome closes or re-opens it.
+    """
+
+    def __init__(self, name, failure_threshold=CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout=CIRCUIT_BREAKER_RESET_SECONDS, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = CLOSED
+        self._lock = threading.Lock()
+        self._opened_at = None
+        self._probing = False
+        self.consecutive_failures = 0
+        self.successes = 0
+        self.failures = 0
+        self.short_circuited = 0
+        self.times_opened = 0
+        self.last_error = None
+        self.last_opened = None
+        self.last_latency_ms = None
+        self.avg_latency_ms = None  # exponentially weighted, alpha 0.2
+
+    def allow(self):
+        """Whether a request may go upstream now"""
+        with self._lock:
+            if self.state == OPEN and self.clock() - self._opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self._probing = False
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self.short_circuited += 1
+            return False
+
+    def record_success(self, seconds=None):
+        with self._lock:
+            self._record_latency(seconds)
+            self.successes += 1
+            self.consecutive_failures = 0
+            self.state = CLOSED
+            self._probing = False
+
+    def record_failure(self, error=None, seconds=None):
+        with self._lock:
+            self._record_latency(seconds)
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.last_error = str(error) if error is not None else None
+            if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.times_opened += 1
+                    self.last_opened = datetime.utcnow().isoformat()
+                self.state = OPEN
+                self._opened_at = self.clock()
+                self._probing = False
+
+    def _record_latency(self, seconds):
+        if seconds is None:
+            return
+        self.last_latency_ms = seconds * 1000
+        if self.avg_latency_ms is None:
+            self.avg_latency_ms = self.last_latency_ms
+        else:
+            self.avg_latency_ms += 0.2 * (self.last_latency_ms - self.avg_latency_ms)
+
+    def metrics(self):
+        with self._lock:
+            retry_in = None
+            if self.state == OPEN:
+                retry_in = max(0.0, self.reset_timeout - (self.clock() - self._opened_at))
+            return {
+                'state': self.state,
+                'consecutive_failures': self.consecutive_failures,
+                'successes': self.successes,
+                'failures': self.failures,
+                'short_circuited': self.short_circuited,
+                'times_opened': self.times_opened,
+                'last_opened': self.last_opened,
+                'retry_in_seconds': retry_in,
+                'last_error': self.last_error,
+                'last_latency_ms': self.last_latency_ms,
+                'avg_latency_ms': self.avg_latency_ms
+            }
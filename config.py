@@ -1,26 +1,102 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()
 
 # Weather API Configuration (using OpenWeatherMap - free tier)
 WEATHER_API_KEY = os.getenv('OPENWEATHER_API_KEY')
-WEATHER_API_URL = "http://api.openweathermap.org/data/2.5/weather"
+WEATHER_API_URL = os.getenv('WEATHER_API_URL', "http://api.openweathermap.org/data/2.5/weather")
+WEATHER_API_TIMEOUT = float(os.getenv('WEATHER_API_TIMEOUT', '10'))  # seconds
+WEATHER_FORECAST_URL = os.getenv('WEATHER_FORECAST_URL')  # None: /forecast next to WEATHER_API_URL
 
-# Arizona cities to monitor (you can modify this list)
-CITIES = [
-    {"name": "Phoenix", "lat": 33.4484, "lon": -112.0740},
-    {"name": "Tucson", "lat": 32.2226, "lon": -110.9747},
-    {"name": "Scottsdale", "lat": 33.4942, "lon": -111.9261},
-    {"name": "Mesa", "lat": 33.4152, "lon": -111.8315}
-]
+# Weather providers in priority order: openweathermap, nws (api.weather.gov)
+WEATHER_PROVIDERS = os.getenv('WEATHER_PROVIDERS', "openweathermap").split(',')
+NWS_API_URL = os.getenv('NWS_API_URL', "https://api.weather.gov")
+NWS_USER_AGENT = os.getenv('NWS_USER_AGENT', "(arizona-weather-alerts, weather-alerts@example.com)")  # NWS asks for contact info
+
+# Hedged requests: if the primary provider has not answered within its recent
+# p95 latency, ask the next provider too and take whichever answers first
+WEATHER_HEDGE_ENABLED = os.getenv('WEATHER_HEDGE', 'false').lower() == 'true'
+HEDGE_PERCENTILE = 95
+HEDGE_MIN_SAMPLES = 20  # responses needed before the percentile is trusted
+HEDGE_DEFAULT_DELAY = 1.0  # seconds, until then
+HEDGE_MIN_DELAY = 0.05  # seconds, floor so a fast primary isn't hedged on jitter
+HEDGE_MAX_WORKERS = 16
+PROVIDER_LATENCY_WINDOW = 200  # recent responses per provider
+
+# Forecast ("expected") alerts from the OpenWeatherMap 3-hourly forecast (forecast.py)
+FORECAST_ENABLED = os.getenv('FORECASTS', 'false').lower() == 'true'
+FORECAST_ISSUE_HOURS = 3  # forecasts are refetched once per issue cycle
+FORECAST_HORIZON_HOURS = 48  # lead time considered
+FORECAST_REALERT_HOURS = 6  # a new expected time this far from the last one is alerted again
+
+# Synthetic weather (see synthetic_weather.py) stands in for the API only when
+# enabled; it is never used as a silent fallback for a failing upstream
+MOCK_WEATHER_ENABLED = os.getenv('MOCK_WEATHER', 'false').lower() == 'true'
+MOCK_WEATHER_SEED = int(os.getenv('MOCK_WEATHER_SEED', '0'))
+
+# Upstream failure handling
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = 5  # consecutive failures before requests stop
+CIRCUIT_BREAKER_RESET_SECONDS = 60  # wait before a half-open probe request
+STALE_MAX_AGE_SECONDS = 3 * 3600  # last-known-good readings served while the upstream is down
+
+# Ingestion: repeated provider observations (same station and 'dt') are never
+# stored or evaluated twice; the optional dead band also skips storing
+# observations that barely changed (see ingestion.py)
+INGEST_DEADBAND_ENABLED = os.getenv('INGEST_DEADBAND', 'false').lower() == 'true'
+INGEST_DEADBAND_TOLERANCES = {
+    "temperature": 0.5,  # °F
+    "feels_like": 0.5,  # °F
+    "humidity": 2,  # %
+    "pressure": 1,  # hPa
+    "wind_speed": 1,  # mph
+    "visibility": 0.25,  # miles
+    "rain_1h": 0.01  # inches
+}
+INGEST_DEADBAND_MAX_SECONDS = 3600  # store at least one observation per station this often
+
+# Time zone of stations without their own "tz" entry (IANA name)
+DEFAULT_TIMEZONE = os.getenv('WEATHER_TIMEZONE', "America/Phoenix")
+
+# Station registry (see station_registry.py): CSV, JSON or SQLite file of
+# monitored stations with coordinates, time zones, provider IDs and threshold overrides
+STATION_REGISTRY_PATH = os.getenv('STATION_REGISTRY',
+                                  os.path.join(os.path.dirname(os.path.abspath(__file__)), "stations.csv"))
+STATION_REGISTRY_CHECK_SECONDS = 30  # how often the file is checked for changes
+
+# Shared-memory latest table (see shared_latest.py): `schedule`/`serve` publish the
+# latest observation and alert state per station for other local processes
+SHARED_LATEST_ENABLED = os.getenv('SHARED_LATEST', 'false').lower() == 'true'
+SHARED_LATEST_PATH = os.getenv('SHARED_LATEST_PATH', os.path.join(
+    '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(), 'arizona-weather-latest'))
+SHARED_LATEST_CAPACITY = 1024  # station slots; more if the registry is larger when the writer starts
+SHARED_LATEST_MAX_AGE_SECONDS = 2 * 3600  # readers fall back to the database when not published since
+
+# Spatial station index
+STATION_INDEX_CELL_DEGREES = None  # grid cell size in degrees, None sizes it to station density
+WEATHER_FETCH_BATCH_SIZE = int(os.getenv('WEATHER_FETCH_BATCH_SIZE', '50'))
 
 # Email Configuration
-EMAIL_SMTP_SERVER = "smtp.gmail.com"
-EMAIL_SMTP_PORT = 587
+EMAIL_SMTP_SERVER = os.getenv('EMAIL_SMTP_SERVER', "smtp.gmail.com")
+EMAIL_SMTP_PORT = int(os.getenv('EMAIL_SMTP_PORT', '587'))
+EMAIL_SMTP_STARTTLS = os.getenv('EMAIL_SMTP_STARTTLS', 'true').lower() != 'false'
 EMAIL_ADDRESS = os.getenv('EMAIL_ADDRESS')
 EMAIL_PASSWORD = os.getenv('EMAIL_APP_PASSWORD')  
-RECIPIENT_EMAIL = os.getenv('RECIPIENT_EMAIL')
+RECIPIENT_EMAIL = os.getenv('RECIPIENT_EMAIL')  # optional: receives every alert, besides subscribers
+SMTP_MAX_RECIPIENTS = 100  # RCPT TO per SMTP transaction; larger groups are split
+
+# Notification scheduling (see notification_scheduler.py): alerts go out by
+# severity within token-bucket limits; the rest waits for the next check.
+# Limits are (rate per hour, burst); None means unlimited.
+NOTIFY_PROVIDER_LIMITS = {
+    "smtp.gmail.com": (80, 100),  # recipients; Workspace accounts allow ~2000 a day
+}
+NOTIFY_DEFAULT_PROVIDER_LIMIT = (600, 100)  # recipients, for other SMTP servers
+NOTIFY_RECIPIENT_LIMIT = (6, 10)  # emails per recipient
+NOTIFY_LIMIT_EXEMPT_SEVERITY = 'CRITICAL'  # this severity ignores the per-recipient limit
+NOTIFY_MAX_WAIT_SECONDS = float(os.getenv('NOTIFY_MAX_WAIT_SECONDS', '5'))  # wait for provider tokens within a check
+NOTIFY_DEFERRED_MAX_AGE_SECONDS = 3600  # deferred alerts older than this are dropped
 
 # SMS Configuration - DISABLED
 # SMS notifications have been removed per user request
@@ -55,12 +131,78 @@ ALERT_TRIGGERS = {
             "rain_threshold": 0.5,  # inches per hour
             "wind_speed_min": 20  # mph
         }
+    },
+    "rapid_heat_rise": {
+        "description": "Temperature rising sharply within a short window",
+        "conditions": {
+            "temp_rise_min": 8,  # Fahrenheit above the window minimum
+            "window_minutes": 30
+        }
+    },
+    "visibility_collapse": {
+        "description": "Visibility collapsing quickly (early dust storm signal)",
+        "conditions": {
+            "visibility_drop_min": 4,  # miles below the window maximum
+            "visibility_max": 3,  # miles
+            "window_minutes": 30
+        }
+    },
+    "heat_stress": {
+        "description": "Heat index or wet-bulb globe temperature in the danger range",
+        "conditions": {
+            "heat_index_min": 105,  # Fahrenheit, NWS "Danger"
+            "wbgt_min": 90  # Fahrenheit, black flag: suspend strenuous outdoor activity
+        }
     }
 }
 
+# Trend windows backing rate-of-change triggers
+TREND_MAX_SAMPLES = 720  # per city and field, bounds memory for fast timers
+
+# Regional alert propagation: alert type -> radius (miles) of monitored
+# stations that also get notified when the alert fires nearby
+REGIONAL_ALERT_RADIUS_MILES = {
+    "dust_storm_warning": 30,
+    "monsoon_alert": 15
+}
+
+# weather/status HTTP endpoint
+STATUS_DEFAULT_LIMIT = 100
+STATUS_MAX_LIMIT = 1000
+STATUS_CACHE_MAX_AGE = 60  # seconds; the timer writes every 2 minutes
+
+# Read-through cache for storage queries (per process, invalidated on write)
+QUERY_CACHE_MAX_ENTRIES = 256
+QUERY_CACHE_MAX_ROWS = 100000  # total cached rows across entries
+QUERY_CACHE_TTL_SECONDS = 300  # bounds staleness from time windows and other writers
+
+# Latest conditions view (one row per city, upserted on every write)
+LATEST_CONDITIONS_READINGS = 6  # recent readings kept inline, newest first
+
 # Database
 DATABASE_PATH = "weather_history.db"
 
+# Archival of old weather history (python main.py archive)
+ARCHIVE_DIR = os.getenv('ARCHIVE_DIR', "archive")
+ARCHIVE_FORMAT = os.getenv('ARCHIVE_FORMAT')  # parquet or csv; None picks parquet when pyarrow is installed
+ARCHIVE_BUFFER_ROWS = 100000  # rows held in memory before partitions are flushed to files
+
 # Logging
 LOG_LEVEL = "INFO"
 LOG_FILE = "weather_alerts.log"
+LOG_FORMAT = os.getenv('LOG_FORMAT', "text")  # text or json (one object per line)
+LOG_RATE_LIMIT_BURST = 50  # lines per message template per interval before sampling starts
+LOG_RATE_LIMIT_INTERVAL = 60  # seconds
+LOG_SAMPLE_EVERY = 100  # past the burst, keep one line in this many
+
+# Profiling (profiling.py): PROFILE=true or `python main.py once --profile`
+PROFILE_ENABLED = os.getenv('PROFILE', 'false').lower() == 'true'
+PROFILE_DIR = os.getenv('PROFILE_DIR', "profiles")  # on Azure Functions use a writable path, e.g. /tmp/profiles
+PROFILE_TOP_ALLOCATIONS = 20  # allocation sites listed per stage
+PROFILE_TRACEMALLOC_FRAMES = 1  # frames kept per allocation; more is slower
+
+# Async service mode (python main.py serve)
+SERVICE_INTERVAL_SECONDS = int(os.getenv('SERVICE_INTERVAL_SECONDS', '3600'))
+SERVICE_FETCH_CONCURRENCY = int(os.getenv('SERVICE_FETCH_CONCURRENCY', '8'))
+SERVICE_HEALTH_HOST = os.getenv('SERVICE_HEALTH_HOST', '127.0.0.1')
+SERVICE_HEALTH_PORT = int(os.getenv('SERVICE_HEALTH_PORT', '8080'))
@@ -1,12 +1,39 @@
 import sqlite3
-import json
 import logging
 from datetime import datetime
-from config import DATABASE_PATH
+from config import DATABASE_PATH, LATEST_CONDITIONS_READINGS
+from serialization import dumps, loads
+from query_cache import get_query_cache, write_tags
+from latest_conditions import READING_FIELDS, apply_to_view, conditions_entry
+from subscriptions import normalize_subscription
+from derived_metrics import DERIVED_FIELDS
+
+SQLITE_MAX_PARAMS = 500  # stay under SQLITE_MAX_VARIABLE_NUMBER on old builds
+
+# Columns the streaming queries may project
+WEATHER_COLUMNS = ('id', 'city', 'temperature', 'feels_like', 'humidity', 'pressure', 'wind_speed',
+                   'wind_direction', 'visibility', 'weather_main', 'weather_description', 'rain_1h',
+                   'dew_point', 'heat_index', 'wbgt', 'timestamp', 'created_at')
+# Stand-ins for missing readings when history is replayed (backtests); archives keep NULLs
+REPLAY_DEFAULTS = {'temperature': 0, 'feels_like': 0, 'humidity': 0, 'pressure': 0, 'wind_speed': 0,
+                   'wind_direction': 0, 'visibility': 10, 'rain_1h': 0}
+HISTORY_COLUMNS = WEATHER_COLUMNS[:-1] + ('observed_at', 'created_at')
+
+
+def replay_defaults(row):
+    """Fill a history row's missing readings with REPLAY_DEFAULTS, in place"""
+    for column, default in REPLAY_DEFAULTS.items():
+        if row.get(column) is None:
+            row[column] = default
+    return row
+
+ALERT_COLUMNS = ('id', 'alert_type', 'city', 'message', 'severity', 'weather_data', 'email_sent', 'sms_sent',
+                 'created_at', 'observation_id')
 
 class WeatherDatabase:
-    def __init__(self):
-        self.db_path = DATABASE_PATH
+    def __init__(self, db_path=DATABASE_PATH):
+        self.db_path = db_path
+        self.query_cache = get_query_cache(('sqlite', db_path))
         self.init_database()
     
     def init_database(self):
@@ -50,39 +77,192 @@ class WeatherDatabase:
                 )
             ''')
             
+            # Alerts reference their observation instead of embedding a copy
+            columns = [row[1] for row in cursor.execute('PRAGMA table_info(alerts_history)')]
+            if 'observation_id' not in columns:
+                cursor.execute('ALTER TABLE alerts_history ADD COLUMN observation_id INTEGER')
+            
+            # Provider observation time (epoch 'dt'): one row per station and observation
+            columns = [row[1] for row in cursor.execute('PRAGMA table_info(weather_history)')]
+            if 'observed_at' not in columns:
+                cursor.execute('ALTER TABLE weather_history ADD COLUMN observed_at INTEGER')
+            # Derived heat-stress metrics (see derived_metrics.py); NULL on older rows
+            for column in DERIVED_FIELDS:
+                if column not in columns:
+                    cursor.execute(f'ALTER TABLE weather_history ADD COLUMN {column} REAL')
+            cursor.execute('''
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_weather_history_observation
+                ON weather_history (city, observed_at)
+            ''')
+            
+            # Latest conditions per city, upserted with every weather write
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS latest_conditions (
+                    city TEXT PRIMARY KEY,
+                    observation_id INTEGER,
+                    timestamp TEXT,
+                    readings TEXT NOT NULL,
+                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            if cursor.execute('SELECT NOT EXISTS (SELECT 1 FROM latest_conditions)').fetchone()[0]:
+                self._rebuild_latest_conditions(cursor)
+            
+            # Alert subscribers; cities and alert types are comma-separated, '*' for all
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS subscriptions (
+                    email TEXT PRIMARY KEY,
+                    cities TEXT NOT NULL DEFAULT '*',
+                    alert_types TEXT NOT NULL DEFAULT '*',
+                    min_severity TEXT NOT NULL DEFAULT 'LOW',
+                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            # Indexes for range scans (backtesting, retention)
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_weather_history_timestamp
+                ON weather_history (timestamp)
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_alerts_history_created_at
+                ON alerts_history (created_at)
+            ''')
+            # Newest-first reads for one city (the index carries the row id)
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_weather_history_city
+                ON weather_history (city)
+            ''')
+            
             conn.commit()
             conn.close()
             logging.info("Database initialized successfully")
             
         except Exception as e:
-            logging.error(f"Error initializing database: {e}")
+            logging.error("Error initializing database: %s", e)
     
     def store_weather_data(self, weather_data_list):
-        """Store weather data in the database"""
+        """Store weather data in the database
+        
+        Idempotent per (city, provider 'dt'): storing an observation again
+        updates its row. Each record gets its row id as `observation_id` so
+        alerts can reference it. Returns the records that were not stored
+        before, or None if the write failed.
+        """
         try:
             conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
             
+            inserted = []
             for data in weather_data_list:
-                cursor.execute('''
-                    INSERT INTO weather_history 
-                    (city, temperature, feels_like, humidity, pressure, wind_speed, 
-                     wind_direction, visibility, weather_main, weather_description, 
-                     rain_1h, timestamp)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    data['city'], data['temperature'], data['feels_like'],
+                values = (
+                    data['temperature'], data['feels_like'],
                     data['humidity'], data['pressure'], data['wind_speed'],
                     data['wind_direction'], data['visibility'], data['weather_main'],
-                    data['weather_description'], data['rain_1h'], data['timestamp']
-                ))
+                    data['weather_description'], data['rain_1h'], data.get('dew_point'),
+                    data.get('heat_index'), data.get('wbgt'), data['timestamp'],
+                    data['city'], data.get('dt')
+                )
+                cursor.execute('''
+                    INSERT OR IGNORE INTO weather_history 
+                    (temperature, feels_like, humidity, pressure, wind_speed, 
+                     wind_direction, visibility, weather_main, weather_description, 
+                     rain_1h, dew_point, heat_index, wbgt, timestamp, city, observed_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', values)
+                if cursor.rowcount:
+                    data['observation_id'] = cursor.lastrowid
+                    inserted.append(data)
+                    continue
+                
+                # Stored before: refresh the row in place
+                cursor.execute('''
+                    UPDATE weather_history
+                    SET temperature = ?, feels_like = ?, humidity = ?, pressure = ?, wind_speed = ?,
+                        wind_direction = ?, visibility = ?, weather_main = ?, weather_description = ?,
+                        rain_1h = ?, dew_point = ?, heat_index = ?, wbgt = ?, timestamp = ?
+                    WHERE city = ? AND observed_at = ?
+                ''', values)
+                data['observation_id'] = cursor.execute(
+                    'SELECT id FROM weather_history WHERE city = ? AND observed_at = ?', values[-2:]
+                ).fetchone()[0]
             
+            self._update_latest_conditions(cursor, weather_data_list)
             conn.commit()
             conn.close()
-            logging.info(f"Stored weather data for {len(weather_data_list)} cities")
+            self.query_cache.invalidate(write_tags('weather', {data['city'] for data in weather_data_list}))
+            logging.info("Stored weather data for %s cities (%s already stored)", len(weather_data_list),
+                         len(weather_data_list) - len(inserted))
+            return inserted
+            
+        except Exception as e:
+            logging.error("Error storing weather data: %s", e)
+            return None
+    
+    def _update_latest_conditions(self, cursor, weather_data_list):
+        """Upsert each touched city's row in the same transaction as the history insert"""
+        cities = list({data['city']: None for data in weather_data_list})
+        view = {}
+        for start in range(0, len(cities), SQLITE_MAX_PARAMS):
+            chunk = cities[start:start + SQLITE_MAX_PARAMS]
+            cursor.execute(
+                f"SELECT city, readings FROM latest_conditions WHERE city IN ({','.join('?' * len(chunk))})",
+                chunk
+            )
+            view.update((city, loads(readings)) for city, readings in cursor.fetchall())
+        
+        self._write_latest_conditions(cursor, apply_to_view(view, weather_data_list))
+    
+    def _write_latest_conditions(self, cursor, view):
+        cursor.executemany('''
+            INSERT OR REPLACE INTO latest_conditions (city, observation_id, timestamp, readings, updated_at)
+            VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ''', [
+            (city, readings[0]['observation_id'], readings[0]['timestamp'], dumps(readings))
+            for city, readings in view.items()
+        ])
+    
+    def _rebuild_latest_conditions(self, cursor):
+        """Backfill the view from weather_history, e.g. for databases created before it existed"""
+        cursor.execute(f'''
+            SELECT city, id AS observation_id, {', '.join(READING_FIELDS[1:])} FROM (
+                SELECT *, ROW_NUMBER() OVER (PARTITION BY city ORDER BY id DESC) AS recency
+                FROM weather_history
+            )
+            WHERE recency <= ?
+            ORDER BY city, recency DESC
+        ''', (LATEST_CONDITIONS_READINGS,))
+        columns = [description[0] for description in cursor.description]
+        # Oldest first, so folding leaves each city's newest reading at the front
+        rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        if rows:
+            self._write_latest_conditions(cursor, apply_to_view({}, rows))
+            logging.info("Rebuilt latest conditions for %s cities", len({row['city'] for row in rows}))
+    
+    def get_latest_conditions(self, city=None):
+        """Latest reading per city with its recent readings inline, read in O(cities)"""
+        try:
+            return self.query_cache.get_or_load(
+                ('latest', city), [('weather', city)],
+                lambda: self._query_latest_conditions(city)
+            )
             
         except Exception as e:
-            logging.error(f"Error storing weather data: {e}")
+            logging.error("Error retrieving latest conditions: %s", e)
+            return []
+    
+    def _query_latest_conditions(self, city):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            if city:
+                rows = conn.execute(
+                    'SELECT city, readings, updated_at FROM latest_conditions WHERE city = ?', (city,)
+                ).fetchall()
+            else:
+                rows = conn.execute('SELECT city, readings, updated_at FROM latest_conditions ORDER BY city').fetchall()
+            return [conditions_entry(city, loads(readings), updated_at) for city, readings, updated_at in rows]
+        finally:
+            conn.close()
     
     def store_alert(self, alert, email_sent=False, sms_sent=False):
         """Store alert information in the database"""
@@ -90,67 +270,291 @@ class WeatherDatabase:
             conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
             
+            # Only embed the observation when it was never stored in weather_history
+            observation_id = alert['weather_data'].get('observation_id')
+            weather_data = None if observation_id is not None else dumps(alert['weather_data'])
+            
             cursor.execute('''
                 INSERT INTO alerts_history 
-                (alert_type, city, message, severity, weather_data, email_sent, sms_sent)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
+                (alert_type, city, message, severity, weather_data, email_sent, sms_sent, observation_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
             ''', (
                 alert['type'], alert['city'], alert['message'], alert['severity'],
-                json.dumps(alert['weather_data']), email_sent, sms_sent
+                weather_data, email_sent, sms_sent, observation_id
             ))
+            alert['alert_id'] = cursor.lastrowid
             
             conn.commit()
             conn.close()
-            logging.info(f"Stored alert: {alert['type']} for {alert['city']}")
+            self.query_cache.invalidate(write_tags('alerts', {alert['city']}))
+            logging.info("Stored alert: %s for %s", alert['type'], alert['city'])
             
         except Exception as e:
-            logging.error(f"Error storing alert: {e}")
+            logging.error("Error storing alert: %s", e)
     
-    def get_recent_weather(self, city=None, hours=24):
-        """Get recent weather data"""
+    def mark_alerts_sent(self, alerts):
+        """Record the email delivery of stored alerts, e.g. ones deferred by rate limits"""
+        stored = [alert for alert in alerts if alert.get('alert_id') is not None]
+        if not stored:
+            return
         try:
             conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            try:
+                conn.executemany('UPDATE alerts_history SET email_sent = 1 WHERE id = ?',
+                                 [(alert['alert_id'],) for alert in stored])
+                conn.commit()
+            finally:
+                conn.close()
+            self.query_cache.invalidate(write_tags('alerts', {alert['city'] for alert in stored}))
+        except Exception as e:
+            logging.error("Error marking alerts sent: %s", e)
+    
+    def add_subscription(self, email, cities='*', alert_types='*', min_severity='LOW'):
+        """Add or replace an email's subscription; raises ValueError if invalid"""
+        subscription = normalize_subscription(email, cities, alert_types, min_severity)
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute('''
+                INSERT OR REPLACE INTO subscriptions (email, cities, alert_types, min_severity)
+                VALUES (:email, :cities, :alert_types, :min_severity)
+            ''', subscription)
+            conn.commit()
+        finally:
+            conn.close()
+            self.query_cache.invalidate([('subscriptions', None)])
+        return subscription
+    
+    def remove_subscription(self, email):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            removed = conn.execute('DELETE FROM subscriptions WHERE email = ?', (email.strip().lower(),)).rowcount
+            conn.commit()
+        finally:
+            conn.close()
+            self.query_cache.invalidate([('subscriptions', None)])
+        return removed > 0
+    
+    def get_subscriptions(self):
+        """All subscriptions as dicts, cached until the next subscription write"""
+        try:
+            return self.query_cache.get_or_load(
+                ('subscriptions',), [('subscriptions', None)],
+                self._query_subscriptions
+            )
             
-            if city:
-                cursor.execute('''
-                    SELECT * FROM weather_history 
-                    WHERE city = ? AND created_at > datetime('now', '-{} hours')
-                    ORDER BY created_at DESC
-                '''.format(hours), (city,))
-            else:
-                cursor.execute('''
-                    SELECT * FROM weather_history 
-                    WHERE created_at > datetime('now', '-{} hours')
-                    ORDER BY created_at DESC
-                '''.format(hours))
+        except Exception as e:
+            logging.error("Error retrieving subscriptions: %s", e)
+            return []
+    
+    def _query_subscriptions(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        try:
+            rows = conn.execute('SELECT email, cities, alert_types, min_severity FROM subscriptions ORDER BY email')
+            return [dict(row) for row in rows]
+        finally:
+            conn.close()
+    
+    def get_recent_weather(self, city=None, hours=24):
+        """Get recent weather data, cached until the next write for that city"""
+        try:
+            return self.query_cache.get_or_load(
+                ('weather', city, hours), [('weather', city)],
+                lambda: self._query_recent_weather(city, hours)
+            )
             
-            results = cursor.fetchall()
+        except Exception as e:
+            logging.error("Error retrieving weather data: %s", e)
+            return []
+    
+    def _query_recent_weather(self, city, hours):
+        return list(self.iter_recent_weather(city, hours, named=False))
+    
+    def iter_recent_weather(self, city=None, hours=24, limit=None, columns=None, newest_first=True,
+                            named=True, chunk_size=500):
+        """Stream recent weather_history rows, newest first by default
+        
+        Filtering, ordering and `limit` run in SQL and rows are fetched in
+        chunks, so memory does not grow with the window. `columns` projects
+        the row; rows are sqlite3.Row (by name or index) unless named=False.
+        """
+        where = ["created_at > datetime('now', ?)"]
+        params = [f'-{float(hours)} hours']
+        if city:
+            where.append('city = ?')
+            params.append(city)
+        # Row ids follow insertion (created_at) order
+        order = 'id DESC' if newest_first else 'id ASC'
+        return self._iter_query('weather_history', WEATHER_COLUMNS, columns, where, params, order, limit,
+                                named, chunk_size)
+    
+    def get_observation(self, observation_id):
+        """Get a stored observation by id, e.g. the one an alert references"""
+        try:
+            conn = sqlite3.connect(self.db_path)
+            conn.row_factory = sqlite3.Row
+            row = conn.execute('SELECT * FROM weather_history WHERE id = ?', (observation_id,)).fetchone()
             conn.close()
             
-            return results
+            return dict(row) if row else None
             
         except Exception as e:
-            logging.error(f"Error retrieving weather data: {e}")
-            return []
+            logging.error("Error retrieving observation %s: %s", observation_id, e)
+            return None
     
     def get_recent_alerts(self, hours=24):
-        """Get recent alerts"""
+        """Get recent alerts, cached until the next alert is stored"""
+        try:
+            return self.query_cache.get_or_load(
+                ('alerts', None, hours), [('alerts', None)],
+                lambda: self._query_recent_alerts(hours)
+            )
+            
+        except Exception as e:
+            logging.error("Error retrieving alerts: %s", e)
+            return []
+    
+    def _query_recent_alerts(self, hours):
+        return list(self.iter_recent_alerts(hours, named=False))
+    
+    def iter_recent_alerts(self, hours=24, limit=None, columns=None, newest_first=True, named=True,
+                           chunk_size=500):
+        """Stream recent alerts_history rows, newest first by default (see iter_recent_weather)"""
+        where = ["created_at > datetime('now', ?)"]
+        params = [f'-{float(hours)} hours']
+        order = 'created_at DESC, id DESC' if newest_first else 'created_at ASC, id ASC'
+        return self._iter_query('alerts_history', ALERT_COLUMNS, columns, where, params, order, limit,
+                                named, chunk_size)
+    
+    def _iter_query(self, table, known_columns, columns, where, params, order, limit, named, chunk_size):
+        if columns:
+            unknown = [column for column in columns if column not in known_columns]
+            if unknown:
+                raise ValueError(f"Unknown {table} columns: {', '.join(unknown)}")
+            projection = ', '.join(columns)
+        else:
+            projection = '*'
+        sql = f"SELECT {projection} FROM {table} WHERE {' AND '.join(where)} ORDER BY {order}"
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params = [*params, int(limit)]
+        # A separate generator, so bad arguments raise here rather than at the first next()
+        return self._stream(sql, params, named, chunk_size)
+    
+    def _stream(self, sql, params, named, chunk_size):
+        conn = sqlite3.connect(self.db_path)
+        if named:
+            conn.row_factory = sqlite3.Row
+        try:
+            cursor = conn.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            conn.close()
+    
+    def get_trend_history(self, minutes):
+        """Get recent observations as dicts in time order, for warming trend windows"""
         try:
             conn = sqlite3.connect(self.db_path)
+            conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             
             cursor.execute('''
-                SELECT * FROM alerts_history 
-                WHERE created_at > datetime('now', '-{} hours')
-                ORDER BY created_at DESC
-            '''.format(hours))
+                SELECT city, temperature, humidity, wind_speed, visibility, rain_1h, timestamp
+                FROM weather_history
+                WHERE created_at > datetime('now', ?)
+                ORDER BY id ASC
+            ''', (f'-{int(minutes)} minutes',))
             
-            results = cursor.fetchall()
+            results = [dict(row) for row in cursor.fetchall()]
             conn.close()
             
             return results
             
         except Exception as e:
-            logging.error(f"Error retrieving alerts: {e}")
+            logging.error("Error retrieving trend history: %s", e)
             return []
+    
+    @staticmethod
+    def _range_clause(column, start, end):
+        """WHERE clause for an optional half-open [start, end) range"""
+        clauses, params = [], []
+        if start is not None:
+            clauses.append(f"{column} >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append(f"{column} < ?")
+            params.append(end)
+        return (' AND '.join(clauses) or '1 = 1'), params
+    
+    def iter_weather_history(self, start=None, end=None, chunk_size=5000, coalesce=True):
+        """Stream weather_history rows as dicts in insertion order, chunk by chunk
+        
+        With coalesce (for replays) missing readings read as REPLAY_DEFAULTS;
+        without it (for archiving) rows are returned exactly as stored.
+        """
+        where, params = self._range_clause('timestamp', start, end)
+        columns = ', '.join(f"COALESCE({column}, {REPLAY_DEFAULTS[column]}) AS {column}"
+                            if coalesce and column in REPLAY_DEFAULTS else column
+                            for column in HISTORY_COLUMNS)
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT {columns}
+                FROM weather_history
+                WHERE {where}
+                ORDER BY id ASC
+            ''', params)
+            
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield dict(row)
+        finally:
+            conn.close()
+    
+    def delete_weather_history(self, before, max_id, cities=()):
+        """Delete archived rows: observed before `before` and no newer than `max_id`
+        
+        Bounding by id leaves rows inserted after the archive snapshot in place.
+        """
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.execute('DELETE FROM weather_history WHERE timestamp < ? AND id <= ?', (before, max_id))
+            conn.commit()
+            deleted = cursor.rowcount
+        finally:
+            conn.close()
+        self.query_cache.invalidate(write_tags('weather', cities))
+        logging.info("Deleted %s archived weather rows", deleted)
+        return deleted
+    
+    def iter_alert_history(self, start=None, end=None, chunk_size=5000):
+        """Stream alerts_history rows (without payloads) ordered by created_at"""
+        where, params = self._range_clause('created_at', start, end)
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, alert_type, city, severity, created_at
+                FROM alerts_history
+                WHERE {}
+                ORDER BY created_at ASC, id ASC
+            '''.format(where), params)
+            
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield dict(row)
+        finally:
+            conn.close()
@@ -0,0 +1,109 @@
+"""
+Derived heat-stress metrics for batches of observations
+
+From each observation's temperature (°F) and relative humidity (%):
+  dew_point   Magnus formula (Alduchov-Eskridge constants)
+  heat_index  NWS Rothfusz regression with its low/high humidity adjustments
+  wbgt        wet-bulb globe temperature estimated from temperature and vapor
+              pressure (Australian Bureau of Meteorology approximation, which
+              assumes full sun and light wind)
+all in °F, rounded to 0.1. A batch is computed in one vectorized pass when
+numpy is installed, row by row otherwise; the two agree to within rounding.
+"""
+
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+DERIVED_FIELDS = ('dew_point', 'heat_index', 'wbgt')
+
+# Below this many rows numpy's per-call overhead outweighs the vectorized math
+VECTORIZE_MIN_ROWS = 64
+
+MAGNUS_A = 17.625
+MAGNUS_B = 243.04  # °C
+
+
+def _rothfusz(t, rh):
+    return (-42.379 + 2.04901523 * t + 10.14333127 * rh - 0.22475541 * t * rh - 0.00683783 * t * t -
+            0.05481717 * rh * rh + 0.00122874 * t * t * rh + 0.00085282 * t * rh * rh -
+            0.00000199 * t * t * rh * rh)
+
+
+def derived_metrics(temperature, humidity):
+    """(dew point, heat index, WBGT) in °F for one observation"""
+    t = float(temperature)
+    rh = min(100.0, max(1.0, float(humidity or 0)))
+    tc = (t - 32) / 1.8
+
+    gamma = math.log(rh / 100) + MAGNUS_A * tc / (MAGNUS_B + tc)
+    dew_point = MAGNUS_B * gamma / (MAGNUS_A - gamma) * 1.8 + 32
+
+    heat_index = 0.5 * (t + 61.0 + (t - 68.0) * 1.2 + rh * 0.094)
+    if (heat_index + t) / 2 >= 80:
+        heat_index = _rothfusz(t, rh)
+        if rh < 13 and 80 <= t <= 112:
+            heat_index -= (13 - rh) / 4 * math.sqrt((17 - abs(t - 95)) / 17)
+        elif rh > 85 and 80 <= t <= 87:
+            heat_index += (rh - 85) / 10 * (87 - t) / 5
+
+    vapor_pressure = rh / 100 * 6.105 * math.exp(17.27 * tc / (237.7 + tc))  # hPa
+    wbgt = (0.567 * tc + 0.393 * vapor_pressure + 3.94) * 1.8 + 32
+
+    return round(dew_point, 1), round(heat_index, 1), round(wbgt, 1)
+
+
+def _derived_columns(temperature, humidity):
+    """Vectorized derived_metrics over float64 arrays"""
+    t = temperature
+    rh = numpy.clip(humidity, 1.0, 100.0)
+    tc = (t - 32) / 1.8
+
+    gamma = numpy.log(rh / 100) + MAGNUS_A * tc / (MAGNUS_B + tc)
+    dew_point = MAGNUS_B * gamma / (MAGNUS_A - gamma) * 1.8 + 32
+
+    simple = 0.5 * (t + 61.0 + (t - 68.0) * 1.2 + rh * 0.094)
+    regression = _rothfusz(t, rh)
+    dry = (rh < 13) & (t >= 80) & (t <= 112)
+    regression[dry] -= ((13 - rh[dry]) / 4 * numpy.sqrt((17 - numpy.abs(t[dry] - 95)) / 17))
+    humid = (rh > 85) & (t >= 80) & (t <= 87)
+    regression[humid] += (rh[humid] - 85) / 10 * (87 - t[humid]) / 5
+    heat_index = numpy.where((simple + t) / 2 >= 80, regression, simple)
+
+    vapor_pressure = rh / 100 * 6.105 * numpy.exp(17.27 * tc / (237.7 + tc))
+    wbgt = (0.567 * tc + 0.393 * vapor_pressure + 3.94) * 1.8 + 32
+
+    return [numpy.round(column, 1).tolist() for column in (dew_point, heat_index, wbgt)]
+
+
+def add_derived_metrics(weather_data, vectorized=None):
+    """Set dew_point, heat_index and wbgt on each observation dict in place; returns the list"""
+    if vectorized is None:
+        vectorized = numpy is not None and len(weather_data) >= VECTORIZE_MIN_ROWS
+    if not vectorized:
+        for data in weather_data:
+            data['dew_point'], data['heat_index'], data['wbgt'] = derived_metrics(data['temperature'],
+                                                                                  data.get('humidity'))
+        return weather_data
+
+    count = len(weather_data)
+    temperature = numpy.fromiter((data['temperature'] for data in weather_data), dtype=numpy.float64, count=count)
+    humidity = numpy.fromiter((data.get('humidity') or 0 for data in weather_data), dtype=numpy.float64,
+                              count=count)
+    dew_points, heat_indexes, wbgts = _derived_columns(temperature, humidity)
+    for data, dew_point, heat_index, wbgt in zip(weather_data, dew_points, heat_indexes, wbgts):
+        data['dew_point'] = dew_point
+        data['heat_index'] = heat_index
+        data['wbgt'] = wbgt
+    return weather_data
+
+
+def ensure_derived_metrics(weather_data):
+    """Add derived metrics to the observations lacking them (e.g. replayed history)"""
+    missing = [data for data in weather_data if data.get('heat_index') is None]
+    if missing:
+        add_derived_metrics(missing)
+    return weather_data
@@ -0,0 +1,275 @@
+"""
+Forecast ingestion and predictive ("expected") alerts
+
+ForecastStore keeps the latest forecast per station as compact columns (an
+array per field) and refetches a station only after its forecast issue
+cycle (FORECAST_ISSUE_HOURS) has passed. ForecastMonitor evaluates the
+instantaneous ALERT_TRIGGERS over every forecast step of every changed
+forecast in one batched pass, vectorized with numpy when it is installed,
+and emits '<type>_expected' alerts with their lead time. Forecasts that did
+not change are neither refetched within a cycle nor re-evaluated.
+
+Rate-of-change triggers need observations minutes apart, so they are not
+evaluated against 3-hourly forecasts.
+"""
+
+import logging
+import sys
+import threading
+import time
+from array import array
+from datetime import datetime
+from config import FORECAST_ENABLED, FORECAST_ISSUE_HOURS, FORECAST_HORIZON_HOURS, FORECAST_REALERT_HOURS
+from station_time import station_timezone, local_isoformat
+from weather_providers import ProviderError
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+FIELDS = ('temperature', 'feels_like', 'humidity', 'pressure', 'wind_speed', 'wind_direction', 'visibility',
+          'rain_1h')
+RULE_FIELDS = ('temperature', 'wind_speed', 'visibility', 'rain_1h')
+
+# Instantaneous triggers over forecast columns (c) and trigger conditions (t).
+# They combine with & rather than `and`, so one rule evaluates numpy arrays or scalars.
+RULES = {
+    'extreme_heat_evening': lambda c, t: ((c['temperature'] > t['temp_threshold']) &
+                                          (c['hour'] >= t['time_after']) &
+                                          (c['wind_speed'] >= t['wind_speed_min'])),
+    'dust_storm_warning': lambda c, t: ((c['wind_speed'] >= t['wind_speed_min']) &
+                                        (c['visibility'] <= t['visibility_max'])),
+    'extreme_heat_day': lambda c, t: ((c['temperature'] > t['temp_threshold']) &
+                                      (c['hour'] >= t['time_between'][0]) &
+                                      (c['hour'] <= t['time_between'][1])),
+    'monsoon_alert': lambda c, t: ((c['rain_1h'] >= t['rain_threshold']) &
+                                   (c['wind_speed'] >= t['wind_speed_min']))
+}
+
+# Advance notice ranks one step below the observed alert
+EXPECTED_SEVERITY = {
+    'extreme_heat_evening': 'MEDIUM',
+    'dust_storm_warning': 'MEDIUM',
+    'extreme_heat_day': 'HIGH',
+    'monsoon_alert': 'LOW'
+}
+
+
+class StationForecast:
+    """One station's forecast steps as columns: epochs, local hours and an array('d') per field"""
+
+    __slots__ = ('city', 'tz', 'expires', 'times', 'hours', 'columns', 'weather_main', 'descriptions')
+
+    def __init__(self, station, entries, expires):
+        tz = station_timezone(station)
+        self.city = station['name']
+        self.tz = tz
+        self.expires = expires
+        self.times = array('q', (entry['dt'] for entry in entries))
+        self.hours = array('b', (datetime.fromtimestamp(entry['dt'], tz).hour for entry in entries))
+        self.columns = {field: array('d', (float(entry[field]) for entry in entries)) for field in FIELDS}
+        self.weather_main = [sys.intern(entry['weather_main']) for entry in entries]
+        self.descriptions = [sys.intern(entry['weather_description']) for entry in entries]
+
+    def __len__(self):
+        return len(self.times)
+
+    def same_as(self, other):
+        return (other is not None and self.times == other.times and self.columns == other.columns and
+                self.descriptions == other.descriptions)
+
+    def row(self, i):
+        """Forecast step i in the observation schema"""
+        data = {'city': self.city}
+        for field in FIELDS:
+            data[field] = self.columns[field][i]
+        data['humidity'] = int(data['humidity'])
+        data['weather_main'] = self.weather_main[i]
+        data['weather_description'] = self.descriptions[i]
+        data['dt'] = self.times[i]
+        data['timestamp'] = local_isoformat(self.times[i], self.tz)
+        data['forecast'] = True
+        return data
+
+
+class ForecastStore:
+    """Latest forecast per station, fetched once per forecast issue cycle"""
+
+    def __init__(self, providers, issue_hours=FORECAST_ISSUE_HOURS, clock=time.time):
+        self.providers = [provider for provider in providers if provider.supports_forecast]
+        self.issue_seconds = int(issue_hours * 3600)
+        self.clock = clock
+        self._forecasts = {}  # station name -> StationForecast
+        self.counters = {'fetched': 0, 'changed': 0, 'unchanged': 0, 'failed': 0}
+
+    def get(self, city):
+        return self._forecasts.get(city)
+
+    def refresh(self, stations, now=None):
+        """Fetch the forecasts that are due; returns those that changed"""
+        now = self.clock() if now is None else now
+        expires = (int(now) // self.issue_seconds + 1) * self.issue_seconds
+        changed = []
+        for station in stations:
+            current = self._forecasts.get(station['name'])
+            if current is not None and now < current.expires:
+                continue
+
+            entries = self._fetch(station)
+            if entries is None:
+                continue  # retried next tick
+            self.counters['fetched'] += 1
+            forecast = StationForecast(station, entries, expires)
+            if forecast.same_as(current):
+                current.expires = expires
+                self.counters['unchanged'] += 1
+                continue
+            self._forecasts[station['name']] = forecast
+            self.counters['changed'] += 1
+            changed.append(forecast)
+        return changed
+
+    def _fetch(self, station):
+        for provider in self.providers:
+            if not provider.configured:
+                continue
+            try:
+                return sorted(provider.fetch_forecast(station), key=lambda entry: entry['dt'])
+            except ProviderError:
+                continue
+        self.counters['failed'] += 1
+        return None
+
+
+def _stack(values, lengths):
+    """Per-station condition values as one value per forecast step (a scalar when all agree)"""
+    first = values[0]
+    if all(value == first for value in values):
+        return first
+    if isinstance(first, (tuple, list)):
+        return tuple(_stack([value[i] for value in values], lengths) for i in range(len(first)))
+    return numpy.repeat(numpy.asarray(values, dtype=float), lengths)
+
+
+class ForecastMonitor:
+    """Expected alerts from station forecasts"""
+
+    def __init__(self, providers, alert_system, horizon_hours=FORECAST_HORIZON_HOURS,
+                 realert_hours=FORECAST_REALERT_HOURS, clock=time.time):
+        self.store = ForecastStore(providers, clock=clock)
+        self.alert_system = alert_system
+        self.horizon_seconds = int(horizon_hours * 3600)
+        self.realert_seconds = int(realert_hours * 3600)
+        self.clock = clock
+        self.rules = {alert_type: rule for alert_type, rule in RULES.items() if alert_type in alert_system.triggers}
+        self._alerted = {}  # (city, alert type) -> expected epoch last alerted
+
+    def check_alerts(self, now=None):
+        """Refresh due forecasts and return expected alerts from those that changed"""
+        now = int(self.clock() if now is None else now)
+        changed = self.store.refresh(self.alert_system.station_index.stations, now)
+        if not changed:
+            return []
+        return self._alerts(self.evaluate(changed, now), now)
+
+    def evaluate(self, forecasts, now):
+        """(forecast, alert type, step) for the first step within the horizon matching each trigger"""
+        station_index = self.alert_system.station_index
+        conditions = [self.alert_system.conditions_for(station_index.get(forecast.city)) for forecast in forecasts]
+        if numpy is not None:
+            return self._evaluate_vectorized(forecasts, conditions, now)
+        return self._evaluate_rows(forecasts, conditions, now)
+
+    def _evaluate_vectorized(self, forecasts, conditions, now):
+        lengths = numpy.array([len(forecast) for forecast in forecasts])
+        offsets = numpy.concatenate(([0], numpy.cumsum(lengths)[:-1]))
+        columns = {field: numpy.concatenate([numpy.frombuffer(forecast.columns[field], dtype=numpy.float64)
+                                             for forecast in forecasts])
+                   for field in RULE_FIELDS}
+        columns['hour'] = numpy.concatenate([numpy.frombuffer(forecast.hours, dtype=numpy.int8)
+                                             for forecast in forecasts])
+        times = numpy.concatenate([numpy.frombuffer(forecast.times, dtype=numpy.int64) for forecast in forecasts])
+        owner = numpy.repeat(numpy.arange(len(forecasts)), lengths)
+        in_horizon = (times > now) & (times <= now + self.horizon_seconds)
+
+        hits = []
+        for alert_type, rule in self.rules.items():
+            limits = {key: _stack([c[alert_type][key] for c in conditions], lengths)
+                      for key in conditions[0][alert_type]}
+            rows = numpy.flatnonzero(rule(columns, limits) & in_horizon)
+            if not rows.size:
+                continue
+            # Rows are in station then time order, so the first row per station is its earliest
+            stations, first = numpy.unique(owner[rows], return_index=True)
+            for station, row in zip(stations.tolist(), rows[first].tolist()):
+                hits.append((forecasts[station], alert_type, row - int(offsets[station])))
+        return hits
+
+    def _evaluate_rows(self, forecasts, conditions, now):
+        end = now + self.horizon_seconds
+        hits = []
+        for forecast, station_conditions in zip(forecasts, conditions):
+            pending = dict(self.rules)
+            for i, observed in enumerate(forecast.times):
+                if not pending:
+                    break
+                if observed <= now or observed > end:
+                    continue
+                values = {field: forecast.columns[field][i] for field in RULE_FIELDS}
+                values['hour'] = forecast.hours[i]
+                for alert_type, rule in list(pending.items()):
+                    if rule(values, station_conditions[alert_type]):
+                        hits.append((forecast, alert_type, i))
+                        del pending[alert_type]
+        return hits
+
+    def _alerts(self, hits, now):
+        alerts = []
+        station_index = self.alert_system.station_index
+        for forecast, alert_type, i in hits:
+            expected = forecast.times[i]
+            key = (forecast.city, alert_type)
+            last = self._alerted.get(key)
+            if last is not None and last > now and abs(expected - last) < self.realert_seconds:
+                continue  # already announced
+            self._alerted[key] = expected
+
+            data = forecast.row(i)
+            lead_hours = (expected - now) / 3600
+            conditions = self.alert_system.conditions_for(station_index.get(forecast.city))
+            message = self.alert_system.messages.render(alert_type, data, conditions[alert_type])
+            alerts.append({
+                'type': f"{alert_type}_expected",
+                'city': forecast.city,
+                'message': f"FORECAST (in {lead_hours:.0f}h, {data['timestamp'][:16].replace('T', ' ')}): {message}",
+                'severity': EXPECTED_SEVERITY.get(alert_type, 'MEDIUM'),
+                'expected_at': data['timestamp'],
+                'lead_hours': round(lead_hours, 1),
+                'weather_data': data
+            })
+        if alerts:
+            logging.info("Forecasts expect %s alerts", len(alerts), extra={'stage': 'forecast', 'alerts': len(alerts)})
+        return alerts
+
+    def metrics(self):
+        return dict(self.store.counters, vectorized=numpy is not None)
+
+
+_monitor = None
+_monitor_lock = threading.Lock()
+
+
+def get_forecast_monitor(providers, alert_system):
+    """Process-wide ForecastMonitor when FORECASTS=true, else None
+
+    Azure Functions entry points share it so forecasts stay cached across
+    warm invocations.
+    """
+    global _monitor
+    if not FORECAST_ENABLED:
+        return None
+    with _monitor_lock:
+        if _monitor is None:
+            _monitor = ForecastMonitor(providers, alert_system)
+        return _monitor
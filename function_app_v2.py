@@ -1,20 +1,34 @@
 import azure.functions as func
+import base64
+import hashlib
 import logging
-import json
-from datetime import datetime
+import time
+from datetime import datetime, timedelta, timezone
+from config import STATUS_DEFAULT_LIMIT, STATUS_MAX_LIMIT, STATUS_CACHE_MAX_AGE
+from serialization import dumps, dumps_bytes, loads
+from logging_setup import install_rate_limit
+from profiling import profiled, mark_stage
+from azure_runtime import get_app, get_storage
 
 # Create the Azure Functions app
 app = func.FunctionApp()
 
+# The host owns the handlers; only cap repetitive per-city lines
+install_rate_limit()
+
+def _wants_pretty(req):
+    """Pretty-print responses only when asked, e.g. ?pretty=1"""
+    return req.params.get('pretty', '').lower() in ('1', 'true', 'yes')
+
 @app.timer_trigger(schedule="0 */2 * * * *", arg_name="mytimer", run_on_startup=False,
               use_monitor=False)
+@profiled('weather_alert_timer')
 def weather_alert_timer(mytimer: func.TimerRequest) -> None:
     """
     Azure Function triggered every 2 minutes to check weather and send alerts
     CRON: "0 */2 * * * *" = every 2 minutes at second 0
     """
-    utc_timestamp = datetime.utcnow().replace(
-        tzinfo=datetime.timezone.utc).isoformat()
+    utc_timestamp = datetime.now(timezone.utc).isoformat()
 
     if mytimer.past_due:
         logging.info('The timer is past due!')
@@ -22,92 +36,157 @@ def weather_alert_timer(mytimer: func.TimerRequest) -> None:
     logging.info('Python timer trigger function ran at %s', utc_timestamp)
     
     try:
-        # Import here to avoid startup issues
-        from weather_api import WeatherAPI
-        from alert_system import AlertSystem
-        from notification_system import NotificationSystem
-        from azure_storage import AzureWeatherStorage
-        
-        # Initialize components
-        weather_api = WeatherAPI()
-        alert_system = AlertSystem()
-        notification_system = NotificationSystem()
-        storage = AzureWeatherStorage()
-        
-        # Fetch weather data for all cities
-        weather_data = weather_api.get_all_cities_weather()
-        
-        if not weather_data:
-            logging.warning("No weather data retrieved")
-            return
-        
-        # Store weather data in Azure Table Storage
-        storage.store_weather_data(weather_data)
-        
-        # Check for alerts
-        alerts = alert_system.check_alerts(weather_data)
-        
-        if alerts:
-            logging.info(f"Found {len(alerts)} alerts")
-            
-            # Send email notifications
-            notification_system.send_alerts(alerts)
-            
-            # Store alerts in Azure Table Storage
-            for alert in alerts:
-                storage.store_alert(alert)
-                
-        else:
-            logging.info("No alerts triggered")
-            
-        # Log current conditions
-        for data in weather_data:
-            logging.info(f"{data['city']}: {data['temperature']:.1f}°F, "
-                       f"Wind: {data['wind_speed']:.1f}mph, "
-                       f"Conditions: {data['weather_description']}")
+        # Fetch weather data for all cities, then store, evaluate and notify
+        # through the same pipeline as every other entry point; stale readings
+        # are not stored or alerted on
+        weather_app = get_app()
+        started = time.perf_counter()
+        weather_data = weather_app.weather_api.get_all_cities_weather()
+        mark_stage('fetch')
+        weather_app.process_weather(weather_data, started)
                        
     except Exception as e:
-        logging.error(f"Error in weather check: {e}")
+        logging.error("Error in weather check: %s", e)
         raise
 
+STATUS_KINDS = ("weather", "alerts")
+
+def _encode_token(state):
+    return base64.urlsafe_b64encode(dumps_bytes(state)).decode('ascii').rstrip('=')
+
+def _decode_token(token):
+    padded = token + '=' * (-len(token) % 4)
+    return loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+
+def _parse_since(value):
+    """ISO timestamp as naive UTC; defaults to the last 24 hours
+    
+    Timestamps without an offset are UTC; ones with an offset are converted.
+    The default is truncated to the minute so repeated requests share query
+    cache entries and ETags.
+    """
+    if not value:
+        return (datetime.utcnow() - timedelta(hours=24)).replace(second=0, microsecond=0)
+    from azure_storage import to_utc_naive
+    return to_utc_naive(datetime.fromisoformat(value.rstrip('Z')))
+
+def _status_body(pages, continuation, ndjson):
+    """Encode records one at a time rather than building a response dict
+    
+    Returns (body, etag); the ETag covers the records and continuation but
+    not the response timestamp, so unchanged pages revalidate.
+    """
+    digest = hashlib.sha1()
+    encoded = {}
+    for kind, items in pages.items():
+        encoded[kind] = [dumps_bytes(item) for item in items]
+        digest.update(kind.encode('ascii'))
+        for chunk in encoded[kind]:
+            digest.update(chunk)
+    continuation_bytes = dumps_bytes(continuation)
+    digest.update(continuation_bytes)
+    etag = '"' + digest.hexdigest() + '"'
+    
+    timestamp = dumps_bytes(datetime.utcnow().isoformat())
+    if ndjson:
+        lines = []
+        for kind, chunks in encoded.items():
+            prefix = b'{"kind":"' + kind.encode('ascii') + b'",'
+            lines.extend(prefix + chunk[1:] if chunk != b'{}' else prefix[:-1] + b'}' for chunk in chunks)
+        lines.append(b'{"kind":"page","timestamp":' + timestamp + b',"continuation":' + continuation_bytes + b'}')
+        return b"\n".join(lines) + b"\n", etag
+    
+    parts = [b'{"status":"success","timestamp":', timestamp]
+    for kind, chunks in encoded.items():
+        parts.append(b',"' + kind.encode('ascii') + b'":[')
+        parts.append(b",".join(chunks))
+        parts.append(b"]")
+    parts.append(b',"continuation":')
+    parts.append(continuation_bytes)
+    parts.append(b"}")
+    return b"".join(parts), etag
+
 @app.http_trigger(route="weather/status", auth_level=func.AuthLevel.FUNCTION)
 def weather_status(req: func.HttpRequest) -> func.HttpResponse:
     """
-    HTTP endpoint to check recent weather data and alerts
+    HTTP endpoint to page through recent weather data and alerts
+    
+    Query parameters:
+      city          only this city
+      since         ISO timestamp, UTC unless it has an offset; default
+                    24 hours ago
+      limit         records per kind per page (default 100, max 1000)
+      include       weather,alerts (default both); add latest for the
+                    latest conditions per city on the first page
+      continuation  token from the previous page
+      format        json (default) or ndjson
     """
     logging.info('Weather status endpoint called')
     
     try:
-        storage = AzureWeatherStorage()
+        try:
+            limit = min(max(int(req.params.get('limit', STATUS_DEFAULT_LIMIT)), 1), STATUS_MAX_LIMIT)
+            token = req.params.get('continuation')
+            if token:
+                state = _decode_token(token)
+                since = datetime.fromisoformat(state['since'])
+                city = state.get('city')
+            else:
+                since = _parse_since(req.params.get('since'))
+                city = req.params.get('city') or None
+                requested = req.params.get('include', ','.join(STATUS_KINDS)).split(',')
+                include = [kind for kind in requested if kind in STATUS_KINDS]
+                state = {"since": since.isoformat(), "city": city,
+                         "tokens": {kind: None for kind in include}}
+        except (ValueError, KeyError, TypeError) as e:
+            return func.HttpResponse(
+                dumps({"status": "error", "message": f"Invalid request: {e}"}),
+                status_code=400,
+                mimetype="application/json"
+            )
         
-        # Get recent weather data (last 24 hours)
-        recent_weather = storage.get_recent_weather(hours=24)
-        recent_alerts = storage.get_recent_alerts(hours=24)
+        storage = get_storage()
+        queries = {"weather": storage.query_weather, "alerts": storage.query_alerts}
         
-        response_data = {
-            "status": "success",
-            "timestamp": datetime.utcnow().isoformat(),
-            "recent_weather_count": len(recent_weather),
-            "recent_alerts_count": len(recent_alerts),
-            "recent_weather": recent_weather[-10:],  # Last 10 entries
-            "recent_alerts": recent_alerts
-        }
+        pages = {}
+        if not token and 'latest' in requested:
+            pages["latest"] = storage.get_latest_conditions(city)
+        
+        next_tokens = {}
+        for kind, kind_token in state["tokens"].items():
+            items, next_token = queries[kind](city=city, since=since, limit=limit, continuation_token=kind_token)
+            pages[kind] = items
+            if next_token is not None:
+                next_tokens[kind] = next_token
+        
+        continuation = None
+        if next_tokens:
+            continuation = _encode_token({"since": state["since"], "city": city, "tokens": next_tokens})
+        
+        ndjson = (req.params.get('format') == 'ndjson' or
+                  'application/x-ndjson' in (req.headers.get('Accept') or ''))
+        body, etag = _status_body(pages, continuation, ndjson)
+        headers = {"ETag": etag, "Cache-Control": f"private, max-age={STATUS_CACHE_MAX_AGE}"}
+        if req.headers.get('If-None-Match') == etag:
+            return func.HttpResponse(status_code=304, headers=headers)
         
         return func.HttpResponse(
-            json.dumps(response_data, indent=2),
+            body,
             status_code=200,
-            mimetype="application/json"
+            headers=headers,
+            mimetype="application/x-ndjson" if ndjson else "application/json"
         )
         
     except Exception as e:
-        logging.error(f"Error in weather status endpoint: {e}")
+        logging.error("Error in weather status endpoint: %s", e)
         return func.HttpResponse(
-            json.dumps({"status": "error", "message": str(e)}),
+            dumps({"status": "error", "message": str(e)}),
             status_code=500,
             mimetype="application/json"
         )
 
 @app.http_trigger(route="weather/test", auth_level=func.AuthLevel.FUNCTION)
+@profiled('weather_test')
 def weather_test(req: func.HttpRequest) -> func.HttpResponse:
     """
     HTTP endpoint to manually trigger weather check (for testing)
@@ -115,48 +194,49 @@ def weather_test(req: func.HttpRequest) -> func.HttpResponse:
     logging.info('Weather test endpoint called')
     
     try:
-        # Run the same logic as the timer trigger
-        weather_api = WeatherAPI()
-        alert_system = AlertSystem()
-        notification_system = NotificationSystem()
-        storage = AzureWeatherStorage()
+        from weather_api import split_stale
         
-        weather_data = weather_api.get_all_cities_weather()
+        # Run the same pipeline as the timer trigger
+        weather_app = get_app()
         
-        if not weather_data:
+        started = time.perf_counter()
+        fetched = weather_app.weather_api.get_all_cities_weather()
+        mark_stage('fetch')
+        fresh, stale = split_stale(fetched)
+        
+        if not fresh:
             return func.HttpResponse(
-                json.dumps({"status": "error", "message": "No weather data retrieved"}),
+                dumps({"status": "error", "message": "No weather data retrieved"}),
                 status_code=500,
                 mimetype="application/json"
             )
         
-        storage.store_weather_data(weather_data)
-        alerts = alert_system.check_alerts(weather_data)
-        
-        if alerts:
-            notification_system.send_alerts(alerts)
-            for alert in alerts:
-                storage.store_alert(alert)
+        weather_data, alerts, stored = weather_app.process_weather(fetched, started)
         
         response_data = {
             "status": "success",
             "timestamp": datetime.utcnow().isoformat(),
-            "weather_data_count": len(weather_data),
+            "weather_data_count": len(fresh),
+            "new_observations": len(weather_data),
+            "observations_stored": len(stored),
             "alerts_triggered": len(alerts),
             "cities_checked": [data['city'] for data in weather_data],
+            "cities_stale": [data['city'] for data in stale],
+            "upstream": weather_app.weather_api.metrics(),
+            "notifications": weather_app.notification_system.scheduler.metrics(),
             "alerts": [{"city": alert['city'], "type": alert['type'], "severity": alert['severity']} for alert in alerts]
         }
         
         return func.HttpResponse(
-            json.dumps(response_data, indent=2),
+            dumps(response_data, pretty=_wants_pretty(req)),
             status_code=200,
             mimetype="application/json"
         )
         
     except Exception as e:
-        logging.error(f"Error in weather test endpoint: {e}")
+        logging.error("Error in weather test endpoint: %s", e)
         return func.HttpResponse(
-            json.dumps({"status": "error", "message": str(e)}),
+            dumps({"status": "error", "message": str(e)}),
             status_code=500,
             mimetype="application/json"
         )
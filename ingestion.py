@@ -0,0 +1,130 @@
+"""
+Change-aware ingestion: each provider observation is stored and evaluated once
+
+Observations are keyed on (station, provider 'dt'). A timer polling faster
+than the provider updates gets the same observation back; such repeats are
+dropped before storage and alert evaluation. Storage is idempotent on the
+same key and reports which observations it had not stored before, so after
+a restart (or in a fresh `once`/timer process) an observation an earlier run
+stored updates its row but is not evaluated again.
+
+With INGEST_DEADBAND=true, a new observation is also not stored when every
+field stays within INGEST_DEADBAND_TOLERANCES of the last stored one for
+that station. It is still evaluated for alerts, and one observation per
+INGEST_DEADBAND_MAX_SECONDS is stored regardless.
+"""
+
+import logging
+import threading
+from derived_metrics import add_derived_metrics
+from config import INGEST_DEADBAND_ENABLED, INGEST_DEADBAND_TOLERANCES, INGEST_DEADBAND_MAX_SECONDS
+
+
+class ObservationFilter:
+    """Drops repeated observations and, optionally, stores only meaningful changes"""
+
+    def __init__(self, deadband=INGEST_DEADBAND_ENABLED, tolerances=INGEST_DEADBAND_TOLERANCES,
+                 max_seconds=INGEST_DEADBAND_MAX_SECONDS):
+        self.deadband = deadband
+        self.tolerances = tolerances
+        self.max_seconds = max_seconds
+        self._lock = threading.Lock()
+        self._last_seen = {}  # city -> provider dt of the last observation ingested
+        self._last_stored = {}  # city -> last observation stored
+        self.counters = {'received': 0, 'repeated': 0, 'already_stored': 0, 'within_deadband': 0, 'stored': 0,
+                         'store_failed': 0}
+
+    def ingest(self, weather_data, store):
+        """(new, stored): the observations to evaluate, with derived metrics added, and those newly stored
+
+        store(observations) writes a batch and returns the ones it did not
+        hold before, or None if the write failed. Observations count as seen
+        only after a successful write; when it fails they are all evaluated
+        and the write is retried on the next check.
+        """
+        new, to_store = self._select(weather_data)
+        if not new:
+            self._log_stored(weather_data, new, to_store, [])
+            return [], []
+        # One batched pass over the new observations, before they are stored or evaluated
+        add_derived_metrics(new)
+        stored = store(to_store) if to_store else []
+        if stored is None:
+            with self._lock:
+                self.counters['store_failed'] += 1
+            logging.warning("Storing observations failed; evaluating all %s and retrying next check", len(new))
+            return new, []
+
+        with self._lock:
+            self.counters['stored'] += len(stored)
+        self._log_stored(weather_data, new, to_store, stored)
+
+        inserted = {id(data) for data in stored}
+        written = {id(data) for data in to_store}
+        fresh = []
+        with self._lock:
+            for data in new:
+                if data.get('dt') is not None:
+                    self._last_seen[data['city']] = data['dt']
+                if id(data) not in written:
+                    fresh.append(data)  # within the dead band: new to this process, not stored
+                    continue
+                self._last_stored[data['city']] = data
+                if id(data) in inserted:
+                    fresh.append(data)
+            self.counters['already_stored'] += len(new) - len(fresh)
+        if len(fresh) < len(new):
+            logging.info("%s observations were already stored by an earlier run; not evaluated again",
+                         len(new) - len(fresh), extra={'stage': 'ingest', 'already_stored': len(new) - len(fresh)})
+        return fresh, stored
+
+    def _select(self, weather_data):
+        """(new, to_store): observations not seen before, and those worth storing"""
+        new = []
+        to_store = []
+        with self._lock:
+            for data in weather_data:
+                observed = data.get('dt')
+                if observed is not None and self._last_seen.get(data['city']) == observed:
+                    continue
+                new.append(data)
+                if self._worth_storing(data):
+                    to_store.append(data)
+
+            counters = self.counters
+            counters['received'] += len(weather_data)
+            counters['repeated'] += len(weather_data) - len(new)
+            counters['within_deadband'] += len(new) - len(to_store)
+        return new, to_store
+
+    def _log_stored(self, weather_data, new, to_store, stored):
+        if len(stored) < len(weather_data):
+            logging.info("Stored %s of %s observations (%s repeated, %s within dead band); writes down %.0f%% overall",
+                         len(stored), len(weather_data), len(weather_data) - len(new), len(new) - len(to_store),
+                         self.write_reduction() * 100,
+                         extra={'stage': 'ingest', 'stored': len(stored), 'received': len(weather_data)})
+
+    def _worth_storing(self, data):
+        if not self.deadband:
+            return True
+        last = self._last_stored.get(data['city'])
+        if last is None or data.get('weather_main') != last.get('weather_main'):
+            return True
+        if data.get('dt') is None or last.get('dt') is None or data['dt'] - last['dt'] >= self.max_seconds:
+            return True
+        for field, tolerance in self.tolerances.items():
+            value, previous = data.get(field), last.get(field)
+            if value is None or previous is None:
+                if value is not previous:
+                    return True
+            elif abs(value - previous) > tolerance:
+                return True
+        return False
+
+    def write_reduction(self):
+        """Fraction of received observations not written"""
+        received = self.counters['received']
+        return 1 - self.counters['stored'] / received if received else 0.0
+
+    def metrics(self):
+        return dict(self.counters, deadband=self.deadband, write_reduction=round(self.write_reduction(), 4))
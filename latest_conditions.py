@@ -0,0 +1,30 @@
+from config import LATEST_CONDITIONS_READINGS
+
+READING_FIELDS = ('observation_id', 'timestamp', 'temperature', 'feels_like', 'humidity',
+                  'wind_speed', 'visibility', 'rain_1h', 'weather_description')
+
+
+def make_reading(weather_data):
+    """The compact copy of an observation kept inline in the latest-conditions view"""
+    return {field: weather_data.get(field) for field in READING_FIELDS}
+
+
+def merge_readings(readings, weather_data, limit=LATEST_CONDITIONS_READINGS):
+    """Prepend a new observation to a city's readings, newest first (replacing it if stored again)"""
+    reading = make_reading(weather_data)
+    readings = list(readings or [])
+    if reading['observation_id'] is not None:
+        readings = [r for r in readings if r.get('observation_id') != reading['observation_id']]
+    return [reading] + readings[:limit - 1]
+
+
+def conditions_entry(city, readings, updated_at):
+    """One city's row in the view: its latest reading plus the recent ones"""
+    return {'city': city, **readings[0], 'readings': readings, 'updated_at': updated_at}
+
+
+def apply_to_view(view, weather_data_list, limit=LATEST_CONDITIONS_READINGS):
+    """Fold a batch of observations, in order, into a {city: readings} dict"""
+    for data in weather_data_list:
+        view[data['city']] = merge_readings(view.get(data['city']), data, limit)
+    return view
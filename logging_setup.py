@@ -0,0 +1,148 @@
+import atexit
+import json
+import logging
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from config import (
+    LOG_LEVEL, LOG_FILE, LOG_FORMAT, LOG_RATE_LIMIT_BURST, LOG_RATE_LIMIT_INTERVAL, LOG_SAMPLE_EVERY
+)
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Attributes every LogRecord has; anything else came in through `extra=`
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with `extra=` fields (stage, cities, ...) as keys"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage()
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class RateLimitFilter(logging.Filter):
+    """Caps repetitive INFO/DEBUG lines, keyed by logger and message template
+
+    Each template may log `burst` times per `interval` seconds; beyond that
+    only every `sample_every`-th record passes, carrying a `suppressed` count.
+    Warnings and errors always pass. Relies on %-style templates: f-strings
+    make every line a distinct key.
+    """
+
+    def __init__(self, burst=LOG_RATE_LIMIT_BURST, interval=LOG_RATE_LIMIT_INTERVAL,
+                 sample_every=LOG_SAMPLE_EVERY):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self.sample_every = sample_every
+        self._windows = {}  # key -> [window_start, count, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self.burst:
+            return True
+
+        now = time.monotonic()
+        key = (record.name, record.msg)
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window else 0
+                self._windows[key] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+                return True
+
+            window[1] += 1
+            if window[1] <= self.burst:
+                return True
+            if self.sample_every and (window[1] - self.burst) % self.sample_every == 0:
+                record.suppressed = window[2]
+                window[2] = 0
+                return True
+            window[2] += 1
+            return False
+
+
+class DeferredQueueHandler(QueueHandler):
+    """Enqueues records unformatted so message formatting runs on the listener thread
+
+    QueueHandler.prepare() merges args into the message in the caller's
+    thread. Records stay in this process, so only tracebacks (which pin
+    frames) are rendered eagerly.
+    """
+
+    def prepare(self, record):
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging(level=LOG_LEVEL, log_file=LOG_FILE, fmt=LOG_FORMAT, console=True, force=False):
+    """Route the root logger through a queue to file/console handlers on a background thread
+
+    Like logging.basicConfig, does nothing if the root logger already has
+    handlers unless force=True.
+    """
+    global _listener
+    root = logging.getLogger()
+    if root.handlers and not force:
+        return None
+    stop_logging()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+
+    formatter = JsonFormatter() if fmt == 'json' else logging.Formatter(TEXT_FORMAT)
+    handlers = []
+    if log_file:
+        handlers.append(logging.FileHandler(log_file))
+    if console:
+        handlers.append(logging.StreamHandler())
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    queue_handler = DeferredQueueHandler(queue.SimpleQueue())
+    queue_handler.addFilter(RateLimitFilter())
+    root.addHandler(queue_handler)
+    root.setLevel(getattr(logging, level) if isinstance(level, str) else level)
+
+    _listener = QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def install_rate_limit(logger=None):
+    """Rate-limit a logger whose handlers someone else owns, e.g. the Azure Functions host's root logger"""
+    logger = logger or logging.getLogger()
+    if not any(isinstance(existing, RateLimitFilter) for existing in logger.filters):
+        logger.addFilter(RateLimitFilter())
+
+
+def stop_logging():
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
@@ -8,68 +8,117 @@ import logging
 import schedule
 import time
 from datetime import datetime
-from weather_api import WeatherAPI
+from weather_api import WeatherAPI, split_stale
 from alert_system import AlertSystem
 from notification_system import NotificationSystem
 from database import WeatherDatabase
-from config import LOG_LEVEL, LOG_FILE
+from logging_setup import setup_logging
+from config import FORECAST_ENABLED, SHARED_LATEST_ENABLED, SHARED_LATEST_CAPACITY
+import profiling
 
-# Configure logging
-logging.basicConfig(
-    level=getattr(logging, LOG_LEVEL),
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(LOG_FILE),
-        logging.StreamHandler()
-    ]
-)
+def _elapsed_ms(started):
+    return round((time.perf_counter() - started) * 1000, 1)
 
 class WeatherAlertApp:
-    def __init__(self):
-        self.weather_api = WeatherAPI()
-        self.alert_system = AlertSystem()
-        self.notification_system = NotificationSystem()
-        self.database = WeatherDatabase()
+    def __init__(self, weather_api=None, alert_system=None, notification_system=None, database=None,
+                 forecast_monitor=None):
+        self.weather_api = weather_api or WeatherAPI()
+        self.alert_system = alert_system or AlertSystem()
+        if forecast_monitor is None and FORECAST_ENABLED:
+            from forecast import ForecastMonitor
+            forecast_monitor = ForecastMonitor(self.weather_api.providers, self.alert_system)
+        self.forecast_monitor = forecast_monitor
+        self.database = database or WeatherDatabase()
+        self.notification_system = notification_system or NotificationSystem(subscriptions=self.database)
+        self.shared_latest = None  # SharedLatestWriter while running as the scheduler
+        self.alert_system.preload_trends(self.database)
         
+    @profiling.profiled('check_weather_and_alerts')
     def check_weather_and_alerts(self):
         """Main function to check weather and send alerts"""
-        logging.info("Starting weather check...")
+        logging.info("Starting weather check...", extra={'stage': 'start'})
         
         try:
             # Fetch weather data for all cities
+            started = time.perf_counter()
             weather_data = self.weather_api.get_all_cities_weather()
+            profiling.mark_stage('fetch')
+            self.process_weather(weather_data, started)
+                
+        except Exception as e:
+            logging.error("Error in weather check: %s", e)
+    
+    def process_weather(self, weather_data, started=None):
+        """Store, evaluate and notify on a check's fetched observations
+        
+        Returns (new observations, alerts, observations stored). Shared by
+        check_weather_and_alerts, the async service, which fetches concurrently
+        and then runs this off its event loop, and the Azure Functions entry
+        points, whose `database` is AzureWeatherStorage. `started` is when the
+        fetch began, for its timing.
+        """
+        weather_data, stale = split_stale(weather_data)
+        if stale:
+            # Last-known-good readings: not stored again or alerted on
+            logging.warning("Upstream unavailable for %d cities, skipping their stale readings", len(stale),
+                            extra={'stage': 'fetch', 'cities': len(stale)})
+        
+        if not weather_data:
+            logging.warning("No weather data retrieved", extra={'stage': 'fetch'})
+            return [], [], []
+        logging.info("Fetched weather for %d cities", len(weather_data),
+                     extra={'stage': 'fetch', 'cities': len(weather_data),
+                            'ms': _elapsed_ms(started) if started is not None else None})
+        
+        # Store weather data in database; observations already seen or stored
+        # are neither stored nor evaluated again
+        started = time.perf_counter()
+        weather_data, stored = self.weather_api.ingestion.ingest(weather_data, self.database.store_weather_data)
+        profiling.mark_stage('store')
+        logging.debug("Stored weather data", extra={'stage': 'store', 'ms': _elapsed_ms(started)})
+        if not weather_data:
+            logging.info("No new observations since the last check", extra={'stage': 'ingest'})
+            return [], [], stored
+        
+        # Check for alerts
+        started = time.perf_counter()
+        alerts = self.alert_system.check_alerts(weather_data)
+        if self.forecast_monitor is not None:
+            alerts.extend(self.forecast_monitor.check_alerts())
+        if self.shared_latest is not None:
+            self.shared_latest.publish(weather_data, alerts)
+        profiling.mark_stage('evaluate')
+        
+        if alerts:
+            logging.info("Found %s alerts", len(alerts),
+                         extra={'stage': 'evaluate', 'alerts': len(alerts), 'ms': _elapsed_ms(started)})
             
-            if not weather_data:
-                logging.warning("No weather data retrieved")
-                return
-            
-            # Store weather data in database
-            self.database.store_weather_data(weather_data)
-            
-            # Check for alerts
-            alerts = self.alert_system.check_alerts(weather_data)
+            # Send notifications; alerts deferred by rate limits are stored as
+            # not sent, and marked sent by the check that delivers them
+            started = time.perf_counter()
+            delivered = {id(alert): alert for alert in self.notification_system.send_alerts(alerts)}
             
-            if alerts:
-                logging.info(f"Found {len(alerts)} alerts")
-                
-                # Send notifications
-                self.notification_system.send_alerts(alerts)
-                
-                # Store alerts in database
-                for alert in alerts:
-                    self.database.store_alert(alert, email_sent=True, sms_sent=False)
-                    
-            else:
-                logging.info("No alerts triggered")
-                
-            # Log current conditions
-            for data in weather_data:
-                logging.info(f"{data['city']}: {data['temperature']:.1f}°F, "
-                           f"Wind: {data['wind_speed']:.1f}mph, "
-                           f"Conditions: {data['weather_description']}")
+            # Store alerts in database
+            for alert in alerts:
+                self.database.store_alert(alert, email_sent=delivered.pop(id(alert), None) is not None,
+                                          sms_sent=False)
+            self.database.mark_alerts_sent(list(delivered.values()))
+            profiling.mark_stage('notify')
+            logging.info("Notified and stored %d alerts", len(alerts),
+                         extra={'stage': 'notify', 'alerts': len(alerts), 'ms': _elapsed_ms(started)})
                 
-        except Exception as e:
-            logging.error(f"Error in weather check: {e}")
+        else:
+            logging.info("No alerts triggered", extra={'stage': 'evaluate', 'alerts': 0,
+                                                       'ms': _elapsed_ms(started)})
+            # Alerts deferred by rate limits
+            self.database.mark_alerts_sent(self.notification_system.send_alerts([]))
+            
+        # Log current conditions
+        for data in weather_data:
+            logging.info("%s: %.1f°F, Wind: %.1fmph, Conditions: %s", data['city'], data['temperature'],
+                         data['wind_speed'], data['weather_description'],
+                         extra={'stage': 'conditions', 'city': data['city']})
+        return weather_data, alerts, stored
     
     def run_once(self):
         """Run the weather check once"""
@@ -77,10 +126,22 @@ class WeatherAlertApp:
         self.check_weather_and_alerts()
         print("Weather check completed.")
     
+    def open_shared_latest(self):
+        """Publish the latest state per station to other local processes (SHARED_LATEST=true)"""
+        if not SHARED_LATEST_ENABLED:
+            return
+        from shared_latest import SharedLatestWriter
+        try:
+            capacity = max(SHARED_LATEST_CAPACITY, len(self.weather_api.station_index))
+            self.shared_latest = SharedLatestWriter(capacity=capacity)
+        except (OSError, RuntimeError) as e:
+            logging.warning("Not publishing latest conditions to shared memory: %s", e)
+    
     def run_scheduler(self):
         """Run the scheduler for continuous monitoring"""
         print("Starting Arizona Weather Alert System...")
         print("Checking weather every hour...")
+        self.open_shared_latest()
         
         # Schedule weather checks every hour
         schedule.every().hour.do(self.check_weather_and_alerts)
@@ -93,30 +154,102 @@ class WeatherAlertApp:
             schedule.run_pending()
             time.sleep(60)  # Check every minute for scheduled tasks
     
-    def show_recent_data(self, hours=24):
-        """Show recent weather data and alerts"""
-        print(f"\n=== Recent Weather Data (Last {hours} hours) ===")
-        weather_data = self.database.get_recent_weather(hours=hours)
-        
-        if weather_data:
-            for row in weather_data[-10:]:  # Show last 10 entries
-                print(f"{row[1]}: {row[2]:.1f}°F, Wind: {row[6]:.1f}mph - {row[12]}")
-        else:
+    def run_service(self):
+        """Run the asyncio service with deadline scheduling and a health endpoint"""
+        from async_service import AsyncWeatherService
+        
+        print("Starting Arizona Weather Alert System (async service)...")
+        self.open_shared_latest()
+        AsyncWeatherService(self).run()
+    
+    def show_recent_data(self, hours=24, limit=10):
+        """Show the newest weather data and recent alerts"""
+        print(f"\n=== Recent Weather Data (Last {hours} hours, newest {limit}) ===")
+        weather_data = self.database.iter_recent_weather(
+            hours=hours, limit=limit,
+            columns=('city', 'temperature', 'wind_speed', 'weather_description', 'timestamp'))
+        
+        shown = 0
+        for row in weather_data:
+            print(f"{row['city']}: {row['temperature']:.1f}°F, Wind: {row['wind_speed']:.1f}mph - "
+                  f"{row['weather_description']} ({row['timestamp']})")
+            shown += 1
+        if not shown:
             print("No recent weather data found")
         
         print(f"\n=== Recent Alerts (Last {hours} hours) ===")
-        alerts = self.database.get_recent_alerts(hours=hours)
+        alerts = self.database.iter_recent_alerts(
+            hours=hours, columns=('alert_type', 'city', 'severity', 'created_at'))
         
-        if alerts:
-            for alert in alerts:
-                print(f"{alert[1]} - {alert[2]} ({alert[4]}) - {alert[7]}")
-        else:
+        shown = 0
+        for alert in alerts:
+            print(f"{alert['alert_type']} - {alert['city']} ({alert['severity']}) - {alert['created_at']}")
+            shown += 1
+        if not shown:
             print("No recent alerts found")
 
+    def show_latest_conditions(self):
+        """Show the latest reading per city from the latest-conditions view"""
+        print("\n=== Latest Conditions ===")
+        conditions = self.database.get_latest_conditions()
+        
+        if not conditions:
+            print("No weather data found")
+            return
+        
+        for entry in conditions:
+            readings = entry['readings']
+            change = ""
+            if len(readings) > 1 and readings[-1]['temperature'] is not None:
+                change = f" ({entry['temperature'] - readings[-1]['temperature']:+.1f}°F over {len(readings)} readings)"
+            print(f"{entry['city']}: {entry['temperature']:.1f}°F{change}, "
+                  f"Wind: {entry['wind_speed']:.1f}mph, Visibility: {entry['visibility']:.1f}mi - "
+                  f"{entry['weather_description']} at {entry['timestamp']}")
+
+def show_shared_latest():
+    """Print the latest conditions from the scheduler's shared-memory table; False if it is unavailable or stale"""
+    if not SHARED_LATEST_ENABLED:
+        return False
+    from shared_latest import open_reader
+    reader = open_reader()
+    if reader is None:
+        return False
+    
+    with reader:
+        print(f"\n=== Latest Conditions (published {reader.age():.0f}s ago) ===")
+        for entry in reader:
+            if entry['temperature'] is None:
+                continue
+            alerts = f" [{', '.join(entry['alerts'])}]" if entry['alerts'] else ""
+            heat_index = f", Heat index: {entry['heat_index']:.0f}°F" if entry['heat_index'] is not None else ""
+            print(f"{entry['city']}: {entry['temperature']:.1f}°F{heat_index}, "
+                  f"Wind: {entry['wind_speed']:.1f}mph, Visibility: {entry['visibility']:.1f}mi - "
+                  f"{entry['weather_description']} at {entry['timestamp']}{alerts}")
+    return True
+
+def print_usage():
+    """Print command-line usage"""
+    print("Usage:")
+    print("  python main.py once      - Run weather check once")
+    print("  python main.py once --profile - Also write cProfile/allocation reports to PROFILE_DIR")
+    print("  python main.py schedule  - Run continuous monitoring")
+    print("  python main.py serve     - Run async service with health endpoint")
+    print("  python main.py now       - Show the latest conditions per city")
+    print("  python main.py history [hours] - Show recent data")
+    print("  python main.py backtest [--from DATE] [--to DATE] - Replay history through alert rules")
+    print("  python main.py archive --before DATE - Move older history into compressed archive files")
+    print("  python main.py subscribers add|remove|list - Manage alert subscribers")
+
 def main():
     """Main entry point"""
     import sys
     
+    setup_logging()
+    if '--profile' in sys.argv:
+        sys.argv.remove('--profile')
+        profiling.enable()
+    if len(sys.argv) > 1 and sys.argv[1].lower() == "now" and show_shared_latest():
+        return  # served by the running scheduler, without touching the database
     app = WeatherAlertApp()
     
     if len(sys.argv) > 1:
@@ -124,22 +257,29 @@ def main():
         
         if command == "once":
             app.run_once()
+        elif command == "now":
+            app.show_latest_conditions()
         elif command == "history":
             hours = int(sys.argv[2]) if len(sys.argv) > 2 else 24
             app.show_recent_data(hours)
         elif command == "schedule":
             app.run_scheduler()
+        elif command == "serve":
+            app.run_service()
+        elif command == "backtest":
+            from backtest import main as run_backtest
+            run_backtest(sys.argv[2:])
+        elif command == "archive":
+            from archive import main as run_archive
+            run_archive(sys.argv[2:])
+        elif command == "subscribers":
+            from subscriptions import main as manage_subscribers
+            manage_subscribers(sys.argv[2:])
         else:
-            print("Usage:")
-            print("  python main.py once      - Run weather check once")
-            print("  python main.py schedule  - Run continuous monitoring")
-            print("  python main.py history [hours] - Show recent data")
+            print_usage()
     else:
         print("Arizona Weather Alert System")
-        print("Usage:")
-        print("  python main.py once      - Run weather check once")
-        print("  python main.py schedule  - Run continuous monitoring")
-        print("  python main.py history [hours] - Show recent data")
+        print_usage()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,280 @@
+"""
+Priority notification scheduling with token-bucket rate limits
+
+Alerts are queued by severity (CRITICAL first, then in arrival order) and
+sent while the provider's token bucket (recipients per hour, e.g. Gmail's
+sending limits) and each recipient's bucket (emails per hour) allow. When
+the provider is short of tokens the scheduler waits, up to
+NOTIFY_MAX_WAIT_SECONDS per check, so a burst goes out at the provider's
+rate; beyond that, the rest stays queued for the next check. Lower severities
+never overtake a waiting higher one.
+
+Deferred alerts are coalesced: a newer alert for the same city and alert
+type replaces the queued one and joins its recipients, so a recipient who
+is over their limit later gets the current alert instead of a backlog.
+Alerts of NOTIFY_LIMIT_EXEMPT_SEVERITY ignore per-recipient limits.
+
+Schedulers are shared per provider within a process, so limits and the
+queue hold across NotificationSystem instances and warm Azure Functions
+invocations.
+"""
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+from config import (
+    NOTIFY_PROVIDER_LIMITS, NOTIFY_DEFAULT_PROVIDER_LIMIT, NOTIFY_RECIPIENT_LIMIT, NOTIFY_LIMIT_EXEMPT_SEVERITY,
+    NOTIFY_MAX_WAIT_SECONDS, NOTIFY_DEFERRED_MAX_AGE_SECONDS
+)
+from subscriptions import SEVERITIES
+
+SEVERITY_RANK = {severity: rank for rank, severity in enumerate(SEVERITIES)}
+
+
+class TokenBucket:
+    """`rate` tokens per second up to `capacity`; starts full"""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    @classmethod
+    def per_hour(cls, limit, now):
+        """Bucket for a (rate per hour, burst) limit, or None when unlimited"""
+        if limit is None:
+            return None
+        rate, burst = limit
+        return cls(rate / 3600, burst, now)
+
+    def available(self, now):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+        return self.tokens
+
+    def wait_time(self, n, now):
+        """Seconds until n tokens are available"""
+        missing = n - self.available(now)
+        return missing / self.rate if missing > 0 else 0.0
+
+    def take(self, n, now):
+        self.tokens = max(0.0, self.available(now) - n)
+
+
+class Delivery:
+    """A queued alert and the recipients it has not reached yet"""
+
+    __slots__ = ('alert', 'recipients', 'rank', 'seq', 'queued_at', 'coalesced')
+
+    def __init__(self, alert, recipients, rank, seq, queued_at):
+        self.alert = alert
+        self.recipients = set(recipients)
+        self.rank = rank
+        self.seq = seq
+        self.queued_at = queued_at
+        self.coalesced = 0
+
+
+class NotificationScheduler:
+    """Severity-ordered queue of alerts, sent within provider and recipient rate limits"""
+
+    def __init__(self, provider, provider_limit=NOTIFY_DEFAULT_PROVIDER_LIMIT, recipient_limit=NOTIFY_RECIPIENT_LIMIT,
+                 max_wait=NOTIFY_MAX_WAIT_SECONDS, max_age=NOTIFY_DEFERRED_MAX_AGE_SECONDS,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.provider = provider
+        self.clock = clock
+        self.sleep = sleep
+        self.bucket = TokenBucket.per_hour(provider_limit, clock())
+        self.recipient_limit = recipient_limit
+        self.exempt_rank = SEVERITY_RANK.get(NOTIFY_LIMIT_EXEMPT_SEVERITY, len(SEVERITIES))
+        self.max_wait = max_wait
+        self.max_age = max_age
+        self._recipient_buckets = {}  # address -> TokenBucket, only while not full
+        self._pending = {}  # (city, alert type) -> Delivery
+        self._heap = []  # (-rank, seq, key); entries not matching _pending are stale
+        self._seq = itertools.count()
+        self._lock = threading.RLock()
+        self.counters = {'submitted': 0, 'sent': 0, 'failed': 0, 'coalesced': 0, 'deferred': 0, 'expired': 0,
+                         'waited_seconds': 0.0}
+
+    def pending(self):
+        return len(self._pending)
+
+    def submit(self, alert, recipients):
+        """Queue an alert for its recipients, coalescing with a queued alert of the same city and type"""
+        key = (alert['city'], alert['type'])
+        rank = SEVERITY_RANK.get(alert['severity'], 0)
+        with self._lock:
+            self.counters['submitted'] += 1
+            delivery = self._pending.get(key)
+            if delivery is None:
+                delivery = Delivery(alert, recipients, rank, next(self._seq), self.clock())
+                self._pending[key] = delivery
+                heapq.heappush(self._heap, (-rank, delivery.seq, key))
+                return
+
+            delivery.alert = alert
+            delivery.recipients.update(recipients)
+            delivery.queued_at = self.clock()
+            delivery.coalesced += 1
+            self.counters['coalesced'] += 1
+            if rank > delivery.rank:
+                delivery.rank = rank
+                heapq.heappush(self._heap, (-rank, delivery.seq, key))
+
+    def drain(self, deliver):
+        """Call deliver(alert, recipients) by severity while limits allow; returns the alerts delivered
+
+        deliver returns True once sent; on failure its recipients are queued
+        again for the next drain. An alert is returned once it reached any
+        recipient, in delivery order. The lock is not held while waiting for
+        provider tokens or delivering, so submits and metrics() go on meanwhile.
+        """
+        sent = 0
+        delivered_alerts = {}  # id -> alert
+        waited = 0.0
+        parked = []  # heap entries waiting only on recipient limits
+        failed = []  # deliveries to queue again
+        try:
+            while True:
+                with self._lock:
+                    due = self._take_due(parked, waited)
+                if due is None:
+                    break
+                wait, taken = due
+                if taken is None:
+                    self.sleep(wait)
+                    waited += wait
+                    continue
+                delivered = False
+                try:
+                    delivered = bool(deliver(taken.alert, sorted(taken.recipients)))
+                finally:
+                    if delivered:
+                        sent += 1
+                        delivered_alerts.setdefault(id(taken.alert), taken.alert)
+                    else:
+                        failed.append(taken)
+        finally:
+            with self._lock:
+                for entry in parked:
+                    heapq.heappush(self._heap, entry)
+                for taken in failed:
+                    self._requeue(taken)
+                self._prune(self.clock())
+                self.counters['sent'] += sent
+                self.counters['failed'] += len(failed)
+                self.counters['waited_seconds'] += waited
+                if self._pending:
+                    self.counters['deferred'] += len(self._pending)
+                    logging.info("%s alerts deferred by %s rate limits or failures (%s recipients waiting)",
+                                 len(self._pending), self.provider,
+                                 sum(len(delivery.recipients) for delivery in self._pending.values()),
+                                 extra={'stage': 'notify', 'deferred': len(self._pending)})
+        return list(delivered_alerts.values())
+
+    def _take_due(self, parked, waited):
+        """The next delivery due, with its recipients taken off the queue and out of the buckets
+
+        Returns (0, Delivery), (seconds to wait for provider tokens, None), or
+        None when nothing more can go out in this drain. Called with the lock held.
+        """
+        while self._heap:
+            now = self.clock()
+            entry = self._heap[0]
+            key = entry[2]
+            delivery = self._pending.get(key)
+            if delivery is None or (-delivery.rank, delivery.seq) != entry[:2]:
+                heapq.heappop(self._heap)
+                continue
+            if now - delivery.queued_at > self.max_age:
+                heapq.heappop(self._heap)
+                del self._pending[key]
+                self.counters['expired'] += 1
+                logging.warning("Dropped %s alert for %s deferred for over %.0f s", key[1], key[0], self.max_age)
+                continue
+
+            exempt = delivery.rank >= self.exempt_rank
+            recipients = sorted(address for address in delivery.recipients
+                                if exempt or self._recipient_allows(address, now))
+            if not recipients:
+                parked.append(heapq.heappop(self._heap))
+                continue
+
+            if self.bucket is not None:
+                recipients = recipients[:max(1, int(self.bucket.capacity))]
+                wait = self.bucket.wait_time(len(recipients), now)
+                if waited + wait > self.max_wait:
+                    return None  # nothing of lower severity goes ahead of it
+                if wait > 0:
+                    return wait, None
+                self.bucket.take(len(recipients), now)
+            self._take_recipients(recipients, now)
+
+            delivery.recipients.difference_update(recipients)
+            if not delivery.recipients:
+                heapq.heappop(self._heap)
+                del self._pending[key]
+            return 0.0, Delivery(delivery.alert, recipients, delivery.rank, delivery.seq, delivery.queued_at)
+        return None
+
+    def _requeue(self, taken):
+        """Queue a failed delivery's recipients again, joining a newer alert of the same city and type"""
+        key = (taken.alert['city'], taken.alert['type'])
+        delivery = self._pending.get(key)
+        if delivery is None:
+            self._pending[key] = taken
+            heapq.heappush(self._heap, (-taken.rank, taken.seq, key))
+            return
+        delivery.recipients.update(taken.recipients)
+        if taken.rank > delivery.rank:
+            delivery.rank = taken.rank
+            heapq.heappush(self._heap, (-delivery.rank, delivery.seq, key))
+
+    def _recipient_allows(self, address, now):
+        bucket = self._recipient_buckets.get(address)
+        return bucket is None or bucket.available(now) >= 1
+
+    def _take_recipients(self, recipients, now):
+        if self.recipient_limit is None:
+            return
+        buckets = self._recipient_buckets
+        for address in recipients:
+            bucket = buckets.get(address)
+            if bucket is None:
+                bucket = buckets[address] = TokenBucket.per_hour(self.recipient_limit, now)
+            bucket.take(1, now)
+
+    def _prune(self, now):
+        """Forget recipients whose buckets have refilled"""
+        full = [address for address, bucket in self._recipient_buckets.items()
+                if bucket.available(now) >= bucket.capacity]
+        for address in full:
+            del self._recipient_buckets[address]
+
+    def metrics(self):
+        with self._lock:
+            tokens = self.bucket.available(self.clock()) if self.bucket is not None else None
+            return dict(self.counters, provider=self.provider, pending=len(self._pending),
+                        provider_tokens=round(tokens, 1) if tokens is not None else None,
+                        limited_recipients=len(self._recipient_buckets))
+
+
+_lock = threading.Lock()
+_schedulers = {}  # provider -> NotificationScheduler
+
+
+def get_scheduler(provider):
+    """The process-wide scheduler for a provider (an SMTP server name)"""
+    with _lock:
+        scheduler = _schedulers.get(provider)
+        if scheduler is None:
+            limit = NOTIFY_PROVIDER_LIMITS.get(provider, NOTIFY_DEFAULT_PROVIDER_LIMIT)
+            scheduler = _schedulers[provider] = NotificationScheduler(provider, provider_limit=limit)
+        return scheduler
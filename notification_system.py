@@ -2,143 +2,177 @@ import smtplib
 import logging
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from alert_templates import EmailRenderer
+from subscriptions import SubscriberDirectory
+from notification_scheduler import get_scheduler
 from config import (
-    EMAIL_SMTP_SERVER, EMAIL_SMTP_PORT, EMAIL_ADDRESS, EMAIL_PASSWORD, RECIPIENT_EMAIL
+    EMAIL_SMTP_SERVER, EMAIL_SMTP_PORT, EMAIL_SMTP_STARTTLS, EMAIL_ADDRESS, EMAIL_PASSWORD, RECIPIENT_EMAIL,
+    SMTP_MAX_RECIPIENTS
 )
 
+UNDISCLOSED_RECIPIENTS = 'undisclosed-recipients:;'
+
+
+class SMTPSession:
+    """One SMTP connection shared by a batch of alerts, opened on first use
+
+    A failed transaction drops the connection; the next send reconnects.
+    """
+
+    def __init__(self, notifier):
+        self.notifier = notifier
+        self.server = None
+        self.transactions = 0
+
+    def sendmail(self, sender, recipients, message):
+        if self.server is None:
+            self.server = self.notifier._connect()
+        try:
+            refused = self.server.sendmail(sender, recipients, message)
+        except smtplib.SMTPServerDisconnected:
+            # Idle connection dropped by the server: reconnect once
+            self.server = self.notifier._connect()
+            refused = self.server.sendmail(sender, recipients, message)
+        except Exception:
+            self.close()
+            raise
+        self.transactions += 1
+        return refused
+
+    def close(self):
+        if self.server:
+            try:
+                self.server.quit()
+            except:
+                pass
+        self.server = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
 class NotificationSystem:
-    def __init__(self):
-        self.email_configured = all([EMAIL_ADDRESS, EMAIL_PASSWORD, RECIPIENT_EMAIL])
-    
+    def __init__(self, smtp_server=EMAIL_SMTP_SERVER, smtp_port=EMAIL_SMTP_PORT, use_starttls=EMAIL_SMTP_STARTTLS,
+                 sender=EMAIL_ADDRESS, password=EMAIL_PASSWORD, recipient=RECIPIENT_EMAIL, subscriptions=None,
+                 max_recipients=SMTP_MAX_RECIPIENTS, scheduler=None):
+        self.smtp_server = smtp_server
+        self.smtp_port = smtp_port
+        self.use_starttls = use_starttls
+        self.sender = sender
+        self.password = password
+        self.recipient = recipient
+        # Store with get_subscriptions(), e.g. WeatherDatabase or AzureWeatherStorage
+        self.subscribers = SubscriberDirectory(subscriptions) if subscriptions is not None else None
+        self.max_recipients = max_recipients
+        self.email_configured = all([sender, password]) and bool(recipient or subscriptions is not None)
+        self.renderer = EmailRenderer()
+        # Shared per SMTP server, so rate limits hold across instances
+        self.scheduler = scheduler or get_scheduler(smtp_server)
+
+    def recipients(self, alert):
+        """Addresses for an alert: RECIPIENT_EMAIL plus matching subscribers"""
+        recipients = set()
+        if self.subscribers is not None:
+            recipients.update(self.subscribers.recipients(alert['city'], alert['type'], alert['severity']))
+        if self.recipient:
+            recipients.add(self.recipient)
+        return sorted(recipients)
+
     def send_alerts(self, alerts):
-        """Send all alerts via email"""
-        if not alerts:
-            return
-            
-        for alert in alerts:
-            self._send_email_alert(alert)
-    
-    def _send_email_alert(self, alert):
-        """Send email notification"""
+        """Send alerts via email over one SMTP connection, most severe first
+
+        Alerts over the provider or recipient rate limits stay queued, along
+        with earlier deferred ones, for the next call. Returns the alerts
+        emailed by this call, which may include earlier deferred ones.
+        """
         if not self.email_configured:
-            logging.warning("Email not configured, skipping email alert")
-            return
-            
-        try:
-            msg = MIMEMultipart()
-            msg['From'] = EMAIL_ADDRESS
-            msg['To'] = RECIPIENT_EMAIL
-            msg['Subject'] = f"Arizona Weather Alert - {alert['severity']} - {alert['city']}"
-            
-            # Create detailed email body
-            body = self._create_email_body(alert)
-            msg.attach(MIMEText(body, 'html'))
-            
-            # Send email with improved connection handling
-            server = None
-            email_sent = False
+            if alerts:
+                logging.warning("Email not configured, skipping email alert")
+            return []
+
+        for alert in alerts:
             try:
-                # Use STARTTLS with shorter timeout and better error handling
-                server = smtplib.SMTP('smtp.gmail.com', 587, timeout=10)
-                server.ehlo()
+                recipients = self.recipients(alert)
+            except Exception as e:
+                logging.error("Failed to route email alert: %s", e)
+                continue
+            if recipients:
+                self.scheduler.submit(alert, recipients)
+            else:
+                logging.debug("No subscribers for %s alert in %s", alert['type'], alert['city'])
+
+        if not self.scheduler.pending():
+            return []
+
+        # Renderings are shared within a tick only
+        self.renderer.new_tick()
+        with SMTPSession(self) as session:
+            return self.scheduler.drain(lambda alert, recipients: self._send_email_alert(alert, recipients, session))
+
+    def send_alert(self, alert):
+        """Send a single alert via email"""
+        return self.send_alerts([alert])
+
+    def _connect(self):
+        # Use STARTTLS with shorter timeout and better error handling
+        server = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=10)
+        try:
+            server.ehlo()
+            if self.use_starttls:
                 server.starttls()
                 server.ehlo()
-                server.login(EMAIL_ADDRESS, EMAIL_PASSWORD)
-                text = msg.as_string()
-                server.sendmail(EMAIL_ADDRESS, RECIPIENT_EMAIL, text)
-                logging.info(f"Email alert sent successfully for {alert['city']}")
+            server.login(self.sender, self.password)
+        except Exception:
+            server.close()
+            raise
+        return server
+
+    def _send_email_alert(self, alert, recipients, session):
+        """Send one email per alert, to all its recipients in as few transactions as possible; True if sent"""
+        try:
+            subject, html_body, text_body = self.renderer.render(alert)
+
+            # Plain text first: clients show the last alternative they support.
+            # Subscribers are envelope recipients only (BCC), so none sees the others.
+            msg = MIMEMultipart('alternative')
+            msg['From'] = self.sender
+            msg['To'] = recipients[0] if len(recipients) == 1 else UNDISCLOSED_RECIPIENTS
+            msg['Subject'] = subject
+            msg.attach(MIMEText(text_body, 'plain', 'utf-8'))
+            msg.attach(MIMEText(html_body, 'html', 'utf-8'))
+            text = msg.as_string()
+
+            email_sent = False
+            refused = {}
+            try:
+                for start in range(0, len(recipients), self.max_recipients):
+                    refused.update(session.sendmail(self.sender, recipients[start:start + self.max_recipients], text))
+                logging.info("Email alert sent successfully for %s to %s recipients", alert['city'],
+                             len(recipients) - len(refused))
                 email_sent = True
             except smtplib.SMTPAuthenticationError as auth_error:
-                logging.error(f"Email authentication failed: {auth_error}")
-                email_sent = False
+                logging.error("Email authentication failed: %s", auth_error)
             except smtplib.SMTPConnectError as conn_error:
-                logging.error(f"Failed to connect to SMTP server: {conn_error}")
-                email_sent = False
+                logging.error("Failed to connect to SMTP server: %s", conn_error)
             except Exception as e:
-                logging.error(f"Email sending failed: {e}")
-                email_sent = False
-            finally:
-                if server:
-                    try:
-                        server.quit()
-                    except:
-                        pass
-            
+                logging.error("Email sending failed: %s", e)
+
+            if refused:
+                logging.warning("SMTP server refused %s recipients for %s", len(refused), alert['city'])
             if email_sent:
-                logging.info(f"Email alert sent for {alert['city']}: {alert['type']}")
+                logging.info("Email alert sent for %s: %s", alert['city'], alert['type'])
             else:
-                logging.warning(f"Email alert FAILED for {alert['city']}: {alert['type']}")
-            
+                logging.warning("Email alert FAILED for %s: %s", alert['city'], alert['type'])
+            return email_sent
+
         except Exception as e:
-            logging.error(f"Failed to send email alert: {e}")
-    
-    
+            logging.error("Failed to send email alert: %s", e)
+            return False
+
+
     def _create_email_body(self, alert):
         """Create detailed HTML email body"""
-        weather = alert['weather_data']
-        
-        severity_colors = {
-            'CRITICAL': '#FF0000',
-            'HIGH': '#FF6600',
-            'MEDIUM': '#FFAA00',
-            'LOW': '#00AA00'
-        }
-        
-        color = severity_colors.get(alert['severity'], '#666666')
-        
-        html_body = f"""
-        <html>
-        <body style="font-family: Arial, sans-serif; margin: 20px;">
-            <div style="border-left: 5px solid {color}; padding-left: 20px; margin-bottom: 20px;">
-                <h2 style="color: {color}; margin-top: 0;">Arizona Weather Alert - {alert['severity']}</h2>
-                <h3>{alert['message']}</h3>
-            </div>
-            
-            <div style="background-color: #f5f5f5; padding: 15px; border-radius: 5px;">
-                <h4>Current Weather Conditions - {weather['city']}</h4>
-                <table style="width: 100%; border-collapse: collapse;">
-                    <tr>
-                        <td style="padding: 5px; border-bottom: 1px solid #ddd;"><strong>Temperature:</strong></td>
-                        <td style="padding: 5px; border-bottom: 1px solid #ddd;">{weather['temperature']:.1f}°F (feels like {weather['feels_like']:.1f}°F)</td>
-                    </tr>
-                    <tr>
-                        <td style="padding: 5px; border-bottom: 1px solid #ddd;"><strong>Wind:</strong></td>
-                        <td style="padding: 5px; border-bottom: 1px solid #ddd;">{weather['wind_speed']:.1f} mph</td>
-                    </tr>
-                    <tr>
-                        <td style="padding: 5px; border-bottom: 1px solid #ddd;"><strong>Humidity:</strong></td>
-                        <td style="padding: 5px; border-bottom: 1px solid #ddd;">{weather['humidity']}%</td>
-                    </tr>
-                    <tr>
-                        <td style="padding: 5px; border-bottom: 1px solid #ddd;"><strong>Visibility:</strong></td>
-                        <td style="padding: 5px; border-bottom: 1px solid #ddd;">{weather['visibility']:.1f} miles</td>
-                    </tr>
-                    <tr>
-                        <td style="padding: 5px; border-bottom: 1px solid #ddd;"><strong>Conditions:</strong></td>
-                        <td style="padding: 5px; border-bottom: 1px solid #ddd;">{weather['weather_description'].title()}</td>
-                    </tr>
-                    <tr>
-                        <td style="padding: 5px; border-bottom: 1px solid #ddd;"><strong>Rain (1hr):</strong></td>
-                        <td style="padding: 5px; border-bottom: 1px solid #ddd;">{weather['rain_1h']:.2f} inches</td>
-                    </tr>
-                    <tr>
-                        <td style="padding: 5px;"><strong>Time:</strong></td>
-                        <td style="padding: 5px;">{weather['timestamp'][:19].replace('T', ' ')}</td>
-                    </tr>
-                </table>
-            </div>
-            
-            <div style="margin-top: 20px; padding: 10px; background-color: #e8f4f8; border-radius: 5px;">
-                <p><strong>Safety Recommendations:</strong></p>
-                <ul>
-                    <li>Stay hydrated and avoid prolonged outdoor exposure</li>
-                    <li>Check on elderly neighbors and pets</li>
-                    <li>Avoid outdoor activities during extreme conditions</li>
-                    <li>Keep windows and doors closed during dust storms</li>
-                </ul>
-            </div>
-        </body>
-        </html>
-        """
-        
-        return html_body
+        return self.renderer.render(alert)[1]
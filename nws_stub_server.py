@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Local api.weather.gov-compatible stub server backed by SyntheticWeatherGenerator
+
+Serves the /points -> observation stations -> latest observation chain the
+NWS provider follows. Locations get the same synthetic weather as from
+owm_stub_server.py, so the two stubs can back a hedged WeatherAPI.
+
+Usage: python nws_stub_server.py [--port 8098] [--latency-ms 50] [--jitter-ms 20]
+                                 [--error-rate 0.05] [--seed 0]
+
+Point the app at it with WEATHER_PROVIDERS=nws NWS_API_URL=http://127.0.0.1:8098
+"""
+
+import argparse
+import logging
+from owm_stub_server import OWMStubServer
+
+STATION_PREFIX = 'STB'
+
+
+class NWSStubServer(OWMStubServer):
+    """Serves /points, /gridpoints/.../stations and /stations/.../observations/latest"""
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _respond(self, handler, parsed):
+        parts = parsed.path.strip('/').split('/')
+        try:
+            if len(parts) == 2 and parts[0] == 'points':
+                lat, lon = (float(value) for value in parts[1].split(','))
+                location = f"{lat:.4f},{lon:.4f}"
+                payload = {'properties': {'observationStations': f"{self.url}/gridpoints/{STATION_PREFIX}/{location}/stations"}}
+            elif len(parts) == 4 and parts[0] == 'gridpoints' and parts[3] == 'stations':
+                payload = {'features': [{'properties': {'stationIdentifier': STATION_PREFIX + parts[2]}}]}
+            elif len(parts) == 4 and parts[0] == 'stations' and parts[2:] == ['observations', 'latest']:
+                lat, lon = (float(value) for value in parts[1][len(STATION_PREFIX):].split(','))
+                station = {'name': f"{lat:.4f},{lon:.4f}", 'lat': lat, 'lon': lon}
+                payload = self.generator.nws_observation(station, self.clock())
+            else:
+                self._send(handler, 404, {'status': 404, 'title': 'Not Found'})
+                return
+        except ValueError:
+            self._send(handler, 400, {'status': 400, 'title': 'Invalid Parameter'})
+            return
+        self._send(handler, 200, payload)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local api.weather.gov stub server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8098)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    server = NWSStubServer(args.host, args.port, args.seed, args.latency_ms, args.jitter_ms, args.error_rate)
+    logging.info("NWS stub listening on %s", server.url)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Local OpenWeatherMap-compatible stub server backed by SyntheticWeatherGenerator
+
+Usage: python owm_stub_server.py [--port 8099] [--latency-ms 50] [--jitter-ms 20]
+                                 [--error-rate 0.05] [--seed 0]
+
+Point the app at it with WEATHER_API_URL=http://127.0.0.1:8099/data/2.5/weather
+"""
+
+import argparse
+import json
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from synthetic_weather import SyntheticWeatherGenerator
+from station_registry import get_station_registry
+
+
+class OWMStubServer:
+    """Serves /data/2.5/weather and /forecast with configurable latency and error injection"""
+
+    def __init__(self, host='127.0.0.1', port=0, seed=0, latency_ms=0, jitter_ms=0,
+                 error_rate=0.0, clock=None):
+        self.generator = SyntheticWeatherGenerator(seed=seed)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.clock = clock or (lambda: datetime.now(timezone.utc).replace(second=0, microsecond=0))
+        self.requests = 0
+        self.errors = 0
+        self._rng = random.Random(f"stub:{seed}")
+        self._lock = threading.Lock()
+        self._thread = None
+        self._city_ids = None
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                stub._handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/data/2.5/weather"
+
+    def start(self):
+        """Serve on a background thread"""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _handle(self, handler):
+        with self._lock:
+            self.requests += 1
+            fail = self._rng.random() < self.error_rate
+            delay = max(0.0, self.latency_ms + self._rng.uniform(-self.jitter_ms, self.jitter_ms)) / 1000.0
+            if fail:
+                self.errors += 1
+
+        if delay:
+            time.sleep(delay)
+
+        parsed = urlparse(handler.path)
+        if fail:
+            self._send(handler, 500, {'cod': 500, 'message': 'Injected error'})
+            return
+        self._respond(handler, parsed)
+
+    def _respond(self, handler, parsed):
+        if parsed.path not in ('/data/2.5/weather', '/data/2.5/forecast'):
+            self._send(handler, 404, {'cod': '404', 'message': 'Internal error'})
+            return
+
+        query = parse_qs(parsed.query)
+        try:
+            if 'id' in query:
+                lat, lon = self._city_coordinates(query['id'][0])
+            else:
+                lat = float(query['lat'][0])
+                lon = float(query['lon'][0])
+        except KeyError:
+            self._send(handler, 404, {'cod': '404', 'message': 'city not found'})
+            return
+        except ValueError:
+            self._send(handler, 400, {'cod': '400', 'message': 'Nothing to geocode'})
+            return
+
+        station = {'name': f"{lat:.4f},{lon:.4f}", 'lat': lat, 'lon': lon}
+        if parsed.path == '/data/2.5/forecast':
+            self._send(handler, 200, self.generator.owm_forecast_payload(station, self.clock()))
+        else:
+            self._send(handler, 200, self.generator.owm_payload(station, self.clock()))
+
+    def _city_coordinates(self, city_id):
+        """(lat, lon) of a station registry entry by its provider city ID"""
+        if self._city_ids is None:
+            self._city_ids = {station['provider_id']: (station['lat'], station['lon'])
+                              for station in get_station_registry() if station['provider_id']}
+        return self._city_ids[city_id]
+
+    @staticmethod
+    def _send(handler, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        handler.send_response(status)
+        handler.send_header('Content-Type', 'application/json; charset=utf-8')
+        handler.send_header('Content-Length', str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local OpenWeatherMap stub server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    server = OWMStubServer(args.host, args.port, args.seed, args.latency_ms, args.jitter_ms, args.error_rate)
+    logging.info("OWM stub listening on %s", server.url)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
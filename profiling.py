@@ -0,0 +1,152 @@
+"""
+Opt-in profiling of weather checks
+
+Enabled by PROFILE=true or `python main.py once --profile`. Each profiled run
+(a check_weather_and_alerts call or an Azure Functions invocation) is timed
+with cProfile while tracemalloc traces allocations; mark_stage() calls
+between the fetch, store, evaluate and notify stages snapshot the heap, so
+the report lists the top allocations of each stage. Per run, PROFILE_DIR gets
+<name>-<time>-<pid>.pstats (open with `python -m pstats`) and a matching
+.allocations.txt.
+
+Disabled, profiled() and mark_stage() cost one flag check.
+"""
+
+import cProfile
+import functools
+import io
+import logging
+import os
+import time
+import tracemalloc
+from datetime import datetime
+from config import PROFILE_ENABLED, PROFILE_DIR, PROFILE_TOP_ALLOCATIONS, PROFILE_TRACEMALLOC_FRAMES
+
+_enabled = PROFILE_ENABLED
+_directory = PROFILE_DIR
+_active = None  # the ProfileRun in progress, if any
+
+# Allocations made by the profiler itself are not interesting
+_SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>')
+)
+
+
+def enable(directory=None):
+    """Profile every following run in this process"""
+    global _enabled, _directory
+    _enabled = True
+    if directory:
+        _directory = directory
+
+
+def is_enabled():
+    return _enabled
+
+
+class ProfileRun:
+    """One profiled run: cProfile plus a heap snapshot at each stage boundary"""
+
+    def __init__(self, name, directory=None, top=PROFILE_TOP_ALLOCATIONS):
+        self.name = name
+        self.directory = directory or _directory
+        self.top = top
+        self.stages = []  # (stage, seconds, peak bytes, top StatisticDiffs)
+        self._profiler = cProfile.Profile()
+        self._started_tracing = False
+        self._snapshot = None
+        self._stage_started = None
+
+    def __enter__(self):
+        global _active
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(PROFILE_TRACEMALLOC_FRAMES)
+            self._started_tracing = True
+        self._snapshot = self._take_snapshot()
+        self._reset_peak()
+        _active = self
+        self._stage_started = time.perf_counter()
+        self._profiler.enable()
+        return self
+
+    def __exit__(self, *exc):
+        global _active
+        self._profiler.disable()
+        self._record('end')
+        _active = None
+        if self._started_tracing:
+            tracemalloc.stop()
+        try:
+            self._write()
+        except OSError as e:
+            logging.error("Could not write profile for %s to %s: %s", self.name, self.directory, e)
+
+    @staticmethod
+    def _take_snapshot():
+        return tracemalloc.take_snapshot().filter_traces(_SNAPSHOT_FILTERS)
+
+    @staticmethod
+    def _reset_peak():
+        if hasattr(tracemalloc, 'reset_peak'):  # Python 3.9+
+            tracemalloc.reset_peak()
+
+    def mark(self, stage):
+        """Close the current stage and start the next"""
+        self._profiler.disable()
+        self._record(stage)
+        self._profiler.enable()
+
+    def _record(self, stage):
+        """Record the stage's time, peak memory and top allocations"""
+        elapsed = time.perf_counter() - self._stage_started
+        peak = tracemalloc.get_traced_memory()[1]
+        snapshot = self._take_snapshot()
+        diffs = [diff for diff in snapshot.compare_to(self._snapshot, 'lineno') if diff.size_diff > 0]
+        self.stages.append((stage, elapsed, peak, diffs[:self.top]))
+        self._snapshot = snapshot
+        self._reset_peak()
+        self._stage_started = time.perf_counter()
+
+    def _write(self):
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%dT%H%M%S')
+        base = os.path.join(self.directory, f"{self.name}-{stamp}-{os.getpid()}")
+        self._profiler.dump_stats(base + '.pstats')
+
+        out = io.StringIO()
+        for stage, elapsed, peak, diffs in self.stages:
+            out.write(f"== {stage}: {elapsed * 1000:.1f} ms, peak traced {peak / 1024:.1f} KiB\n")
+            for diff in diffs:
+                frame = diff.traceback[0]
+                out.write(f"  {diff.size_diff / 1024:+10.1f} KiB {diff.count_diff:+8d} blocks  "
+                          f"{frame.filename}:{frame.lineno}\n")
+            out.write("\n")
+        with open(base + '.allocations.txt', 'w', encoding='utf-8') as f:
+            f.write(out.getvalue())
+
+        total = sum(elapsed for _, elapsed, _, _ in self.stages)
+        logging.info("Profiled %s: %.1f ms in %s stages, written to %s.*", self.name, total * 1000,
+                     len(self.stages), base)
+
+
+def mark_stage(stage):
+    """End a stage of the profiled run in progress; a no-op otherwise"""
+    if _active is not None:
+        _active.mark(stage)
+
+
+def profiled(name):
+    """Decorator: profile each call while profiling is enabled (runs nested in a profiled run are not)"""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled or _active is not None:
+                return func(*args, **kwargs)
+            with ProfileRun(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
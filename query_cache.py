@@ -0,0 +1,132 @@
+import threading
+import time
+from collections import OrderedDict
+from config import QUERY_CACHE_MAX_ENTRIES, QUERY_CACHE_MAX_ROWS, QUERY_CACHE_TTL_SECONDS
+
+
+class QueryCache:
+    """LRU cache of storage query results with tag-based invalidation
+
+    Entries are tagged with what they read, e.g. ('weather', 'Phoenix') or
+    ('weather', None) for all-city queries, so a write only evicts the queries
+    that could see it. Memory is bounded by entry count and total cached rows.
+    The TTL covers rows aging out of time windows and writes made by other
+    processes. Cached values are shared: treat them as read-only.
+    """
+
+    def __init__(self, max_entries=QUERY_CACHE_MAX_ENTRIES, max_rows=QUERY_CACHE_MAX_ROWS,
+                 ttl=QUERY_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (value, tags, weight, expires_at)
+        self._tags = {}  # tag -> set of keys
+        self._rows = 0
+        self._generations = {}  # tag -> invalidation count, for loads racing an invalidate()
+        self._generation = 0  # bumped by clear()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _weight(value):
+        if isinstance(value, tuple) and value and isinstance(value[0], list):
+            return max(1, len(value[0]))
+        if isinstance(value, list):
+            return max(1, len(value))
+        return 1
+
+    def get_or_load(self, key, tags, loader):
+        """Return the cached value for key, calling loader() on a miss"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[3] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            generation = self._generation_of(tags)
+
+        value = loader()
+
+        with self._lock:
+            if self._generation_of(tags) != generation:
+                return value  # invalidated while loading: the value may predate the write
+            weight = self._weight(value)
+            if weight > self.max_rows:
+                return value
+            if key in self._entries:
+                self._remove(key)  # loaded concurrently by another thread
+            self._entries[key] = (value, tags, weight, now + self.ttl)
+            self._rows += weight
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            self._evict()
+        return value
+
+    def invalidate(self, tags):
+        """Drop every entry carrying any of the tags"""
+        with self._lock:
+            for tag in tags:
+                self._generations[tag] = self._generations.get(tag, 0) + 1
+                for key in list(self._tags.get(tag, ())):
+                    self._remove(key)
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+            self._rows = 0
+            self._generation += 1
+
+    def _generation_of(self, tags):
+        return (self._generation,) + tuple(self._generations.get(tag, 0) for tag in tags)
+
+    def _remove(self, key):
+        value, tags, weight, _ = self._entries.pop(key)
+        self._rows -= weight
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._rows > self.max_rows):
+            self._remove(next(iter(self._entries)))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'rows': self._rows,
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations
+            }
+
+
+def write_tags(kind, cities):
+    """Tags to invalidate after writing `kind` rows for these cities"""
+    tags = {(kind, None)}
+    tags.update((kind, city) for city in cities)
+    return tags
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_query_cache(namespace):
+    """Process-wide cache per storage backend, shared by all instances using it"""
+    with _caches_lock:
+        cache = _caches.get(namespace)
+        if cache is None:
+            cache = _caches[namespace] = QueryCache()
+        return cache
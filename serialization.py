@@ -0,0 +1,66 @@
+"""
+JSON serialization with an optional fast encoder
+
+Uses orjson or msgspec when installed and falls back to the stdlib json module.
+Output is compact unless pretty=True.
+"""
+
+import json
+from datetime import date, datetime
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+def _default(obj):
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    BACKEND = 'orjson'
+
+    def dumps_bytes(obj, pretty=False):
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if pretty else 0)
+        return orjson.dumps(obj, default=_default, option=option)
+
+    def loads(data):
+        return orjson.loads(data)
+
+elif msgspec is not None:
+    BACKEND = 'msgspec'
+    _encoder = msgspec.json.Encoder(enc_hook=_default)
+    _decoder = msgspec.json.Decoder()
+
+    def dumps_bytes(obj, pretty=False):
+        data = _encoder.encode(obj)
+        return msgspec.json.format(data, indent=2) if pretty else data
+
+    def loads(data):
+        return _decoder.decode(data)
+
+else:
+    BACKEND = 'json'
+
+    def dumps_bytes(obj, pretty=False):
+        return dumps(obj, pretty).encode('utf-8')
+
+    def loads(data):
+        return json.loads(data)
+
+
+def dumps(obj, pretty=False):
+    """Serialize to a str"""
+    if BACKEND == 'json':
+        if pretty:
+            return json.dumps(obj, indent=2, default=_default, ensure_ascii=False)
+        return json.dumps(obj, separators=(',', ':'), default=_default, ensure_ascii=False)
+    return dumps_bytes(obj, pretty).decode('utf-8')
@@ -0,0 +1,305 @@
+"""
+Shared-memory table of the latest observation and alert state per station
+
+For on-prem deployments that run `main.py schedule` (or `serve`) next to
+other local processes. With SHARED_LATEST=true the scheduler publishes each
+check's new observations and alerts into a fixed-layout table in a
+memory-mapped file (SHARED_LATEST_PATH, under /dev/shm on Linux). Any local
+process maps the same file and reads stations straight out of the mapping,
+with no database query or API request; `main.py now` does so when the table
+is fresh.
+
+Layout: a header, then one fixed-size slot per station. Each slot is
+guarded by a seqlock: the writer makes the slot's sequence number odd,
+writes the slot and makes it even again; a reader unpacks the slot from the
+mapping and retries if the sequence was odd or changed meanwhile. There is
+a single writer (an exclusive file lock where fcntl is available), readers
+take no locks, and the file only ever grows, so a mapping never outlives
+its bytes. A file-backed mapping is used rather than
+multiprocessing.shared_memory, whose resource tracker unlinks a segment
+when any process that attached to it exits (before Python 3.13).
+"""
+
+import logging
+import math
+import mmap
+import os
+import struct
+import time
+from config import (
+    ALERT_TRIGGERS, SHARED_LATEST_PATH, SHARED_LATEST_CAPACITY, SHARED_LATEST_MAX_AGE_SECONDS
+)
+from subscriptions import DERIVED_SUFFIXES, SEVERITIES
+
+try:
+    import fcntl
+except ImportError:  # Windows: single writer by convention only
+    fcntl = None
+
+MAGIC = b'AZWXLAT1'
+VERSION = 1
+
+NUMERIC_FIELDS = ('temperature', 'feels_like', 'humidity', 'pressure', 'wind_speed', 'wind_direction',
+                  'visibility', 'rain_1h', 'dew_point', 'heat_index', 'wbgt')
+
+# Alert types as bits of a station's active-alert mask
+ALERT_TYPES = tuple(f"{alert_type}{suffix}" for alert_type in ALERT_TRIGGERS
+                    for suffix in ('',) + DERIVED_SUFFIXES)[:64]
+ALERT_BITS = {alert_type: 1 << bit for bit, alert_type in enumerate(ALERT_TYPES)}
+
+# magic, version, reserved, capacity, slot size, stations in use, last publish (epoch)
+HEADER = struct.Struct('<8sHHIIId')
+STATIONS = struct.Struct('<I')  # header field the writer updates in place
+STATIONS_OFFSET = 20
+UPDATED_AT = struct.Struct('<d')
+UPDATED_AT_OFFSET = 24
+SEQ = struct.Struct('<Q')
+# name, observed_at, timestamp, numeric fields, weather_main, weather_description,
+# active alert mask, last alert type, last alert severity, last alert time (epoch)
+BODY = struct.Struct(f'<48sq32s{len(NUMERIC_FIELDS)}d16s48sQ40s8sd')
+SLOT_SIZE = (SEQ.size + BODY.size + 7) // 8 * 8
+
+NAME, OBSERVED_AT, TIMESTAMP = 0, 1, 2
+NUMERIC = slice(3, 3 + len(NUMERIC_FIELDS))
+WEATHER_MAIN, DESCRIPTION, ACTIVE, ALERT_TYPE, SEVERITY, ALERT_AT = range(3 + len(NUMERIC_FIELDS),
+                                                                        9 + len(NUMERIC_FIELDS))
+
+SEQLOCK_RETRIES = 1000
+
+
+def _text(value, size):
+    return str(value or '').encode('utf-8')[:size]
+
+
+def _string(raw):
+    return raw.rstrip(b'\0').decode('utf-8', 'replace')
+
+
+def _number(value):
+    return float('nan') if value is None else float(value)
+
+
+def _slot_offset(index):
+    return HEADER.size + index * SLOT_SIZE
+
+
+def _rank(alert):
+    return SEVERITIES.index(alert['severity']) if alert['severity'] in SEVERITIES else -1
+
+
+class SharedLatestWriter:
+    """The single writer of the table; other writers fail to open it"""
+
+    def __init__(self, path=SHARED_LATEST_PATH, capacity=SHARED_LATEST_CAPACITY):
+        self.path = path
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    raise RuntimeError(f"{path} is already published by another process") from None
+            needed = _slot_offset(capacity)
+            if os.fstat(fd).st_size < needed:
+                os.ftruncate(fd, needed)  # grow only: readers' mappings stay backed
+            self._mm = mmap.mmap(fd, 0)
+        except BaseException:
+            os.close(fd)
+            raise
+        self._fd = fd
+        self._slots = {}  # station name -> slot index
+        self._full_warned = False
+
+        magic, version, _, _, slot_size, stations, updated_at = HEADER.unpack_from(self._mm, 0)
+        self.capacity = (len(self._mm) - HEADER.size) // SLOT_SIZE
+        if magic == MAGIC and version == VERSION and slot_size == SLOT_SIZE:
+            # Restarted: keep the stations' slots, so attached readers stay valid
+            for index in range(min(stations, self.capacity)):
+                name = _string(BODY.unpack_from(self._mm, _slot_offset(index) + SEQ.size)[NAME])
+                self._slots[name] = index
+            # An odd seq is a write a killed writer left unfinished; round it up
+            # to even, or every later write would leave the slot looking torn.
+            # The station's next publish rewrites the slot.
+            for index in range(self.capacity):
+                offset = _slot_offset(index)
+                seq = SEQ.unpack_from(self._mm, offset)[0]
+                if seq % 2:
+                    SEQ.pack_into(self._mm, offset, seq + 1)
+            HEADER.pack_into(self._mm, 0, MAGIC, VERSION, 0, self.capacity, SLOT_SIZE, stations, updated_at)
+        else:
+            self._mm[:] = bytes(len(self._mm))
+            HEADER.pack_into(self._mm, 0, MAGIC, VERSION, 0, self.capacity, SLOT_SIZE, 0, 0.0)
+        logging.info("Publishing latest conditions to %s (%s station slots)", path, self.capacity)
+
+    def publish(self, weather_data, alerts, now=None):
+        """Write a check's new observations and its alerts; a failure is logged, never raised"""
+        now = time.time() if now is None else now
+        try:
+            masks = {data['city']: 0 for data in weather_data}  # evaluated stations: active alerts reset
+            latest = {}
+            for alert in alerts:
+                masks[alert['city']] = masks.get(alert['city'], 0) | ALERT_BITS.get(alert['type'], 0)
+                current = latest.get(alert['city'])
+                if current is None or _rank(alert) > _rank(current):
+                    latest[alert['city']] = alert  # the most severe is the station's last alert
+
+            observations = {data['city']: data for data in weather_data}
+            for city, mask in masks.items():
+                index = self._slot(city)
+                if index is not None:
+                    self._write(index, city, observations.get(city), mask, city in observations,
+                                latest.get(city), now)
+            UPDATED_AT.pack_into(self._mm, UPDATED_AT_OFFSET, now)
+        except (ValueError, struct.error, OSError) as e:
+            logging.error("Error publishing latest conditions to %s: %s", self.path, e)
+
+    def _slot(self, city):
+        index = self._slots.get(city)
+        if index is not None:
+            return index
+        index = len(self._slots)
+        if index >= self.capacity:
+            if not self._full_warned:
+                logging.warning("Shared latest table %s is full (%s stations); %s and later stations are skipped",
+                                self.path, self.capacity, city)
+                self._full_warned = True
+            return None
+        self._slots[city] = index
+        self._write(index, city, {}, 0, True, None, 0.0)  # no readings yet
+        # Published after the slot holds its name
+        STATIONS.pack_into(self._mm, STATIONS_OFFSET, len(self._slots))
+        return index
+
+    def _write(self, index, city, data, mask, reset_mask, alert, now):
+        offset = _slot_offset(index)
+        values = list(BODY.unpack_from(self._mm, offset + SEQ.size))
+        values[NAME] = _text(city, 48)
+        if data is not None:
+            values[OBSERVED_AT] = int(data.get('dt') or 0)
+            values[TIMESTAMP] = _text(data.get('timestamp'), 32)
+            values[NUMERIC] = [_number(data.get(field)) for field in NUMERIC_FIELDS]
+            values[WEATHER_MAIN] = _text(data.get('weather_main'), 16)
+            values[DESCRIPTION] = _text(data.get('weather_description'), 48)
+        values[ACTIVE] = mask if reset_mask else values[ACTIVE] | mask
+        if alert is not None:
+            values[ALERT_TYPE] = _text(alert['type'], 40)
+            values[SEVERITY] = _text(alert['severity'], 8)
+            values[ALERT_AT] = now
+
+        seq = SEQ.unpack_from(self._mm, offset)[0]
+        SEQ.pack_into(self._mm, offset, seq + 1)
+        BODY.pack_into(self._mm, offset + SEQ.size, *values)
+        SEQ.pack_into(self._mm, offset, seq + 2)
+
+    def close(self):
+        self._mm.close()
+        os.close(self._fd)  # releases the lock
+
+
+class SharedLatestReader:
+    """Read-only view of the table; stations are read straight from the mapping"""
+
+    def __init__(self, path=SHARED_LATEST_PATH):
+        self.path = path
+        self._mm = None
+        self._index = {}  # station name -> slot index
+        self._scanned = 0  # slots indexed so far
+        self._map()
+        magic, version, _, _, slot_size, _, _ = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION or slot_size != SLOT_SIZE:
+            self.close()
+            raise ValueError(f"{path} is not a shared latest-conditions table")
+
+    def _map(self):
+        with open(self.path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm is not None:
+            self._mm.close()
+        self._mm = mapped
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+
+    @property
+    def updated_at(self):
+        """Epoch seconds of the writer's last publish (0 if never)"""
+        return UPDATED_AT.unpack_from(self._mm, UPDATED_AT_OFFSET)[0]
+
+    def age(self):
+        updated_at = self.updated_at
+        return time.time() - updated_at if updated_at else float('inf')
+
+    def _refresh_index(self):
+        stations = STATIONS.unpack_from(self._mm, STATIONS_OFFSET)[0]
+        if _slot_offset(stations) > len(self._mm):
+            self._map()  # the writer grew the file
+        while self._scanned < stations:
+            body = self._read(self._scanned)
+            if body is None:
+                break  # retried on the next lookup
+            self._index[_string(body[NAME])] = self._scanned
+            self._scanned += 1
+
+    def _read(self, index):
+        """The slot's fields, consistent per its seqlock, or None if the writer stalled mid-write"""
+        mm = self._mm
+        offset = _slot_offset(index)
+        for _ in range(SEQLOCK_RETRIES):
+            before = SEQ.unpack_from(mm, offset)[0]
+            if before & 1:
+                time.sleep(0)
+                continue
+            body = BODY.unpack_from(mm, offset + SEQ.size)
+            if SEQ.unpack_from(mm, offset)[0] == before:
+                return body
+        return None
+
+    def get(self, city):
+        """The station's latest observation and alert state as a dict, or None"""
+        index = self._index.get(city)
+        if index is None:
+            self._refresh_index()
+            index = self._index.get(city)
+            if index is None:
+                return None
+        body = self._read(index)
+        return self._entry(body) if body is not None else None
+
+    def __iter__(self):
+        self._refresh_index()
+        for index in sorted(self._index.values()):
+            body = self._read(index)
+            if body is not None:
+                yield self._entry(body)
+
+    @staticmethod
+    def _entry(body):
+        entry = {'city': _string(body[NAME]), 'dt': body[OBSERVED_AT] or None, 'timestamp': _string(body[TIMESTAMP])}
+        for field, value in zip(NUMERIC_FIELDS, body[NUMERIC]):
+            entry[field] = None if math.isnan(value) else value
+        entry['weather_main'] = _string(body[WEATHER_MAIN])
+        entry['weather_description'] = _string(body[DESCRIPTION])
+        entry['alerts'] = [alert_type for alert_type in ALERT_TYPES if body[ACTIVE] & ALERT_BITS[alert_type]]
+        entry['last_alert'] = ({'type': _string(body[ALERT_TYPE]), 'severity': _string(body[SEVERITY]),
+                                'at': body[ALERT_AT]} if body[ALERT_AT] else None)
+        return entry
+
+
+def open_reader(path=SHARED_LATEST_PATH, max_age=SHARED_LATEST_MAX_AGE_SECONDS):
+    """A reader if the table exists and was published within max_age seconds, else None"""
+    try:
+        reader = SharedLatestReader(path)
+    except (OSError, ValueError):
+        return None
+    if reader.age() > max_age:
+        reader.close()
+        return None
+    return reader
@@ -0,0 +1,161 @@
+import heapq
+import math
+from config import STATION_INDEX_CELL_DEGREES
+from station_registry import get_station_registry
+
+EARTH_RADIUS_MILES = 3958.8
+MILES_PER_DEGREE_LAT = 69.0
+STATIONS_PER_CELL = 4
+
+
+def haversine_miles(lat1, lon1, lat2, lon2):
+    """Great-circle distance between two points in miles"""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * math.asin(min(1.0, math.sqrt(a)))
+
+
+class StationIndex:
+    """Uniform lat/lon grid over the station registry for spatial queries"""
+
+    def __init__(self, stations, cell_degrees=STATION_INDEX_CELL_DEGREES):
+        self.stations = list(stations)
+        self.cell_degrees = cell_degrees or self._auto_cell_degrees(self.stations)
+        self._cells = {}
+        self._by_name = {}
+
+        max_abs_lat = 0.0
+        for i, station in enumerate(self.stations):
+            self._cells.setdefault(self._cell(station['lat'], station['lon']), []).append(i)
+            self._by_name[station['name']] = i
+            max_abs_lat = max(max_abs_lat, abs(station['lat']))
+
+        self._max_abs_lat = max_abs_lat
+        if self._cells:
+            xs = [cell[0] for cell in self._cells]
+            ys = [cell[1] for cell in self._cells]
+            self._extent = (min(xs), min(ys), max(xs), max(ys))
+        else:
+            self._extent = (0, 0, 0, 0)
+
+    def __len__(self):
+        return len(self.stations)
+
+    @staticmethod
+    def _auto_cell_degrees(stations):
+        """Pick a cell size giving roughly STATIONS_PER_CELL stations per cell"""
+        if len(stations) < 2:
+            return 1.0
+        lats = [s['lat'] for s in stations]
+        lons = [s['lon'] for s in stations]
+        area = max(max(lats) - min(lats), 0.01) * max(max(lons) - min(lons), 0.01)
+        return min(1.0, max(0.01, math.sqrt(area * STATIONS_PER_CELL / len(stations))))
+
+    def _cell(self, lat, lon):
+        return (int(math.floor(lat / self.cell_degrees)), int(math.floor(lon / self.cell_degrees)))
+
+    def _min_miles_per_degree(self, lat):
+        """Lower bound on miles per degree in either axis near the stations"""
+        ref_lat = min(89.0, max(self._max_abs_lat, abs(lat)))
+        return MILES_PER_DEGREE_LAT * math.cos(math.radians(ref_lat))
+
+    def get(self, name):
+        """Look up a station by name"""
+        i = self._by_name.get(name)
+        return self.stations[i] if i is not None else None
+
+    def within_bbox(self, min_lat, min_lon, max_lat, max_lon):
+        """Stations inside a lat/lon bounding box"""
+        cx0, cy0 = self._cell(min_lat, min_lon)
+        cx1, cy1 = self._cell(max_lat, max_lon)
+        results = []
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                for i in self._cells.get((cx, cy), ()):
+                    station = self.stations[i]
+                    if min_lat <= station['lat'] <= max_lat and min_lon <= station['lon'] <= max_lon:
+                        results.append(station)
+        return results
+
+    def within_radius(self, lat, lon, miles):
+        """Stations within `miles` of a point, as (distance, station) sorted by distance"""
+        dlat = miles / MILES_PER_DEGREE_LAT
+        dlon = miles / max(self._min_miles_per_degree(lat), 1e-6)
+        results = []
+        for station in self.within_bbox(lat - dlat, lon - dlon, lat + dlat, lon + dlon):
+            distance = haversine_miles(lat, lon, station['lat'], station['lon'])
+            if distance <= miles:
+                results.append((distance, station))
+        results.sort(key=lambda item: item[0])
+        return results
+
+    def nearest(self, lat, lon, k=1):
+        """The k nearest stations to a point, as (distance, station) sorted by distance"""
+        if not self.stations or k <= 0:
+            return []
+
+        cx, cy = self._cell(lat, lon)
+        min_x, min_y, max_x, max_y = self._extent
+        max_ring = max(abs(cx - min_x), abs(cx - max_x), abs(cy - min_y), abs(cy - max_y))
+        ring_miles = self.cell_degrees * self._min_miles_per_degree(lat)
+
+        # Max-heap of the k best candidates, stored as (-distance, index)
+        best = []
+        ring = 0
+        while ring <= max_ring:
+            for cell in self._ring_cells(cx, cy, ring):
+                for i in self._cells.get(cell, ()):
+                    station = self.stations[i]
+                    distance = haversine_miles(lat, lon, station['lat'], station['lon'])
+                    if len(best) < k:
+                        heapq.heappush(best, (-distance, i))
+                    elif distance < -best[0][0]:
+                        heapq.heapreplace(best, (-distance, i))
+
+            # Every station in ring + 1 is at least `ring` full cells away
+            if len(best) == k and ring * ring_miles >= -best[0][0]:
+                break
+            ring += 1
+
+        return [(-d, self.stations[i]) for d, i in sorted(best, reverse=True)]
+
+    @staticmethod
+    def _ring_cells(cx, cy, ring):
+        if ring == 0:
+            yield (cx, cy)
+            return
+        for dx in range(-ring, ring + 1):
+            yield (cx + dx, cy - ring)
+            yield (cx + dx, cy + ring)
+        for dy in range(-ring + 1, ring):
+            yield (cx - ring, cy + dy)
+            yield (cx + ring, cy + dy)
+
+    def batches(self, batch_size):
+        """Yield stations in spatially-coherent batches of at most batch_size"""
+        batch = []
+        for cell in sorted(self._cells):
+            for i in self._cells[cell]:
+                batch.append(self.stations[i])
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+
+_station_index = None
+_station_index_registry = None
+
+
+def get_station_index():
+    """Shared index over the station registry, rebuilt only when the registry reloads"""
+    global _station_index, _station_index_registry
+    registry = get_station_registry()
+    if _station_index is None or registry is not _station_index_registry:
+        _station_index = StationIndex(registry)
+        _station_index_registry = registry
+    return _station_index
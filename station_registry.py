@@ -0,0 +1,265 @@
+"""
+Station registry: the monitored stations, loaded from a file
+
+The registry file (STATION_REGISTRY, default stations.csv) lists each
+station's id, name, coordinates, time zone, provider city ID and optional
+per-station trigger threshold overrides. It is parsed once into parallel
+arrays; stations are handed out as read-only Station views over them. The
+parsed registry is cached per process (so warm Azure Functions invocations
+reuse it) and reloaded only when the file's mtime or size changes.
+
+Formats, by extension:
+  .csv             id,name,lat,lon,tz,provider_id plus optional override
+                   columns named "<alert type>.<condition>", e.g.
+                   extreme_heat_day.temp_threshold
+  .json            a list of station objects (or {"stations": [...]}) with
+                   an optional "thresholds": {"<alert type>": {...}} object
+  .db/.sqlite      a "stations" table with the CSV columns and a
+                   "thresholds" column holding JSON text
+"""
+
+import csv
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from array import array
+from collections.abc import Mapping
+from config import ALERT_TRIGGERS, STATION_REGISTRY_PATH, STATION_REGISTRY_CHECK_SECONDS
+
+FIELDS = ('id', 'name', 'lat', 'lon', 'tz', 'provider_id', 'thresholds')
+
+# Trend windows are shared by all stations, so they cannot be overridden
+FIXED_CONDITIONS = frozenset({'window_minutes'})
+
+
+class Station(Mapping):
+    """Read-only dict-like view of one registry entry"""
+
+    __slots__ = ('_registry', '_index')
+
+    def __init__(self, registry, index):
+        self._registry = registry
+        self._index = index
+
+    def __getitem__(self, key):
+        registry = self._registry
+        i = self._index
+        if key == 'name':
+            return registry.names[i]
+        if key == 'lat':
+            return registry.lats[i]
+        if key == 'lon':
+            return registry.lons[i]
+        if key == 'tz':
+            return registry.tzs[i]
+        if key == 'id':
+            return registry.ids[i]
+        if key == 'provider_id':
+            return registry.provider_ids[i]
+        if key == 'thresholds':
+            return registry.thresholds.get(i)
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(FIELDS)
+
+    def __len__(self):
+        return len(FIELDS)
+
+    def __repr__(self):
+        return f"Station({dict(self)!r})"
+
+
+def _number(value, field, where):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{where}: {field} must be a number, got {value!r}") from None
+
+
+def _threshold(value, where):
+    if isinstance(value, (list, tuple)):
+        return tuple(_threshold(item, where) for item in value)
+    if isinstance(value, str):
+        value = _number(value, 'threshold', where)
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _validate_thresholds(thresholds, where):
+    """Overrides as {alert type: {condition: value}}, or None"""
+    if not thresholds:
+        return None
+    overrides = {}
+    for alert_type, conditions in thresholds.items():
+        trigger = ALERT_TRIGGERS.get(alert_type)
+        if trigger is None:
+            raise ValueError(f"{where}: unknown alert type {alert_type!r} in thresholds")
+        for condition, value in conditions.items():
+            if condition not in trigger['conditions'] or condition in FIXED_CONDITIONS:
+                raise ValueError(f"{where}: {alert_type}.{condition} cannot be overridden")
+            if value is None or value == '':
+                continue
+            overrides.setdefault(alert_type, {})[condition] = _threshold(value, where)
+    return overrides or None
+
+
+class StationRegistry:
+    """Stations in parallel arrays: coordinates as doubles, names and ids as lists
+
+    Iterating yields Station views in file order; time zone names are
+    interned and threshold overrides are stored only for stations that
+    have them.
+    """
+
+    def __init__(self, records, source=None):
+        self.source = source
+        self.ids = []
+        self.names = []
+        self.lats = array('d')
+        self.lons = array('d')
+        self.tzs = []
+        self.provider_ids = []
+        self.thresholds = {}  # index -> overrides, sparse
+        self._by_name = {}
+
+        for n, record in enumerate(records, 1):
+            where = f"{source or 'stations'} entry {n}"
+            name = (record.get('name') or '').strip()
+            if not name:
+                raise ValueError(f"{where}: missing name")
+            if name in self._by_name:
+                raise ValueError(f"{where}: duplicate station {name!r}")
+            lat = _number(record.get('lat'), 'lat', where)
+            lon = _number(record.get('lon'), 'lon', where)
+            if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+                raise ValueError(f"{where}: coordinates out of range ({lat}, {lon})")
+
+            i = len(self.names)
+            self._by_name[name] = i
+            self.ids.append(str(record.get('id') or name).strip())
+            self.names.append(name)
+            self.lats.append(lat)
+            self.lons.append(lon)
+            tz = (record.get('tz') or '').strip()
+            self.tzs.append(sys.intern(tz) if tz else None)
+            provider_id = record.get('provider_id')
+            self.provider_ids.append(str(provider_id).strip() if provider_id not in (None, '') else None)
+            overrides = _validate_thresholds(record.get('thresholds'), where)
+            if overrides:
+                self.thresholds[i] = overrides
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        return (Station(self, i) for i in range(len(self.names)))
+
+    def __getitem__(self, i):
+        if not 0 <= i < len(self.names):
+            raise IndexError(i)
+        return Station(self, i)
+
+    def get(self, name):
+        i = self._by_name.get(name)
+        return Station(self, i) if i is not None else None
+
+
+def _read_csv(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            record = {}
+            thresholds = {}
+            for column, value in row.items():
+                if column is None:
+                    continue
+                column = column.strip()
+                value = value.strip() if isinstance(value, str) else value
+                if '.' in column:
+                    alert_type, condition = column.split('.', 1)
+                    thresholds.setdefault(alert_type, {})[condition] = value
+                else:
+                    record[column] = value
+            record['thresholds'] = thresholds
+            yield record
+
+
+def _read_json(path):
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get('stations', [])
+    return data
+
+
+def _read_sqlite(path):
+    # Read-only, so a missing file is an error rather than a new empty database
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        conn.row_factory = sqlite3.Row
+        for row in conn.execute("SELECT * FROM stations ORDER BY rowid"):
+            record = dict(row)
+            if record.get('thresholds'):
+                record['thresholds'] = json.loads(record['thresholds'])
+            yield record
+    finally:
+        conn.close()
+
+
+READERS = {
+    '.csv': _read_csv,
+    '.json': _read_json,
+    '.db': _read_sqlite,
+    '.sqlite': _read_sqlite,
+    '.sqlite3': _read_sqlite
+}
+
+
+def load_registry(path):
+    """Parse a registry file; raises ValueError for bad entries"""
+    extension = os.path.splitext(path)[1].lower()
+    reader = READERS.get(extension)
+    if reader is None:
+        raise ValueError(f"Unsupported station registry format: {path} (expected {', '.join(READERS)})")
+    return StationRegistry(reader(path), source=os.path.basename(path))
+
+
+_lock = threading.Lock()
+_registries = {}  # path -> (registry, (mtime_ns, size), checked_at)
+
+
+def get_station_registry(path=None):
+    """The registry for a file, parsed once and reloaded only when the file changes
+
+    The file is stat()ed at most every STATION_REGISTRY_CHECK_SECONDS. If a
+    changed file fails to load, the previously loaded registry stays in use.
+    """
+    path = path or STATION_REGISTRY_PATH
+    now = time.monotonic()
+    with _lock:
+        cached = _registries.get(path)
+        if cached and now - cached[2] < STATION_REGISTRY_CHECK_SECONDS:
+            return cached[0]
+
+        try:
+            stat = os.stat(path)
+            signature = (stat.st_mtime_ns, stat.st_size)
+            if cached and cached[1] == signature:
+                _registries[path] = (cached[0], signature, now)
+                return cached[0]
+            registry = load_registry(path)
+        except (OSError, ValueError, sqlite3.Error) as e:
+            if not cached:
+                raise
+            logging.error("Station registry %s not reloaded, keeping %s stations: %s", path, len(cached[0]), e)
+            _registries[path] = (cached[0], cached[1], now)
+            return cached[0]
+
+        logging.info("Loaded %s stations from %s", len(registry), path)
+        _registries[path] = (registry, signature, now)
+        return registry
@@ -0,0 +1,163 @@
+"""
+Station-local time for alert windows
+
+Trigger windows such as "after 5 PM" are station-local wall-clock times, not
+host times (Azure Functions run in UTC). StationClock resolves each
+station's time zone, and once per station per local day computes the epoch
+boundaries of every local hour plus sunrise/sunset, so checking an
+observation against a window is an integer comparison.
+"""
+
+import logging
+import math
+import time
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from config import DEFAULT_TIMEZONE
+
+try:
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+except ImportError:  # Python < 3.9
+    ZoneInfo = None
+    ZoneInfoNotFoundError = KeyError
+
+# Used when the tz database is unavailable (e.g. Windows without tzdata);
+# only zones without daylight saving time can be represented this way
+FIXED_OFFSET_HOURS = {
+    'America/Phoenix': -7,
+    'US/Arizona': -7,
+    'UTC': 0
+}
+
+SUN_ZENITH_DEGREES = 90.833  # sunrise/sunset, including refraction and the solar disc
+
+
+@lru_cache(maxsize=None)
+def get_timezone(name):
+    """tzinfo for an IANA zone name, falling back to a fixed offset"""
+    if ZoneInfo is not None:
+        try:
+            return ZoneInfo(name)
+        except (ZoneInfoNotFoundError, ValueError):
+            pass
+    hours = FIXED_OFFSET_HOURS.get(name)
+    if hours is None:
+        logging.warning("Unknown time zone %s, using UTC", name)
+        return timezone.utc
+    return timezone(timedelta(hours=hours), name)
+
+
+def station_timezone(station):
+    return get_timezone((station or {}).get('tz') or DEFAULT_TIMEZONE)
+
+
+def to_epoch(when, tz):
+    """Epoch seconds of a datetime; naive datetimes are station-local wall-clock times"""
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=tz)
+    return int(when.timestamp())
+
+
+def local_isoformat(epoch, tz):
+    return datetime.fromtimestamp(epoch, tz).isoformat()
+
+
+def observation_epoch(data, tz):
+    """Observation time of a weather record: its provider 'dt', else its timestamp"""
+    observed = data.get('dt')
+    if observed is not None:
+        return int(observed)
+    value = data.get('timestamp')
+    if isinstance(value, datetime):
+        return to_epoch(value, tz)
+    try:
+        return to_epoch(datetime.fromisoformat(str(value)), tz)
+    except ValueError:
+        return int(time.time())
+
+
+def solar_times(lat, lon, day):
+    """(sunrise, sunset) epochs for a date, or (None, None) during polar day/night
+
+    NOAA's approximate solar equations, good to a minute or two.
+    """
+    gamma = 2 * math.pi / 365 * (day.timetuple().tm_yday - 1)
+    eqtime = 229.18 * (0.000075 + 0.001868 * math.cos(gamma) - 0.032077 * math.sin(gamma)
+                       - 0.014615 * math.cos(2 * gamma) - 0.040849 * math.sin(2 * gamma))
+    decl = (0.006918 - 0.399912 * math.cos(gamma) + 0.070257 * math.sin(gamma)
+            - 0.006758 * math.cos(2 * gamma) + 0.000907 * math.sin(2 * gamma)
+            - 0.002697 * math.cos(3 * gamma) + 0.00148 * math.sin(3 * gamma))
+    lat = math.radians(lat)
+    cos_hour_angle = (math.cos(math.radians(SUN_ZENITH_DEGREES)) / (math.cos(lat) * math.cos(decl))
+                      - math.tan(lat) * math.tan(decl))
+    if abs(cos_hour_angle) > 1:
+        return None, None
+
+    hour_angle = math.degrees(math.acos(cos_hour_angle))
+    midnight = datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp()
+    sunrise = midnight + (720 - 4 * (lon + hour_angle) - eqtime) * 60
+    sunset = midnight + (720 - 4 * (lon - hour_angle) - eqtime) * 60
+    return int(sunrise), int(sunset)
+
+
+class DayWindows:
+    """One station-local day: epoch boundaries of each local hour, sunrise and sunset
+
+    hour_starts[h] is the epoch of h:00 local time; hour_starts[24] is the
+    start of the next day.
+    """
+
+    __slots__ = ('date', 'start', 'end', 'hour_starts', 'sunrise', 'sunset')
+
+    def __init__(self, day, tz, lat=None, lon=None):
+        self.date = day
+        starts = [int(datetime(day.year, day.month, day.day, hour, tzinfo=tz).timestamp()) for hour in range(24)]
+        following = day + timedelta(days=1)
+        starts.append(int(datetime(following.year, following.month, following.day, tzinfo=tz).timestamp()))
+        self.hour_starts = tuple(starts)
+        self.start = starts[0]
+        self.end = starts[24]
+        if lat is None or lon is None:
+            self.sunrise = self.sunset = None
+        else:
+            self.sunrise, self.sunset = solar_times(lat, lon, day)
+
+    def after(self, epoch, hour):
+        """epoch is at or after hour:00 local time"""
+        return epoch >= self.hour_starts[hour]
+
+    def between(self, epoch, first_hour, last_hour):
+        """epoch falls within local hours first_hour through last_hour (inclusive)"""
+        return self.hour_starts[first_hour] <= epoch < self.hour_starts[min(last_hour + 1, 24)]
+
+    def is_daylight(self, epoch):
+        if self.sunrise is None:
+            return None
+        return self.sunrise <= epoch < self.sunset
+
+
+class StationClock:
+    """Per-station local days, computed once per station per local day"""
+
+    def __init__(self):
+        self._days = {}  # station name -> DayWindows for its most recent local day
+
+    def observed_at(self, station, data, now=None):
+        """Epoch of an observation, or of `now` when replaying history"""
+        tz = station_timezone(station)
+        if now is not None:
+            return to_epoch(now, tz)
+        return observation_epoch(data, tz)
+
+    def windows(self, station, epoch, name):
+        """DayWindows of the station-local day containing epoch; station may be None"""
+        day = self._days.get(name)
+        if day is not None and day.start <= epoch < day.end:
+            return day
+
+        tz = station_timezone(station)
+        local_date = datetime.fromtimestamp(epoch, tz).date()
+        station = station or {}
+        day = DayWindows(local_date, tz, station.get('lat'), station.get('lon'))
+        self._days[name] = day
+        return day
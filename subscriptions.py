@@ -0,0 +1,155 @@
+"""
+Alert subscribers: who gets which alerts
+
+A subscription names an email address, the cities and alert types it wants
+('*' for all) and a minimum severity. Subscriptions are stored by the
+storage backend (WeatherDatabase or AzureWeatherStorage); SubscriberIndex
+turns them into an inverted index so routing an alert is a few set lookups.
+
+Usage: python main.py subscribers add EMAIL [--cities Phoenix,Tucson] [--types dust_storm_warning] [--min-severity HIGH]
+       python main.py subscribers remove EMAIL
+       python main.py subscribers list [--source sqlite|azure]
+"""
+
+import argparse
+
+SEVERITIES = ('LOW', 'MEDIUM', 'HIGH', 'CRITICAL')
+ALL = '*'
+# Derived alerts ('dust_storm_warning_nearby', 'extreme_heat_day_expected') reach subscribers of the base type
+DERIVED_SUFFIXES = ('_nearby', '_expected')
+
+_EMPTY = frozenset()
+
+
+def _join(values):
+    if values is None or values == ALL:
+        return ALL
+    if isinstance(values, str):
+        values = values.split(',')
+    values = sorted({value.strip() for value in values if value.strip()})
+    return ','.join(values) if values and ALL not in values else ALL
+
+
+def _split(value):
+    """Names from stored text, or None for all"""
+    return None if not value or value == ALL else tuple(value.split(','))
+
+
+def normalize_subscription(email, cities=ALL, alert_types=ALL, min_severity='LOW'):
+    """Validated subscription dict, with cities and alert types as comma-separated text"""
+    email = (email or '').strip().lower()
+    if '@' not in email or any(char in email for char in '/\\#?, '):
+        raise ValueError(f"Invalid email address: {email!r}")
+    min_severity = (min_severity or 'LOW').upper()
+    if min_severity not in SEVERITIES:
+        raise ValueError(f"Unknown severity {min_severity} (expected one of {', '.join(SEVERITIES)})")
+    return {
+        'email': email,
+        'cities': _join(cities),
+        'alert_types': _join(alert_types),
+        'min_severity': min_severity
+    }
+
+
+class SubscriberIndex:
+    """Inverted index from (city, alert type, minimum severity) to recipient addresses
+
+    Wildcard cities and types are indexed under None, so recipients for an
+    alert are the union of at most 2 cities x 3 types x 4 severities sets, no
+    matter how many subscribers there are. Regional '*_nearby' and forecast
+    '*_expected' alerts also reach subscribers of the underlying type.
+    Results are cached per key.
+    """
+
+    def __init__(self, subscriptions):
+        index = {}
+        for subscription in subscriptions:
+            for city in _split(subscription['cities']) or (None,):
+                for alert_type in _split(subscription['alert_types']) or (None,):
+                    key = (city, alert_type, subscription['min_severity'])
+                    index.setdefault(key, set()).add(subscription['email'])
+        self._index = {key: frozenset(emails) for key, emails in index.items()}
+        self._cache = {}
+        self.size = len(subscriptions)
+
+    def recipients(self, city, alert_type, severity):
+        key = (city, alert_type, severity)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached
+
+        if severity not in SEVERITIES:
+            return _EMPTY
+        severities = SEVERITIES[:SEVERITIES.index(severity) + 1]
+        alert_types = [alert_type, None]
+        for suffix in DERIVED_SUFFIXES:
+            if alert_type.endswith(suffix):
+                alert_types.append(alert_type[:-len(suffix)])
+
+        recipients = set()
+        for city_key in (city, None):
+            for type_key in alert_types:
+                for min_severity in severities:
+                    recipients |= self._index.get((city_key, type_key, min_severity), _EMPTY)
+        cached = self._cache[key] = frozenset(recipients)
+        return cached
+
+
+class SubscriberDirectory:
+    """SubscriberIndex over a store's subscriptions, rebuilt only when they change
+
+    The store's get_subscriptions() is served from its query cache, which
+    returns the same list until a subscription write (or the cache TTL), so
+    an unchanged list means an unchanged index.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._subscriptions = None
+        self._index = SubscriberIndex([])
+
+    def index(self):
+        subscriptions = self.store.get_subscriptions()
+        if subscriptions is not self._subscriptions:
+            self._index = SubscriberIndex(subscriptions)
+            self._subscriptions = subscriptions
+        return self._index
+
+    def recipients(self, city, alert_type, severity):
+        return self.index().recipients(city, alert_type, severity)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='main.py subscribers', description='Manage alert subscribers')
+    parser.add_argument('--source', choices=('sqlite', 'azure'), default='sqlite')
+    commands = parser.add_subparsers(dest='command', required=True)
+    add = commands.add_parser('add', help='add or replace a subscription')
+    add.add_argument('email')
+    add.add_argument('--cities', default=ALL, help="comma-separated city names, '*' for all")
+    add.add_argument('--types', default=ALL, help="comma-separated alert types, '*' for all")
+    add.add_argument('--min-severity', default='LOW', choices=SEVERITIES)
+    remove = commands.add_parser('remove', help='remove a subscription')
+    remove.add_argument('email')
+    commands.add_parser('list', help='list subscriptions')
+    args = parser.parse_args(argv)
+
+    if args.source == 'azure':
+        from azure_storage import AzureWeatherStorage
+        store = AzureWeatherStorage()
+    else:
+        from database import WeatherDatabase
+        store = WeatherDatabase()
+
+    if args.command == 'add':
+        subscription = store.add_subscription(args.email, args.cities, args.types, args.min_severity)
+        print(f"Subscribed {subscription['email']}: cities {subscription['cities']}, "
+              f"types {subscription['alert_types']}, {subscription['min_severity']} and above")
+    elif args.command == 'remove':
+        removed = store.remove_subscription(args.email)
+        print(f"Removed {args.email}" if removed else f"No subscription for {args.email}")
+    else:
+        subscriptions = store.get_subscriptions()
+        for subscription in subscriptions:
+            print(f"{subscription['email']:<40} {subscription['min_severity']:<9} "
+                  f"cities={subscription['cities']} types={subscription['alert_types']}")
+        print(f"{len(subscriptions)} subscriptions")
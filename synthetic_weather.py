@@ -0,0 +1,239 @@
+import math
+import random
+from datetime import datetime, timedelta, timezone
+from station_time import StationClock, station_timezone, to_epoch, local_isoformat
+
+# Phoenix monthly normal (high, low) in °F, used as the desert-floor baseline
+MONTHLY_NORMALS = [
+    (67, 46), (71, 49), (77, 54), (85, 60), (95, 69), (104, 78),
+    (106, 84), (105, 83), (100, 77), (89, 65), (76, 53), (66, 45)
+]
+
+# Arizona monsoon season per NWS: June 15 - September 30
+MONSOON_START = (6, 15)
+MONSOON_END = (9, 30)
+
+MONSOON_STORM_CHANCE = 0.25  # per station per monsoon day
+DUST_STORM_CHANCE_MONSOON = 0.06
+DUST_STORM_CHANCE_OTHER = 0.01
+
+# Rough Arizona bounding box
+AZ_LAT = (31.3, 37.0)
+AZ_LON = (-114.8, -109.0)
+
+METERS_PER_MILE = 1609.34
+MM_PER_INCH = 25.4
+KMH_PER_MPH = 1.609344
+
+
+def _celsius(fahrenheit):
+    return round((fahrenheit - 32) * 5 / 9, 2)
+
+
+def make_stations(count, seed=0):
+    """Deterministic stations scattered over Arizona"""
+    rng = random.Random(f"stations:{seed}")
+    return [
+        {"name": f"Station {i:05d}", "lat": round(rng.uniform(*AZ_LAT), 4), "lon": round(rng.uniform(*AZ_LON), 4)}
+        for i in range(count)
+    ]
+
+
+def is_monsoon(when):
+    return MONSOON_START <= (when.month, when.day) <= MONSOON_END
+
+
+class SyntheticWeatherGenerator:
+    """Seeded Arizona weather: diurnal cycle, monsoon storms and dust storms
+
+    The same (seed, station, time) always produces the same observation, so
+    runs are reproducible regardless of call order.
+    """
+
+    def __init__(self, seed=0):
+        self.seed = seed
+        self._day_cache = {}
+        self._clock = StationClock()
+
+    def _station_offset(self, station):
+        """Climate offset in °F: higher/northern stations run cooler"""
+        rng = random.Random(f"{self.seed}:offset:{station['name']}")
+        lat = station['lat']
+        return -abs(lat - 33.45) * 4 - max(0.0, lat - 34.2) * 12 + rng.uniform(-3, 3)
+
+    def _day_events(self, station, day):
+        """Storm/dust events for a station on a given day, cached per day"""
+        key = (station['name'], day)
+        events = self._day_cache.get(key)
+        if events is not None:
+            return events
+
+        if len(self._day_cache) > 100000:
+            self._day_cache.clear()
+
+        rng = random.Random(f"{self.seed}:day:{station['name']}:{day.isoformat()}")
+        monsoon = is_monsoon(day)
+        events = {'offset': self._station_offset(station), 'day_noise': rng.gauss(0, 2.5)}
+
+        if monsoon and rng.random() < MONSOON_STORM_CHANCE:
+            start = rng.uniform(14, 21)
+            events['storm'] = (start, start + rng.uniform(0.75, 2.0),
+                               rng.uniform(0.2, 1.5), rng.uniform(20, 45))
+
+        dust_chance = DUST_STORM_CHANCE_MONSOON if monsoon else DUST_STORM_CHANCE_OTHER
+        if rng.random() < dust_chance:
+            start = rng.uniform(15, 20)
+            events['dust'] = (start, start + rng.uniform(0.5, 1.5),
+                              rng.uniform(0.1, 2.0), rng.uniform(30, 55))
+
+        self._day_cache[key] = events
+        return events
+
+    def observation(self, station, when):
+        """Weather record for a station at a time, in WeatherAPI's schema
+
+        A naive `when` is station-local wall-clock time.
+        """
+        tz = station_timezone(station)
+        observed = to_epoch(when, tz)
+        if when.tzinfo is not None:
+            when = datetime.fromtimestamp(observed, tz).replace(tzinfo=None)
+        events = self._day_events(station, when.date())
+        rng = random.Random(f"{self.seed}:obs:{station['name']}:{when.isoformat()}")
+        hour = when.hour + when.minute / 60.0
+        monsoon = is_monsoon(when)
+
+        high, low = MONTHLY_NORMALS[when.month - 1]
+        high += events['offset'] + events['day_noise']
+        low += events['offset'] + events['day_noise']
+        # Diurnal cycle: minimum near 4 AM, peak near 4 PM
+        diurnal = 0.5 * (1 + math.cos(2 * math.pi * (hour - 16) / 24))
+        temperature = low + (high - low) * diurnal + rng.gauss(0, 0.8)
+
+        humidity = (38 if monsoon else 18) - 12 * diurnal + rng.gauss(0, 3)
+        wind_speed = max(0.0, 4 + 6 * diurnal + rng.gauss(0, 2))
+        visibility = 10.0
+        rain_1h = 0.0
+        weather_main, description = ('Clear', 'clear sky')
+        if monsoon and diurnal > 0.6 and rng.random() < 0.3:
+            weather_main, description = ('Clouds', 'scattered clouds')
+
+        storm = events.get('storm')
+        if storm and storm[0] <= hour < storm[1]:
+            rain_1h = storm[2] * rng.uniform(0.7, 1.2)
+            wind_speed = storm[3] * rng.uniform(0.8, 1.1)
+            temperature -= 15
+            humidity += 30
+            visibility = rng.uniform(2, 6)
+            weather_main, description = ('Thunderstorm', 'thunderstorm with heavy rain')
+
+        dust = events.get('dust')
+        if dust and dust[0] <= hour < dust[1]:
+            wind_speed = max(wind_speed, dust[3] * rng.uniform(0.85, 1.1))
+            visibility = dust[2] * rng.uniform(0.8, 1.2)
+            weather_main, description = ('Dust', 'dust')
+
+        humidity = int(min(100, max(3, humidity)))
+        day = self._clock.windows(station, observed, station['name'])
+
+        return {
+            'city': station['name'],
+            'temperature': round(temperature, 1),
+            'feels_like': round(temperature + max(0, humidity - 20) * 0.15, 1),
+            'humidity': humidity,
+            'pressure': round(1012 - 6 * diurnal + rng.gauss(0, 1.5), 1),
+            'wind_speed': round(wind_speed, 1),
+            'wind_direction': rng.randint(0, 359),
+            'visibility': round(min(visibility, 10.0), 2),
+            'weather_main': weather_main,
+            'weather_description': description,
+            'rain_1h': round(rain_1h, 3),
+            'timestamp': local_isoformat(observed, tz),
+            'dt': observed,
+            'sunrise': local_isoformat(day.sunrise, tz),
+            'sunset': local_isoformat(day.sunset, tz)
+        }
+
+    def owm_payload(self, station, when):
+        """The same observation as an OpenWeatherMap /data/2.5/weather response (imperial units)"""
+        obs = self.observation(station, when)
+        payload = {
+            'coord': {'lat': station['lat'], 'lon': station['lon']},
+            'weather': [{'main': obs['weather_main'], 'description': obs['weather_description']}],
+            'main': {
+                'temp': obs['temperature'],
+                'feels_like': obs['feels_like'],
+                'humidity': obs['humidity'],
+                'pressure': obs['pressure']
+            },
+            'visibility': int(min(10000, obs['visibility'] * METERS_PER_MILE)),
+            'wind': {'speed': obs['wind_speed'], 'deg': obs['wind_direction']},
+            'dt': obs['dt'],
+            'sys': {
+                'sunrise': int(datetime.fromisoformat(obs['sunrise']).timestamp()),
+                'sunset': int(datetime.fromisoformat(obs['sunset']).timestamp())
+            },
+            'name': station['name'],
+            'cod': 200
+        }
+        if obs['rain_1h']:
+            payload['rain'] = {'1h': round(obs['rain_1h'] * MM_PER_INCH, 2)}
+        return payload
+
+    def owm_forecast_payload(self, station, when, steps=40, step_hours=3):
+        """Observations at the coming forecast steps as an OpenWeatherMap /data/2.5/forecast response"""
+        tz = station_timezone(station)
+        step = step_hours * 3600
+        issued = to_epoch(when, tz) // step * step
+        entries = []
+        for k in range(1, steps + 1):
+            obs = self.observation(station, datetime.fromtimestamp(issued + k * step, tz))
+            entry = {
+                'dt': obs['dt'],
+                'main': {
+                    'temp': obs['temperature'],
+                    'feels_like': obs['feels_like'],
+                    'humidity': obs['humidity'],
+                    'pressure': obs['pressure']
+                },
+                'weather': [{'main': obs['weather_main'], 'description': obs['weather_description']}],
+                'wind': {'speed': obs['wind_speed'], 'deg': obs['wind_direction']},
+                'visibility': int(min(10000, obs['visibility'] * METERS_PER_MILE)),
+                'dt_txt': datetime.fromtimestamp(obs['dt'], timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+            }
+            if obs['rain_1h']:
+                entry['rain'] = {'3h': round(obs['rain_1h'] * step_hours * MM_PER_INCH, 2)}
+            entries.append(entry)
+        return {
+            'cod': '200',
+            'cnt': len(entries),
+            'list': entries,
+            'city': {'name': station['name'], 'coord': {'lat': station['lat'], 'lon': station['lon']}}
+        }
+
+    def nws_observation(self, station, when):
+        """The same observation as an api.weather.gov /stations/{id}/observations/latest response (SI units)"""
+        obs = self.observation(station, when)
+        return {
+            'type': 'Feature',
+            'properties': {
+                'timestamp': datetime.fromtimestamp(obs['dt'], timezone.utc).isoformat(),
+                'textDescription': obs['weather_description'].capitalize(),
+                'temperature': {'unitCode': 'wmoUnit:degC', 'value': _celsius(obs['temperature'])},
+                'heatIndex': {'unitCode': 'wmoUnit:degC', 'value': _celsius(obs['feels_like'])},
+                'windChill': {'unitCode': 'wmoUnit:degC', 'value': None},
+                'relativeHumidity': {'unitCode': 'wmoUnit:percent', 'value': obs['humidity']},
+                'barometricPressure': {'unitCode': 'wmoUnit:Pa', 'value': round(obs['pressure'] * 100)},
+                'windSpeed': {'unitCode': 'wmoUnit:km_h-1', 'value': round(obs['wind_speed'] * KMH_PER_MPH, 2)},
+                'windDirection': {'unitCode': 'wmoUnit:degree_(angle)', 'value': obs['wind_direction']},
+                'visibility': {'unitCode': 'wmoUnit:m', 'value': round(obs['visibility'] * METERS_PER_MILE)},
+                'precipitationLastHour': {'unitCode': 'wmoUnit:mm', 'value': round(obs['rain_1h'] * MM_PER_INCH, 2)}
+            }
+        }
+
+    def generate(self, stations, ticks, start, interval=timedelta(minutes=10)):
+        """Yield (time, [observations]) for T ticks over N stations"""
+        when = start
+        for _ in range(ticks):
+            yield when, [self.observation(station, when) for station in stations]
+            when += interval
@@ -0,0 +1,204 @@
+import logging
+from collections import deque
+from datetime import datetime
+from config import TREND_MAX_SAMPLES
+
+
+def observation_time(weather_data):
+    """Observation time of a weather record as epoch seconds"""
+    if weather_data.get('dt') is not None:
+        return float(weather_data['dt'])
+    value = weather_data.get('timestamp')
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, datetime):
+        return value.timestamp()
+    try:
+        return datetime.fromisoformat(str(value)).timestamp()
+    except ValueError:
+        return datetime.now().timestamp()
+
+
+class SlidingWindow:
+    """Time-based ring buffer with O(1) rolling mean, min, max and slope"""
+
+    def __init__(self, window_seconds, max_samples=TREND_MAX_SAMPLES):
+        self.window_seconds = window_seconds
+        self.max_samples = max_samples
+        self._samples = deque()
+        self._min = deque()  # increasing values: front is the window min
+        self._max = deque()  # decreasing values: front is the window max
+        self._reset_sums()
+
+    def _reset_sums(self):
+        self._origin = None
+        self._evicted = 0  # samples removed since the sums were last rebuilt
+        self._sum_x = 0.0
+        self._sum_y = 0.0
+        self._sum_xx = 0.0
+        self._sum_xy = 0.0
+
+    def _rebuild_sums(self):
+        """Recompute the sums from the samples, re-based on the oldest
+
+        Keeps x small as uptime grows and drops the rounding error that
+        repeated subtraction accumulates. Rebuilding once per window's
+        worth of evictions keeps add amortized O(1).
+        """
+        self._origin = self._samples[0][0]
+        self._evicted = 0
+        self._sum_x = self._sum_y = self._sum_xx = self._sum_xy = 0.0
+        for t, value in self._samples:
+            x = (t - self._origin) / 60.0
+            self._sum_x += x
+            self._sum_y += value
+            self._sum_xx += x * x
+            self._sum_xy += x * value
+
+    def __len__(self):
+        return len(self._samples)
+
+    def add(self, t, value):
+        """Add a sample at time t (seconds); older samples fall out of the window"""
+        if value is None:
+            return
+        if self._samples and t <= self._samples[-1][0]:
+            # Out-of-order or duplicate observation
+            return
+
+        if self._origin is None:
+            self._origin = t
+        x = (t - self._origin) / 60.0  # minutes keep the sums well-conditioned
+
+        self._samples.append((t, value))
+        self._sum_x += x
+        self._sum_y += value
+        self._sum_xx += x * x
+        self._sum_xy += x * value
+
+        while self._min and self._min[-1][1] >= value:
+            self._min.pop()
+        self._min.append((t, value))
+        while self._max and self._max[-1][1] <= value:
+            self._max.pop()
+        self._max.append((t, value))
+
+        self._evict(t - self.window_seconds)
+        while len(self._samples) > self.max_samples:
+            self._pop_oldest()
+
+    def _evict(self, cutoff):
+        while self._samples and self._samples[0][0] < cutoff:
+            self._pop_oldest()
+
+    def _pop_oldest(self):
+        t, value = self._samples.popleft()
+        if not self._samples:
+            self._min.clear()
+            self._max.clear()
+            self._reset_sums()
+            return
+
+        x = (t - self._origin) / 60.0
+        self._sum_x -= x
+        self._sum_y -= value
+        self._sum_xx -= x * x
+        self._sum_xy -= x * value
+
+        if self._min and self._min[0][0] <= t:
+            self._min.popleft()
+        if self._max and self._max[0][0] <= t:
+            self._max.popleft()
+
+        self._evicted += 1
+        if self._evicted >= len(self._samples):
+            self._rebuild_sums()
+
+    @property
+    def latest(self):
+        return self._samples[-1][1] if self._samples else None
+
+    @property
+    def span_seconds(self):
+        return self._samples[-1][0] - self._samples[0][0] if self._samples else 0
+
+    @property
+    def mean(self):
+        return self._sum_y / len(self._samples) if self._samples else None
+
+    @property
+    def min(self):
+        return self._min[0][1] if self._min else None
+
+    @property
+    def max(self):
+        return self._max[0][1] if self._max else None
+
+    @property
+    def slope(self):
+        """Least-squares slope in units per minute"""
+        n = len(self._samples)
+        if n < 2:
+            return None
+        denominator = n * self._sum_xx - self._sum_x ** 2
+        if abs(denominator) < 1e-12:
+            return None
+        return (n * self._sum_xy - self._sum_x * self._sum_y) / denominator
+
+    @property
+    def rise(self):
+        """Latest value minus the window minimum"""
+        return self.latest - self.min if self._samples else None
+
+    @property
+    def drop(self):
+        """Window maximum minus the latest value"""
+        return self.max - self.latest if self._samples else None
+
+
+class TrendStore:
+    """Per-city sliding windows for each (field, window length) the triggers need"""
+
+    def __init__(self, specs):
+        self.specs = sorted(set(specs))
+        self._windows = {}
+
+    def _city_windows(self, city):
+        windows = self._windows.get(city)
+        if windows is None:
+            windows = {spec: SlidingWindow(spec[1]) for spec in self.specs}
+            self._windows[city] = windows
+        return windows
+
+    def add_observation(self, weather_data):
+        """Feed one observation into the city's windows"""
+        t = observation_time(weather_data)
+        for (field, _), window in self._city_windows(weather_data['city']).items():
+            window.add(t, weather_data.get(field))
+
+    def update(self, weather_data_list):
+        for data in weather_data_list:
+            self.add_observation(data)
+
+    def window(self, city, field, window_seconds):
+        """The sliding window for a city/field, or None if not tracked"""
+        windows = self._windows.get(city)
+        return windows.get((field, window_seconds)) if windows else None
+
+    def preload(self, storage):
+        """Warm the windows from stored history on cold start"""
+        if not self.specs:
+            return 0
+        minutes = max(window_seconds for _, window_seconds in self.specs) / 60.0
+        try:
+            rows = storage.get_trend_history(minutes)
+        except Exception as e:
+            logging.error("Error preloading trend windows: %s", e)
+            return 0
+
+        count = 0
+        for row in rows:
+            self.add_observation(row)
+            count += 1
+        logging.info("Preloaded %s observations into trend windows", count)
+        return count
@@ -1,110 +1,215 @@
-import requests
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from datetime import datetime
-from config import WEATHER_API_KEY, WEATHER_API_URL, CITIES
+from config import (
+    WEATHER_API_KEY, WEATHER_API_URL, WEATHER_API_TIMEOUT, WEATHER_FETCH_BATCH_SIZE, WEATHER_PROVIDERS,
+    MOCK_WEATHER_ENABLED, MOCK_WEATHER_SEED, STALE_MAX_AGE_SECONDS,
+    WEATHER_HEDGE_ENABLED, HEDGE_PERCENTILE, HEDGE_MIN_SAMPLES, HEDGE_DEFAULT_DELAY, HEDGE_MIN_DELAY,
+    HEDGE_MAX_WORKERS
+)
+from synthetic_weather import SyntheticWeatherGenerator
+from station_index import get_station_index
+from station_time import station_timezone
+from ingestion import ObservationFilter
+from weather_providers import ProviderError, build_providers
+
+
+def split_stale(weather_data):
+    """(fresh, stale) observations; stale ones are re-served last-known-good readings"""
+    fresh = [data for data in weather_data if not data.get('stale')]
+    stale = [data for data in weather_data if data.get('stale')]
+    return fresh, stale
+
 
 class WeatherAPI:
-    def __init__(self):
-        self.api_key = WEATHER_API_KEY
-        self.base_url = WEATHER_API_URL
-        
+    def __init__(self, api_key=WEATHER_API_KEY, base_url=WEATHER_API_URL, timeout=WEATHER_API_TIMEOUT,
+                 station_index=None, mock_enabled=MOCK_WEATHER_ENABLED, stale_max_age=STALE_MAX_AGE_SECONDS,
+                 providers=None, hedge=WEATHER_HEDGE_ENABLED):
+        self._station_index = station_index
+        self.timeout = timeout
+        self.providers = providers if providers is not None else build_providers(
+            WEATHER_PROVIDERS, api_key=api_key, base_url=base_url, timeout=timeout)
+        self.hedge = hedge
+        self._executor = None
+        self.mock_enabled = mock_enabled
+        self.mock_generator = SyntheticWeatherGenerator(seed=MOCK_WEATHER_SEED)
+        self.stale_max_age = stale_max_age
+        self.last_known_good = {}  # city -> (monotonic time fetched, weather info)
+        self.counters = {'fetched': 0, 'stale_served': 0, 'mock_served': 0, 'unavailable': 0,
+                         'hedged': 0, 'hedge_wins': 0}
+        self._counters_lock = threading.Lock()  # fetches run on several worker threads
+        # Kept with the client, so repeats are recognized across warm invocations
+        self.ingestion = ObservationFilter()
+
+    def _count(self, counter):
+        with self._counters_lock:
+            self.counters[counter] += 1
+
+    @property
+    def station_index(self):
+        """The injected index, else the shared one (which follows registry reloads)"""
+        return self._station_index if self._station_index is not None else get_station_index()
+
     def get_weather_data(self, city_info):
-        """Fetch weather data for a specific city"""
-        try:
-            # Check if API key is valid
-            if not self.api_key or self.api_key == "your_new_api_key_here":
-                logging.error(f"Invalid API key for {city_info['name']}. Please set OPENWEATHER_API_KEY in .env file")
+        """Fetch weather data for a specific city
+        
+        Providers are tried in priority order (hedged when enabled). When all
+        fail or their circuit breakers are open, returns the city's
+        last-known-good reading marked 'stale', mock data if enabled, or None.
+        """
+        providers = [provider for provider in self.providers if provider.configured]
+        if not providers:
+            if self.mock_enabled:
                 return self._create_mock_data(city_info)
-            
-            params = {
-                'lat': city_info['lat'],
-                'lon': city_info['lon'],
-                'appid': self.api_key,
-                'units': 'imperial'  # Fahrenheit
-            }
-            
-            response = requests.get(self.base_url, params=params)
-            response.raise_for_status()
-            
-            data = response.json()
-            
-            # Extract relevant weather information
-            weather_info = {
-                'city': city_info['name'],
-                'temperature': data['main']['temp'],
-                'feels_like': data['main']['feels_like'],
-                'humidity': data['main']['humidity'],
-                'pressure': data['main']['pressure'],
-                'wind_speed': data['wind']['speed'],
-                'wind_direction': data['wind'].get('deg', 0),
-                'visibility': data.get('visibility', 10000) / 1609.34,  # Convert to miles
-                'weather_main': data['weather'][0]['main'],
-                'weather_description': data['weather'][0]['description'],
-                'timestamp': datetime.now().isoformat(),
-                'sunrise': datetime.fromtimestamp(data['sys']['sunrise']).isoformat(),
-                'sunset': datetime.fromtimestamp(data['sys']['sunset']).isoformat()
-            }
-            
-            # Add rain data if available
-            if 'rain' in data:
-                weather_info['rain_1h'] = data['rain'].get('1h', 0) * 0.0393701  # Convert mm to inches
+            logging.error("No weather provider configured for %s. Please set OPENWEATHER_API_KEY in .env file",
+                          city_info['name'])
+            self._count('unavailable')
+            return None
+        
+        try:
+            if self.hedge and len(providers) > 1:
+                weather_info = self._fetch_hedged(city_info, providers)
             else:
-                weather_info['rain_1h'] = 0
-                
-            return weather_info
-            
-        except requests.exceptions.RequestException as e:
-            logging.error(f"Error fetching weather data for {city_info['name']}: {e}")
-            return self._create_mock_data(city_info)
-        except KeyError as e:
-            logging.error(f"Error parsing weather data for {city_info['name']}: {e}")
-            return self._create_mock_data(city_info)
+                weather_info = self._fetch_in_order(city_info, providers)
+        except ProviderError as e:
+            return self._fallback(city_info, str(e))
+        
+        self.last_known_good[city_info['name']] = (time.monotonic(), weather_info)
+        self._count('fetched')
+        return weather_info
     
-    def _create_mock_data(self, city_info):
-        """Create mock weather data for testing when API is unavailable"""
-        import random
+    @staticmethod
+    def _fetch_in_order(city_info, providers):
+        errors = []
+        for provider in providers:
+            try:
+                return provider.fetch(city_info)
+            except ProviderError as e:
+                errors.append(str(e))
+        raise ProviderError('; '.join(errors))
+    
+    def hedge_delay(self, provider):
+        """Seconds to wait for a provider before hedging: its recent p95 latency"""
+        if len(provider.latency) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY
+        return min(self.timeout, max(HEDGE_MIN_DELAY, provider.latency.percentile(HEDGE_PERCENTILE)))
+    
+    def _fetch_hedged(self, city_info, providers):
+        """Ask the primary; if it is slower than its hedge delay, ask the next provider too
         
-        # Arizona-like weather conditions for testing
-        base_temps = {"Phoenix": 105, "Tucson": 102, "Scottsdale": 106, "Mesa": 104}
-        base_temp = base_temps.get(city_info['name'], 100)
+        The first successful answer wins. A provider that fails is replaced by
+        the next one right away. The losing request is not cancelled: it
+        finishes in the background and still feeds its provider's latency window.
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=HEDGE_MAX_WORKERS, thread_name_prefix='weather-fetch')
         
-        # Create conditions that might trigger alerts for testing
-        current_hour = datetime.now().hour
-        temp = base_temp + random.randint(-5, 10)
-        wind = random.randint(5, 25)
+        remaining = iter(providers)
+        primary = next(remaining)
+        launched = {self._executor.submit(primary.fetch, city_info): primary}
+        pending = set(launched)
+        delay = self.hedge_delay(primary)
+        hedged = False
+        errors = []
         
-        # If it's after 5 PM, make temperature high enough to trigger alert
-        if current_hour >= 17 and city_info['name'] == 'Phoenix':
-            temp = 105  # Above 101°F threshold
-            wind = 15   # Above 10 mph threshold
+        while pending:
+            done, pending = wait(pending, timeout=None if hedged else delay, return_when=FIRST_COMPLETED)
+            if not done:
+                # The primary is slow: hedge with the next provider
+                hedged = True
+                provider = next(remaining, None)
+                if provider is not None:
+                    self._count('hedged')
+                    future = self._executor.submit(provider.fetch, city_info)
+                    launched[future] = provider
+                    pending.add(future)
+                continue
+            
+            for future in done:
+                try:
+                    weather_info = future.result()
+                except ProviderError as e:
+                    errors.append(str(e))
+                    continue
+                if launched[future] is not primary:
+                    self._count('hedge_wins')
+                return weather_info
+            
+            if not pending:
+                # Everything in flight failed: fall over to the next provider
+                provider = next(remaining, None)
+                if provider is not None:
+                    future = self._executor.submit(provider.fetch, city_info)
+                    launched[future] = provider
+                    pending.add(future)
         
-        mock_data = {
-            'city': city_info['name'],
-            'temperature': temp,
-            'feels_like': temp + random.randint(0, 15),
-            'humidity': random.randint(10, 30),  # Low humidity for Arizona
-            'pressure': random.randint(1010, 1020),
-            'wind_speed': wind,
-            'wind_direction': random.randint(0, 360),
-            'visibility': random.randint(8, 10),
-            'weather_main': random.choice(['Clear', 'Clouds', 'Dust']),
-            'weather_description': random.choice(['clear sky', 'few clouds', 'dust']),
-            'rain_1h': 0,  # Rarely rains in Arizona
-            'timestamp': datetime.now().isoformat(),
-            'sunrise': datetime.now().replace(hour=6, minute=0).isoformat(),
-            'sunset': datetime.now().replace(hour=19, minute=30).isoformat()
-        }
+        raise ProviderError('; '.join(errors))
+    
+    def _fallback(self, city_info, reason):
+        """Last-known-good reading marked stale, else mock data if enabled, else None"""
+        cached = self.last_known_good.get(city_info['name'])
+        if cached is not None:
+            age = time.monotonic() - cached[0]
+            if age <= self.stale_max_age:
+                self._count('stale_served')
+                logging.warning("Serving stale weather for %s (%s, %.0fs old)", city_info['name'], reason, age)
+                return {**cached[1], 'stale': True, 'stale_seconds': round(age)}
+        
+        if self.mock_enabled:
+            return self._create_mock_data(city_info)
+        
+        self._count('unavailable')
+        logging.warning("No weather for %s (%s)", city_info['name'], reason)
+        return None
+    
+    def _create_mock_data(self, city_info):
+        """Create seeded synthetic weather data (MOCK_WEATHER=true only)"""
+        when = datetime.now(station_timezone(city_info)).replace(second=0, microsecond=0)
+        mock_data = self.mock_generator.observation(city_info, when)
+        mock_data['mock'] = True
+        self._count('mock_served')
         
-        logging.info(f"Using mock data for {city_info['name']}: {mock_data['temperature']:.1f}°F")
+        logging.info("Using mock data for %s: %.1f°F", city_info['name'], mock_data['temperature'])
         return mock_data
     
-    def get_all_cities_weather(self):
-        """Fetch weather data for all configured cities"""
+    def metrics(self):
+        """Fetch counters, circuit breaker state and provider latencies, for health/metrics endpoints"""
+        providers = {}
+        for provider in self.providers:
+            providers[provider.name] = {**provider.metrics(), 'configured': provider.configured,
+                                        'hedge_delay_ms': self.hedge_delay(provider) * 1000}
+        with self._counters_lock:
+            counters = dict(self.counters)
+        return {
+            **counters,
+            'hedge': self.hedge,
+            'providers': providers,
+            'breakers': {provider.name: provider.breaker.metrics() for provider in self.providers},
+            'ingestion': self.ingestion.metrics()
+        }
+    
+    def get_batch_weather(self, stations):
+        """Fetch weather data for a batch of nearby stations, one at a time
+
+        Requests reuse each provider's requests.Session, so a batch shares
+        its keep-alive connections.
+        """
         weather_data = []
         
-        for city in CITIES:
+        for city in stations:
             data = self.get_weather_data(city)
             if data:
                 weather_data.append(data)
                 
         return weather_data
+    
+    def get_all_cities_weather(self):
+        """Fetch weather data for all configured cities in spatial batches"""
+        weather_data = []
+        
+        for batch in self.station_index.batches(WEATHER_FETCH_BATCH_SIZE):
+            weather_data.extend(self.get_batch_weather(batch))
+                
+        return weather_data
@@ -0,0 +1,329 @@
+"""
+Weather providers: one adapter per upstream API
+
+Each adapter fetches a station's current conditions and normalizes them into
+WeatherAPI's observation schema (imperial units, station-local timestamps),
+with its own circuit breaker and latency window.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime
+import requests
+from config import (
+    WEATHER_API_KEY, WEATHER_API_URL, WEATHER_FORECAST_URL, WEATHER_API_TIMEOUT, NWS_API_URL, NWS_USER_AGENT,
+    PROVIDER_LATENCY_WINDOW
+)
+from circuit_breaker import CircuitBreaker
+from station_time import StationClock, station_timezone, local_isoformat
+
+METERS_PER_MILE = 1609.34
+INCHES_PER_MM = 0.0393701
+MPH_PER_KMH = 0.621371
+
+
+class ProviderError(Exception):
+    """A provider could not return an observation (failure, bad response or open breaker)"""
+
+
+class LatencyTracker:
+    """Recent successful response times of one provider, for percentiles"""
+
+    def __init__(self, window=PROVIDER_LATENCY_WINDOW):
+        self._samples = deque(maxlen=window)
+        self._sorted = None
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+            self._sorted = None
+
+    def __len__(self):
+        return len(self._samples)
+
+    def percentile(self, p):
+        """p-th percentile in seconds (nearest rank), None without samples"""
+        with self._lock:
+            if not self._samples:
+                return None
+            if self._sorted is None:
+                self._sorted = sorted(self._samples)
+            index = min(len(self._sorted) - 1, max(0, int(round(p / 100.0 * len(self._sorted))) - 1))
+            return self._sorted[index]
+
+
+class WeatherProvider:
+    """Base adapter: breaker and latency bookkeeping around _fetch()"""
+
+    name = None
+
+    def __init__(self, timeout=WEATHER_API_TIMEOUT, session=None):
+        self.timeout = timeout
+        self.session = session or requests.Session()
+        self.breaker = CircuitBreaker(self.name)
+        self.latency = LatencyTracker()
+
+    @property
+    def configured(self):
+        return True
+
+    def fetch(self, city_info):
+        """Normalized observation for a station; raises ProviderError"""
+        weather_info = self._call(self._fetch, city_info, track_latency=True)
+        weather_info['provider'] = self.name
+        return weather_info
+
+    def fetch_forecast(self, city_info):
+        """Normalized forecast entries for a station, oldest first; raises ProviderError"""
+        return self._call(self._fetch_forecast, city_info, track_latency=False)
+
+    @property
+    def supports_forecast(self):
+        return type(self)._fetch_forecast is not WeatherProvider._fetch_forecast
+
+    def _call(self, fetch, city_info, track_latency):
+        if not self.breaker.allow():
+            raise ProviderError(f"{self.name}: circuit open")
+
+        started = time.perf_counter()
+        try:
+            result = fetch(city_info)
+        except (requests.exceptions.RequestException, KeyError, IndexError, TypeError, ValueError) as e:
+            # A malformed response is an upstream failure too
+            self.breaker.record_failure(e, time.perf_counter() - started)
+            logging.error("Error fetching weather data for %s from %s: %s", city_info['name'], self.name, e)
+            raise ProviderError(f"{self.name}: {e}") from e
+        except Exception as e:
+            # Any other error still ends a half-open probe, or the breaker never probes again
+            self.breaker.record_failure(e, time.perf_counter() - started)
+            raise
+
+        elapsed = time.perf_counter() - started
+        self.breaker.record_success(elapsed)
+        if track_latency:
+            # Forecasts are larger responses; they would skew the hedging percentile
+            self.latency.add(elapsed)
+        return result
+
+    def _fetch(self, city_info):
+        raise NotImplementedError
+
+    def _fetch_forecast(self, city_info):
+        raise NotImplementedError
+
+    def metrics(self):
+        p50 = self.latency.percentile(50)
+        p95 = self.latency.percentile(95)
+        return {
+            'samples': len(self.latency),
+            'p50_ms': p50 * 1000 if p50 is not None else None,
+            'p95_ms': p95 * 1000 if p95 is not None else None
+        }
+
+
+class OpenWeatherMapProvider(WeatherProvider):
+    """OpenWeatherMap /data/2.5/weather (current conditions, imperial units)"""
+
+    name = 'openweathermap'
+
+    def __init__(self, api_key=WEATHER_API_KEY, base_url=WEATHER_API_URL, timeout=WEATHER_API_TIMEOUT,
+                 session=None, forecast_url=None):
+        super().__init__(timeout, session)
+        self.api_key = api_key
+        self.base_url = base_url
+        # /data/2.5/forecast next to /data/2.5/weather
+        self.forecast_url = forecast_url or WEATHER_FORECAST_URL or base_url.rsplit('/', 1)[0] + '/forecast'
+
+    @property
+    def configured(self):
+        return bool(self.api_key) and self.api_key != "your_new_api_key_here"
+
+    def _params(self, city_info):
+        params = {
+            'appid': self.api_key,
+            'units': 'imperial'  # Fahrenheit
+        }
+        # Registry stations may carry OpenWeatherMap's city ID
+        provider_id = city_info.get('provider_id')
+        if provider_id:
+            params['id'] = provider_id
+        else:
+            params['lat'] = city_info['lat']
+            params['lon'] = city_info['lon']
+        return params
+
+    def _fetch(self, city_info):
+        params = self._params(city_info)
+        response = self.session.get(self.base_url, params=params, timeout=self.timeout)
+        response.raise_for_status()
+
+        data = response.json()
+
+        # Times are the provider's observation time, in the station's time zone
+        tz = station_timezone(city_info)
+        observed = int(data.get('dt') or time.time())
+
+        # Extract relevant weather information
+        weather_info = {
+            'city': city_info['name'],
+            'temperature': data['main']['temp'],
+            'feels_like': data['main']['feels_like'],
+            'humidity': data['main']['humidity'],
+            'pressure': data['main']['pressure'],
+            'wind_speed': data['wind']['speed'],
+            'wind_direction': data['wind'].get('deg', 0),
+            'visibility': data.get('visibility', 10000) / METERS_PER_MILE,  # Convert to miles
+            'weather_main': data['weather'][0]['main'],
+            'weather_description': data['weather'][0]['description'],
+            'timestamp': local_isoformat(observed, tz),
+            'dt': observed,
+            'sunrise': local_isoformat(data['sys']['sunrise'], tz),
+            'sunset': local_isoformat(data['sys']['sunset'], tz)
+        }
+
+        # Add rain data if available
+        if 'rain' in data:
+            weather_info['rain_1h'] = data['rain'].get('1h', 0) * INCHES_PER_MM  # Convert mm to inches
+        else:
+            weather_info['rain_1h'] = 0
+
+        return weather_info
+
+    def _fetch_forecast(self, city_info):
+        """/data/2.5/forecast: 3-hourly steps over 5 days"""
+        response = self.session.get(self.forecast_url, params=self._params(city_info), timeout=self.timeout)
+        response.raise_for_status()
+
+        entries = []
+        for item in response.json()['list']:
+            entries.append({
+                'dt': int(item['dt']),
+                'temperature': item['main']['temp'],
+                'feels_like': item['main']['feels_like'],
+                'humidity': item['main']['humidity'],
+                'pressure': item['main']['pressure'],
+                'wind_speed': item['wind']['speed'],
+                'wind_direction': item['wind'].get('deg', 0),
+                'visibility': item.get('visibility', 10000) / METERS_PER_MILE,
+                'weather_main': item['weather'][0]['main'],
+                'weather_description': item['weather'][0]['description'],
+                # Rain is forecast per 3-hour step
+                'rain_1h': (item.get('rain') or {}).get('3h', 0) * INCHES_PER_MM / 3
+            })
+        return entries
+
+
+# NWS textDescription keywords -> OpenWeatherMap-style weather_main, checked in order
+NWS_WEATHER_MAIN = (
+    ('thunder', 'Thunderstorm'), ('dust', 'Dust'), ('sand', 'Sand'), ('smoke', 'Smoke'),
+    ('haze', 'Haze'), ('fog', 'Fog'), ('mist', 'Mist'), ('drizzle', 'Drizzle'), ('rain', 'Rain'),
+    ('shower', 'Rain'), ('snow', 'Snow'), ('cloud', 'Clouds'), ('overcast', 'Clouds'),
+    ('clear', 'Clear'), ('sunny', 'Clear'), ('fair', 'Clear')
+)
+
+
+def _nws_weather_main(description):
+    text = description.lower()
+    for keyword, weather_main in NWS_WEATHER_MAIN:
+        if keyword in text:
+            return weather_main
+    return 'Clear' if not text else description.split()[0].title()
+
+
+def _nws_value(properties, field, default=None):
+    value = (properties.get(field) or {}).get('value')
+    return default if value is None else value
+
+
+def _fahrenheit(celsius):
+    return celsius * 9 / 5 + 32
+
+
+class NWSProvider(WeatherProvider):
+    """National Weather Service API (api.weather.gov): latest observation at the nearest station
+
+    The nearest observation station is looked up once per location through
+    /points; observations are SI units and are converted to imperial.
+    NWS does not report sunrise/sunset, so those are computed.
+    """
+
+    name = 'nws'
+
+    def __init__(self, base_url=NWS_API_URL, user_agent=NWS_USER_AGENT, timeout=WEATHER_API_TIMEOUT,
+                 session=None):
+        super().__init__(timeout, session)
+        self.base_url = base_url.rstrip('/')
+        self.headers = {'User-Agent': user_agent, 'Accept': 'application/geo+json'}
+        self._observation_urls = {}  # (lat, lon) -> latest-observation URL
+        self._clock = StationClock()
+
+    def _get(self, url):
+        response = self.session.get(url, headers=self.headers, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def _observation_url(self, city_info):
+        key = (round(city_info['lat'], 4), round(city_info['lon'], 4))
+        url = self._observation_urls.get(key)
+        if url is None:
+            point = self._get(f"{self.base_url}/points/{key[0]},{key[1]}")
+            stations = self._get(point['properties']['observationStations'])
+            station_id = stations['features'][0]['properties']['stationIdentifier']
+            url = self._observation_urls[key] = f"{self.base_url}/stations/{station_id}/observations/latest"
+        return url
+
+    def _fetch(self, city_info):
+        properties = self._get(self._observation_url(city_info))['properties']
+
+        temperature = properties['temperature']['value']
+        if temperature is None:
+            raise ValueError("observation has no temperature")
+        temperature = _fahrenheit(temperature)
+        feels_like = _nws_value(properties, 'heatIndex', _nws_value(properties, 'windChill'))
+        description = properties.get('textDescription') or ''
+
+        tz = station_timezone(city_info)
+        observed = int(datetime.fromisoformat(properties['timestamp']).timestamp())
+        day = self._clock.windows(city_info, observed, city_info['name'])
+
+        return {
+            'city': city_info['name'],
+            'temperature': round(temperature, 1),
+            'feels_like': round(_fahrenheit(feels_like), 1) if feels_like is not None else round(temperature, 1),
+            'humidity': round(_nws_value(properties, 'relativeHumidity', 0)),
+            'pressure': _nws_value(properties, 'barometricPressure', 101325) / 100,  # Pa to hPa
+            'wind_speed': _nws_value(properties, 'windSpeed', 0) * MPH_PER_KMH,
+            'wind_direction': _nws_value(properties, 'windDirection', 0),
+            'visibility': _nws_value(properties, 'visibility', 16093) / METERS_PER_MILE,
+            'weather_main': _nws_weather_main(description),
+            'weather_description': description.lower(),
+            'rain_1h': _nws_value(properties, 'precipitationLastHour', 0) * INCHES_PER_MM,
+            'timestamp': local_isoformat(observed, tz),
+            'dt': observed,
+            'sunrise': local_isoformat(day.sunrise, tz) if day.sunrise is not None else None,
+            'sunset': local_isoformat(day.sunset, tz) if day.sunset is not None else None
+        }
+
+
+PROVIDERS = {
+    OpenWeatherMapProvider.name: OpenWeatherMapProvider,
+    NWSProvider.name: NWSProvider
+}
+
+
+def build_providers(names, api_key=WEATHER_API_KEY, base_url=WEATHER_API_URL, timeout=WEATHER_API_TIMEOUT,
+                    nws_url=NWS_API_URL):
+    """Providers in priority order from names such as 'openweathermap,nws'"""
+    providers = []
+    for name in names:
+        name = name.strip().lower()
+        if name == OpenWeatherMapProvider.name:
+            providers.append(OpenWeatherMapProvider(api_key, base_url, timeout))
+        elif name == NWSProvider.name:
+            providers.append(NWSProvider(nws_url, timeout=timeout))
+        elif name:
+            raise ValueError(f"Unknown weather provider: {name} (known: {', '.join(PROVIDERS)})")
+    return providers
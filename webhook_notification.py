@@ -36,17 +36,16 @@ class WebhookNotification:
             )
             
             if response.status_code == 200:
-                logging.info(f"Webhook alert sent for {alert['city']}: {alert['type']}")
+                logging.info("Webhook alert sent for %s: %s", alert['city'], alert['type'])
                 return True
             else:
-                logging.error(f"Webhook failed with status {response.status_code}")
+                logging.error("Webhook failed with status %s", response.status_code)
                 return False
                 
         except Exception as e:
-            logging.error(f"Webhook notification failed: {e}")
+            logging.error("Webhook notification failed: %s", e)
             return False
     
     def send_alerts(self, alerts):
-        """Send multiple alerts"""
-        for alert in alerts:
-            self.send_alert(alert)
+        """Send multiple alerts; returns those sent"""
+        return [alert for alert in alerts if self.send_alert(alert)]